@@ -58,11 +58,8 @@ def _mapper(entry):
     parser = parser_class(doc=path, skip_check=True, timeout=timeout, **parser_args)
     if isinstance(parser, Renderer):
         try:
-            renders = parser.get_renders()
-            if len(renders) == 0:
-                result['renderer'] = dict()
-            else:
-                result['renderer'] = {page: (pil.height, pil.width, dhash(pil, hash_size=16)) for (page, pil) in renders.items()}
+            result['renderer'] = {page: (pil.height, pil.width, dhash(pil, hash_size=16))
+                                  for (page, pil) in parser.iter_renders()}
         except Exception as e:
             result['renderer'] = {0: str(e)}
     if isinstance(parser, Tracer):
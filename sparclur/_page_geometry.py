@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Tuple, Union
+
+import fitz
+
+from sparclur.utils import hash_file
+
+# Number of documents whose page geometry is held in the process wide index
+_INDEX_SIZE = 256
+
+
+class PageGeometry(NamedTuple):
+    """MediaBox, CropBox and rotation of a single page. Boxes are (x0, y0, x1, y1) in PDF points."""
+    mediabox: Tuple[float, float, float, float]
+    cropbox: Tuple[float, float, float, float]
+    rotation: int
+
+    @property
+    def size(self) -> Tuple[float, float]:
+        """Width and height in points of the page as it is rendered, i.e. the CropBox after rotation"""
+        width = self.cropbox[2] - self.cropbox[0]
+        height = self.cropbox[3] - self.cropbox[1]
+        return (height, width) if self.rotation % 180 == 90 else (width, height)
+
+    def pixel_size(self, dpi: int) -> Tuple[int, int]:
+        """
+        The approximate pixel dimensions of a render of the page. Backends round partial pixels differently, so
+        renders may differ from this by a pixel.
+
+        Parameters
+        ----------
+        dpi : int
+            Dots per inch of the render
+
+        Returns
+        -------
+        Tuple[int, int]
+        """
+        width, height = self.size
+        return int(round(width * dpi / 72)), int(round(height * dpi / 72))
+
+    def size_sim(self, other: 'PageGeometry') -> float:
+        """
+        The size similarity that renders of the two pages would have at the same dpi. Matches `size_sim` of the
+        renders without rendering either page.
+
+        Parameters
+        ----------
+        other : PageGeometry
+
+        Returns
+        -------
+        float
+        """
+        w1, h1 = self.size
+        w2, h2 = other.size
+        width_ratio = min(w1 / w2, w2 / w1) if w1 * w2 > 0 else 0
+        height_ratio = min(h1 / h2, h2 / h1) if h1 * h2 > 0 else 0
+        return min(width_ratio, height_ratio)
+
+
+def _read_geometry(doc: Union[str, bytes]) -> Dict[int, PageGeometry]:
+    geometry = dict()
+    try:
+        pdf = fitz.open(stream=doc, filetype='pdf') if isinstance(doc, bytes) else fitz.open(doc)
+    except Exception:
+        return geometry
+    try:
+        for i in range(len(pdf)):
+            try:
+                page = pdf.load_page(i)
+                geometry[i] = PageGeometry(mediabox=tuple(page.mediabox), cropbox=tuple(page.cropbox),
+                                           rotation=page.rotation)
+            except Exception:
+                continue
+    finally:
+        pdf.close()
+    return geometry
+
+
+class _GeometryIndex:
+    """
+    Process wide least-recently-used index of page geometry keyed by the content hash of the document, so the boxes
+    of a document are read once no matter how many renderers work on it.
+    """
+
+    def __init__(self, max_docs: int = _INDEX_SIZE):
+        self._lock = threading.RLock()
+        self._max_docs = max_docs
+        self._index: OrderedDict = OrderedDict()
+
+    def get(self, doc: Union[str, bytes], file_hash: Union[str, None] = None) -> Dict[int, PageGeometry]:
+        key = file_hash or hash_file(doc)
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+                return self._index[key]
+        geometry = _read_geometry(doc)
+        with self._lock:
+            self._index[key] = geometry
+            while len(self._index) > self._max_docs:
+                self._index.popitem(last=False)
+        return geometry
+
+    def clear(self):
+        with self._lock:
+            self._index.clear()
+
+
+_GEOMETRY_INDEX = _GeometryIndex()
+
+
+def page_geometry(doc: Union[str, bytes]) -> Dict[int, PageGeometry]:
+    """
+    Read the MediaBox, CropBox and rotation of every page of a document. Results are kept in a process wide index
+    keyed by the content hash of the document.
+
+    Parameters
+    ----------
+    doc : str or bytes
+        Path to the PDF or the PDF as bytes
+
+    Returns
+    -------
+    Dict[int, PageGeometry]
+        The geometry of each zero-indexed page. Pages that could not be read are left out.
+    """
+    return _GEOMETRY_INDEX.get(doc)
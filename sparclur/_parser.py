@@ -1,8 +1,12 @@
 from __future__ import annotations
 import abc
+import json
+import struct
 from typing import Dict, Any, List, Union
 
+import numpy as np
 from imagehash import ImageHash
+from scipy import sparse
 
 from sparclur._metaclass import Meta
 from sparclur.utils import jac_sim, hash_file
@@ -23,23 +27,149 @@ IMAGE = 'Image Data'
 SPARCLUR_TYPES = [RENDER, TRACER, TEXT, META, FONT, IMAGE]
 
 RENDER_HASH_SIZE = 128
+# Version of the render hashes. Version 1 hashed full renders at the renderer dpi. Version 2 hashes grayscale renders
+# drawn at about twice the hash size from the geometry of each page. Hashes of different versions are not comparable.
+RENDER_HASH_VERSION = 2
+
+
+# Prefix and format version of the binary serialization of a SparclurHash
+_HASH_MAGIC = b'SPRCHASH'
+_HASH_VERSION = 1
+# Byte width of the serialized murmur hashes
+_MURMUR_BYTES = 16
+
+# Number of set bits of every byte value, used to count bits when numpy has no bitwise_count
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _pack_render_hash(render_hash):
+    """
+    Pack a render hash into uint64 words. Accepts the boolean ImageHash of a page or an already packed array.
+    """
+    if isinstance(render_hash, ImageHash):
+        render_hash = render_hash.hash
+    array = np.asarray(render_hash)
+    if array.dtype == np.uint64:
+        return array
+    packed = np.packbits(array.astype(bool).ravel())
+    padding = -len(packed) % 8
+    if padding > 0:
+        packed = np.concatenate([packed, np.zeros(padding, dtype=np.uint8)])
+    return packed.view(np.uint64)
+
+
+def _popcount(words):
+    """Number of set bits along the last axis of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    bytes_view = np.ascontiguousarray(words).view(np.uint8)
+    return _POPCOUNT_TABLE[bytes_view].sum(axis=-1, dtype=np.int64)
 
 
 def _compare_render_hash(left, right):
     pages = set().union(left.keys()).union(right.keys())
-    comparison = dict()
-    for page in pages:
-        left_hash: ImageHash = left.get(page, None)
-        right_hash: ImageHash = right.get(page, None)
-        if left_hash is not None and right_hash is not None:
-            diff = left_hash - right_hash
-            normalized = diff / (RENDER_HASH_SIZE * RENDER_HASH_SIZE)
-            comparison[page] = 1.0 - normalized
-        else:
-            comparison[page] = 0.0
+    comparison = {page: 0.0 for page in pages}
+    left_words = {page: _pack_render_hash(left[page]) for page in pages if left.get(page, None) is not None}
+    right_words = {page: _pack_render_hash(right[page]) for page in pages if right.get(page, None) is not None}
+    # Hashes of different sizes cannot be compared and keep a similarity of 0
+    shared = [page for page in left_words.keys() if page in right_words and
+              left_words[page].shape == right_words[page].shape]
+    if len(shared) == 0:
+        return comparison
+    left_stack = np.stack([left_words[page] for page in shared])
+    right_stack = np.stack([right_words[page] for page in shared])
+    diffs = _popcount(np.bitwise_xor(left_stack, right_stack))
+    for page, diff in zip(shared, diffs):
+        normalized = int(diff) / (RENDER_HASH_SIZE * RENDER_HASH_SIZE)
+        comparison[page] = 1.0 - normalized
     return comparison
 
 
+def _incidence(rows):
+    """Sparse document by value incidence matrix of a list of value collections"""
+    columns = dict()
+    row_ids, column_ids = [], []
+    for i, values in enumerate(rows):
+        for value in values:
+            row_ids.append(i)
+            column_ids.append(columns.setdefault(value, len(columns)))
+    return sparse.csr_matrix((np.ones(len(row_ids), dtype=np.int64), (row_ids, column_ids)),
+                             shape=(len(rows), max(len(columns), 1)))
+
+
+def _jac_sim_matrix(sets):
+    """Pairwise `jac_sim` of a list of sets"""
+    sets = [set(s) for s in sets]
+    incidence = _incidence(sets)
+    intersect = (incidence @ incidence.T).toarray()
+    sizes = np.array([len(s) for s in sets], dtype=np.int64)
+    union = sizes[:, np.newaxis] + sizes[np.newaxis, :] - intersect
+    dist = np.where(union > 0, 1 - intersect / np.maximum(union, 1), 0)
+    return 1.0 - dist
+
+
+def _match_sim_matrix(dicts):
+    """Pairwise share of the keys of two dicts that are mapped to the same value, as in the metadata and font hashes"""
+    names = _incidence([d.keys() for d in dicts])
+    pairs = _incidence([d.items() for d in dicts])
+    matches = (pairs @ pairs.T).toarray()
+    common = (names @ names.T).toarray()
+    sizes = np.array([len(d) for d in dicts], dtype=np.int64)
+    union = sizes[:, np.newaxis] + sizes[np.newaxis, :] - common
+    return np.where(union > 0, matches / np.maximum(union, 1), 0.0)
+
+
+def _text_sim_matrix(texts):
+    """Pairwise minimum over the pages of the shingle similarity, as in `_compare_text_hash`"""
+    n = len(texts)
+    sim = np.full((n, n), np.inf)
+    for page in sorted(set().union(*[t.keys() for t in texts])):
+        has_page = np.array([page in t for t in texts])
+        page_sim = _jac_sim_matrix([t.get(page, set()) for t in texts])
+        compared = has_page[:, np.newaxis] | has_page[np.newaxis, :]
+        sim = np.where(compared, np.minimum(sim, page_sim), sim)
+    sim[np.isinf(sim)] = 0.0
+    return sim
+
+
+def _render_sim_matrix(renders):
+    """Pairwise minimum over the pages of the render hash similarity, as in `_compare_render_hash`"""
+    n = len(renders)
+    sim = np.zeros((n, n))
+    renders = [{page: _pack_render_hash(h) for (page, h) in r.items() if h is not None} for r in renders]
+    pages = sorted(set().union(*[r.keys() for r in renders]))
+    if len(pages) == 0:
+        return sim
+    num_words = max(len(h) for r in renders for h in r.values())
+    words = np.zeros((n, len(pages), num_words), dtype=np.uint64)
+    sizes = np.zeros((n, len(pages)), dtype=np.int64)
+    for i, r in enumerate(renders):
+        for j, page in enumerate(pages):
+            if page in r:
+                words[i, j, :len(r[page])] = r[page]
+                sizes[i, j] = len(r[page])
+    present = sizes > 0
+    for i in range(n):
+        diffs = _popcount(np.bitwise_xor(words[i][np.newaxis], words[i:]))
+        page_sim = 1.0 - diffs / (RENDER_HASH_SIZE * RENDER_HASH_SIZE)
+        # Pages of only one document or with hashes of different sizes score 0, pages of neither are skipped
+        both = present[i][np.newaxis] & present[i:] & (sizes[i][np.newaxis] == sizes[i:])
+        either = present[i][np.newaxis] | present[i:]
+        page_sim = np.where(either, np.where(both, page_sim, 0.0), np.inf).min(axis=1)
+        page_sim[np.isinf(page_sim)] = 0.0
+        sim[i, i:] = page_sim
+        sim[i:, i] = page_sim
+    return sim
+
+
+def _ints_to_bytes(values):
+    return b''.join(int(value).to_bytes(_MURMUR_BYTES, 'little') for value in values)
+
+
+def _ints_from_bytes(data):
+    return [int.from_bytes(data[i:i + _MURMUR_BYTES], 'little') for i in range(0, len(data), _MURMUR_BYTES)]
+
+
 def _compare_tracer_hash(left, right):
     return jac_sim(left, right)
 
@@ -100,6 +230,7 @@ class SparclurHash:
 
         self._doc_hash = hash_file(doc)
         self._hash = dict()
+        self._render_version = RENDER_HASH_VERSION
 
     def __len__(self):
         return len(self._hash)
@@ -127,9 +258,159 @@ class SparclurHash:
     def file_hash(self):
         return self._doc_hash
 
+    @property
+    def render_hash_version(self):
+        """The version of the render hashes, see RENDER_HASH_VERSION"""
+        # Hashes pickled before the version was recorded hold version 1 render hashes
+        return getattr(self, '_render_version', 1)
+
+    @staticmethod
+    def _check_render_versions(hashes: List[SparclurHash]):
+        versions = set(h.render_hash_version for h in hashes if RENDER in h)
+        if len(versions) > 1:
+            raise ValueError('Render hashes of versions %s cannot be compared' %
+                             ', '.join(str(v) for v in sorted(versions)))
+
     def _add_hash(self, key, value):
+        if key == RENDER:
+            value = {page: _pack_render_hash(render_hash) for (page, render_hash) in value.items()}
         self._hash[key] = value
 
+    @staticmethod
+    def compare_many(hashes: List[SparclurHash or Parser]) -> Dict[str, np.ndarray]:
+        """
+        Compares every pair of a collection of hashes at once. Each component is compared with vectorized set and
+        Hamming operations and the results are the same as those of `compare` for each pair.
+
+        Parameters
+        ----------
+        hashes : List[SparclurHash or Parser]
+            The hashes to compare. Parsers are replaced by their SPARCLUR hash.
+
+        Returns
+        -------
+        Dict[str, np.ndarray]
+            n by n similarity matrices keyed like the overall scores of `compare`: one per component present in any of
+            the hashes (e.g. 'Renderer sim'), and 'sim' and 'dist' for the overall similarity and distance. Pairs where
+            neither hash has a component are NaN in that component's matrix.
+        """
+        hashes = [h.sparclur_hash if isinstance(h, Parser) else h for h in hashes]
+        SparclurHash._check_render_versions(hashes)
+        n = len(hashes)
+        components = [(RENDER, _render_sim_matrix, dict()),
+                      (TRACER, _jac_sim_matrix, set()),
+                      (TEXT, _text_sim_matrix, dict()),
+                      (META, _match_sim_matrix, dict()),
+                      (FONT, _match_sim_matrix, dict())]
+        results = dict()
+        total = np.zeros((n, n))
+        num_compares = np.zeros((n, n), dtype=np.int64)
+        for key, sim_matrix, default in components:
+            has_key = np.array([key in h for h in hashes], dtype=bool)
+            if not has_key.any():
+                continue
+            compared = has_key[:, np.newaxis] | has_key[np.newaxis, :]
+            sim = sim_matrix([h.get(key, default) for h in hashes])
+            total = total + np.where(compared, sim, 0.0)
+            num_compares = num_compares + compared
+            results[key + ' sim'] = np.where(compared, sim, np.nan)
+        overall_sim = np.where(num_compares > 0, total / np.maximum(num_compares, 1), np.nan)
+        results['sim'] = overall_sim
+        results['dist'] = 1 - overall_sim
+        return results
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the hash into a compact binary form that can be stored and read back with `from_bytes`. Render hashes
+        are written as their packed bits and the murmur hashes as fixed width integers.
+
+        Returns
+        -------
+        bytes
+        """
+        sections = []
+        blocks = []
+        for key, value in self._hash.items():
+            if key == RENDER:
+                pages = sorted(value.keys())
+                words = [value[page] for page in pages]
+                assert len(set(len(w) for w in words)) <= 1, "Render hashes of one document must be the same size"
+                sections.append({'key': key, 'pages': pages, 'words': len(words[0]) if len(words) > 0 else 0,
+                                 'version': self.render_hash_version})
+                blocks.append(b''.join(w.astype('<u8').tobytes() for w in words))
+            elif key == TRACER:
+                sections.append({'key': key, 'count': len(value)})
+                blocks.append(_ints_to_bytes(sorted(value)))
+            elif key == TEXT:
+                pages = sorted(value.keys())
+                sections.append({'key': key, 'pages': pages, 'counts': [len(value[page]) for page in pages]})
+                blocks.append(b''.join(_ints_to_bytes(sorted(value[page])) for page in pages))
+            elif key in (META, FONT):
+                names = list(value.keys())
+                sections.append({'key': key, 'names': names})
+                blocks.append(_ints_to_bytes(value[name] for name in names))
+            else:
+                raise ValueError('Cannot serialize %s hashes' % key)
+        for section, block in zip(sections, blocks):
+            section['length'] = len(block)
+        header = json.dumps({'file_hash': self._doc_hash, 'exclude': self._exclude, 'sections': sections},
+                            separators=(',', ':')).encode()
+        return _HASH_MAGIC + struct.pack('<BI', _HASH_VERSION, len(header)) + header + b''.join(blocks)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> SparclurHash:
+        """
+        Read a hash that was serialized with `to_bytes`.
+
+        Parameters
+        ----------
+        data : bytes
+            The serialized hash
+
+        Returns
+        -------
+        SparclurHash
+        """
+        data = bytes(data)
+        if not data.startswith(_HASH_MAGIC):
+            raise ValueError('Not a serialized SPARCLUR hash')
+        offset = len(_HASH_MAGIC)
+        version, header_length = struct.unpack_from('<BI', data, offset)
+        if version != _HASH_VERSION:
+            raise ValueError('Unsupported SPARCLUR hash version: %i' % version)
+        offset += struct.calcsize('<BI')
+        header = json.loads(data[offset:offset + header_length].decode())
+        offset += header_length
+
+        sparclur_hash = cls.__new__(cls)
+        sparclur_hash._exclude = header['exclude']
+        sparclur_hash._doc_hash = header['file_hash']
+        sparclur_hash._hash = dict()
+        sparclur_hash._render_version = RENDER_HASH_VERSION
+        for section in header['sections']:
+            key = section['key']
+            block = data[offset:offset + section['length']]
+            offset += section['length']
+            if key == RENDER:
+                words = np.frombuffer(block, dtype='<u8').astype(np.uint64)
+                if section['words'] > 0:
+                    words = words.reshape(-1, section['words'])
+                value = {page: words[i].copy() for (i, page) in enumerate(section['pages'])}
+                sparclur_hash._render_version = section.get('version', RENDER_HASH_VERSION)
+            elif key == TRACER:
+                value = set(_ints_from_bytes(block))
+            elif key == TEXT:
+                ints = _ints_from_bytes(block)
+                value = dict()
+                start = 0
+                for page, count in zip(section['pages'], section['counts']):
+                    value[page] = set(ints[start:start + count])
+                    start += count
+            else:
+                value = dict(zip(section['names'], _ints_from_bytes(block)))
+            sparclur_hash._hash[key] = value
+        return sparclur_hash
+
     def equals(this, that: SparclurHash or Parser):
         """
         Checks for parsed document information equality.
@@ -151,6 +432,7 @@ class SparclurHash:
         """
         if isinstance(that, Parser):
             that = that.sparclur_hash
+        SparclurHash._check_render_versions([this, that])
         results = dict()
         sim = 0.0
         num_compares = 0
@@ -1,23 +1,67 @@
+_SCORE_DEFAULTS = {'entropy_sim': 0.0,
+                   'whash_sim': 0.0,
+                   'phash_sim': 0.0,
+                   'sum_square_sim': 0.0,
+                   'ccorr_sim': 0.0,
+                   'ccoeff_sim': 0.0,
+                   'size_sim': 1.0,
+                   'ssim': 0.0}
+
+
 class PRCSim:
-    """Case class for PRC similarity results"""
-    def __init__(self, similarity_scores, result, diff=None):
-        self._entropy_sim = similarity_scores.get('entropy_sim', 0.0)
-        self._whash_sim = similarity_scores.get('whash_sim', 0.0)
-        self._phash_sim = similarity_scores.get('phash_sim', 0.0)
-        self._sum_square_sim = similarity_scores.get('sum_square_sim', 0.0)
-        self._ccorr_sim = similarity_scores.get('ccorr_sim', 0.0)
-        self._ccoeff_sim = similarity_scores.get('ccoeff_sim', 0.0)
-        self._size_sim = similarity_scores.get('size_sim', 1.0)
-        sim_sum = self._entropy_sim + self._whash_sim + self._phash_sim + self._sum_square_sim + self._ccorr_sim + self._ccoeff_sim
-        # sim_sum = self._entropy_sim + self._whash_sim + self._phash_sim + self._sum_square_sim + self._ccorr_sim
-        self._sim = (sim_sum / 6.0) * self._size_sim * self._size_sim
-        self._ssim = similarity_scores.get('ssim', 0.0)
+    """
+    Case class for PRC similarity results. Scores may be given as zero-argument callables, in which case each score is
+    only computed the first time it is accessed. A callable that returns None counts as a missing score. Lazy scores
+    that are not computed yet when the results are pickled or released are dropped and listed in
+    `unavailable_metrics`, and accessing them raises a ValueError.
+    """
+    def __init__(self, similarity_scores, result, diff=None, unavailable=()):
+        self._scores = dict(similarity_scores)
+        self._sim = None
         self._result = result
         self._diff = diff
+        self._unavailable = tuple(unavailable)
+
+    def __getstate__(self):
+        # Lazy scores are closures over the renders, so only the scores computed so far are pickled
+        scores, unavailable = self._resolved()
+        return {'similarity_scores': scores,
+                'result': self.result,
+                'diff': self._diff,
+                'unavailable': unavailable,
+                'sim': self._sim}
+
+    def __setstate__(self, state):
+        self.__init__(state['similarity_scores'], state['result'], diff=state['diff'],
+                      unavailable=state.get('unavailable', ()))
+        self._sim = state.get('sim')
+
+    def _resolved(self):
+        """The computed scores and the metrics whose lazy scores are not computed yet"""
+        unavailable = [metric for (metric, value) in self._scores.items() if callable(value)]
+        scores = {metric: value for (metric, value) in self._scores.items() if metric not in unavailable}
+        return scores, self._unavailable + tuple(unavailable)
+
+    def _release(self):
+        """
+        Drop the lazy scores that are not computed yet, so their closures no longer hold on to the renders and their
+        features, and fix the result as it stands.
+        """
+        self._scores, self._unavailable = self._resolved()
+        self._result = self.result
+
+    def _score(self, metric):
+        if metric in self._unavailable:
+            raise ValueError('%s was not computed before the scores were released' % metric)
+        value = self._scores.get(metric)
+        if callable(value):
+            value = value()
+            self._scores[metric] = value
+        return _SCORE_DEFAULTS[metric] if value is None else value
 
     def __iter__(self):
-        yield self._sim
-        yield self._result
+        yield self.sim
+        yield self.result
         yield self._diff
 
     def __repr__(self):
@@ -26,52 +70,72 @@ class PRCSim:
 
     @property
     def all_metrics(self):
-        metrics = {'sim': self._sim,
-                   'entropy_sim': self._entropy_sim,
-                   'whash_sim': self._whash_sim,
-                   'phash_sim': self._phash_sim,
-                   'sum_square_sim': self._sum_square_sim,
-                   'ccorr_sim': self._ccorr_sim,
-                   'ccoeff_sim': self._ccoeff_sim,
-                   'size_sim': self._size_sim}
-        return metrics
+        return self.get_metrics(['sim', 'entropy_sim', 'whash_sim', 'phash_sim', 'sum_square_sim', 'ccorr_sim',
+                                 'ccoeff_sim', 'size_sim'])
+
+    def get_metrics(self, metrics):
+        """
+        Retrieve a subset of the metrics, computing only the scores they depend on.
+
+        Parameters
+        ----------
+        metrics : List[str]
+            Any of 'sim', 'entropy_sim', 'whash_sim', 'phash_sim', 'sum_square_sim', 'ccorr_sim', 'ccoeff_sim' and
+            'size_sim'
+
+        Returns
+        -------
+        Dict[str, float]
+        """
+        return {metric: getattr(self, metric) for metric in metrics}
 
     @property
     def sim(self):
+        if self._sim is None:
+            sim_sum = self.entropy_sim + self.whash_sim + self.phash_sim + self.sum_square_sim + self.ccorr_sim + \
+                      self.ccoeff_sim
+            # sim_sum = self._entropy_sim + self._whash_sim + self._phash_sim + self._sum_square_sim + self._ccorr_sim
+            self._sim = (sim_sum / 6.0) * self.size_sim * self.size_sim
         return self._sim
 
     @property
     def result(self):
-        return self._result
+        """The outcome of the comparison. With lazy scores it reflects the scores computed so far."""
+        return self._result() if callable(self._result) else self._result
 
     @property
     def diff(self):
         return self._diff
 
+    @property
+    def unavailable_metrics(self):
+        """The lazy scores that were dropped before they were computed"""
+        return list(self._unavailable)
+
     @property
     def whash_sim(self):
-        return self._whash_sim
+        return self._score('whash_sim')
 
     @property
     def phash_sim(self):
-        return self._phash_sim
+        return self._score('phash_sim')
 
     @property
     def entropy_sim(self):
-        return self._entropy_sim
+        return self._score('entropy_sim')
 
     @property
     def sum_square_sim(self):
-        return self._sum_square_sim
+        return self._score('sum_square_sim')
 
     @property
     def ccorr_sim(self):
-        return self._ccorr_sim
+        return self._score('ccorr_sim')
 
     @property
     def ccoeff_sim(self):
-        return self._ccoeff_sim
+        return self._score('ccoeff_sim')
 
     @property
     def size_sim(self):
-        return self._size_sim
+        return self._score('size_sim')
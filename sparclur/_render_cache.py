@@ -0,0 +1,280 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Union
+
+from PIL import Image
+
+
+def _image_bytes(pil: Image.Image) -> int:
+    return pil.width * pil.height * len(pil.getbands())
+
+
+class RenderCache(MutableMapping):
+    """
+    Page to render mapping used as the render cache of a Renderer. Holds at most `budget` bytes of decoded images in
+    memory. Once the budget is exceeded the least recently used pages are either spilled to compressed PNGs on disk and
+    transparently reloaded when accessed, or dropped entirely. Features computed from a page, e.g. its hashes and
+    arrays for comparisons, can be kept with it; they count against the budget and are dropped when the page leaves
+    memory.
+    """
+
+    def __init__(self, budget: Union[int, None] = None, spill: bool = True, temp_folders_dir: Union[str, None] = None):
+        """
+        Parameters
+        ----------
+        budget : int or None
+            The maximum number of bytes of decoded pixel data held in memory. None leaves the cache unbounded.
+        spill : bool
+            Whether evicted pages should be written to disk (True) or discarded (False).
+        temp_folders_dir : str
+            Path to create the spill directory in.
+        """
+        assert budget is None or budget >= 0, "The cache budget cannot be negative"
+        self._budget = budget
+        self._spill = spill
+        self._temp_folders_dir = temp_folders_dir
+        self._lock = threading.RLock()
+        self._memory: OrderedDict = OrderedDict()
+        self._sizes: Dict[int, int] = dict()
+        self._features: Dict[int, Any] = dict()
+        # Feature bytes as last measured, kept as a running total so eviction does not re-measure every page
+        self._feature_sizes: Dict[int, int] = dict()
+        self._feature_bytes = 0
+        self._spilled: Dict[int, str] = dict()
+        self._dropped = set()
+        self._bytes = 0
+        self._spill_dir = None
+        self._finalizer = None
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._spills = 0
+        self._reloads = 0
+
+    def __getstate__(self):
+        with self._lock:
+            spilled = dict()
+            for page, path in self._spilled.items():
+                with open(path, 'rb') as png_in:
+                    spilled[page] = png_in.read()
+            return {'budget': self._budget,
+                    'spill': self._spill,
+                    'temp_folders_dir': self._temp_folders_dir,
+                    'memory': list(self._memory.items()),
+                    'spilled': spilled,
+                    'dropped': set(self._dropped)}
+
+    def __setstate__(self, state):
+        self.__init__(budget=state['budget'], spill=state['spill'], temp_folders_dir=state['temp_folders_dir'])
+        for page, png in state['spilled'].items():
+            path = os.path.join(self._get_spill_dir(), '%i.png' % page)
+            with open(path, 'wb') as png_out:
+                png_out.write(png)
+            self._spilled[page] = path
+        for page, pil in state['memory']:
+            self[page] = pil
+        self._dropped = state['dropped']
+
+    def _get_spill_dir(self):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix='sparclur-renders-', dir=self._temp_folders_dir)
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+        return self._spill_dir
+
+    def _memory_bytes(self):
+        return self._bytes + self._feature_bytes
+
+    def _pop_features(self, page):
+        self._features.pop(page, None)
+        self._feature_bytes -= self._feature_sizes.pop(page, 0)
+
+    def _measure_features(self):
+        """Re-measure the features, which can grow after being set as more of them are computed"""
+        self._feature_sizes = {page: features.nbytes for (page, features) in self._features.items()}
+        self._feature_bytes = sum(self._feature_sizes.values())
+
+    def _evict(self):
+        if self._budget is None:
+            return
+        while len(self._memory) > 1 and self._memory_bytes() > self._budget:
+            page, pil = self._memory.popitem(last=False)
+            self._bytes -= self._sizes.pop(page)
+            self._pop_features(page)
+            self._evictions += 1
+            if self._spill:
+                if page not in self._spilled:
+                    path = os.path.join(self._get_spill_dir(), '%i.png' % page)
+                    pil.save(path, format='PNG', compress_level=1)
+                    self._spilled[page] = path
+                    self._spills += 1
+            else:
+                self._dropped.add(page)
+
+    def _reload(self, page):
+        path = self._spilled[page]
+        with open(path, 'rb') as png_in:
+            pil = Image.open(io.BytesIO(png_in.read()))
+            pil.load()
+        self._reloads += 1
+        self._memory[page] = pil
+        self._sizes[page] = _image_bytes(pil)
+        self._bytes += self._sizes[page]
+        self._evict()
+        return pil
+
+    def __getitem__(self, page):
+        with self._lock:
+            if page in self._memory:
+                self._hits += 1
+                self._memory.move_to_end(page)
+                return self._memory[page]
+            elif page in self._spilled:
+                self._hits += 1
+                return self._reload(page)
+            else:
+                self._misses += 1
+                raise KeyError(page)
+
+    def __setitem__(self, page, pil):
+        with self._lock:
+            if page in self._memory:
+                self._bytes -= self._sizes.pop(page)
+            self._pop_features(page)
+            self._discard_spill(page)
+            self._dropped.discard(page)
+            self._memory[page] = pil
+            self._memory.move_to_end(page)
+            self._sizes[page] = _image_bytes(pil)
+            self._bytes += self._sizes[page]
+            self._evict()
+
+    def __delitem__(self, page):
+        with self._lock:
+            if page not in self:
+                raise KeyError(page)
+            if page in self._memory:
+                del self._memory[page]
+                self._bytes -= self._sizes.pop(page)
+            self._pop_features(page)
+            self._discard_spill(page)
+
+    def _discard_spill(self, page):
+        path = self._spilled.pop(page, None)
+        if path is not None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def __contains__(self, page):
+        return page in self._memory or page in self._spilled
+
+    def __iter__(self):
+        with self._lock:
+            pages = list(self._memory.keys()) + [page for page in self._spilled.keys() if page not in self._memory]
+        return iter(pages)
+
+    def __len__(self):
+        return len(self._memory) + len([page for page in self._spilled.keys() if page not in self._memory])
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._sizes.clear()
+            self._features.clear()
+            self._feature_sizes.clear()
+            self._feature_bytes = 0
+            self._spilled.clear()
+            self._dropped.clear()
+            self._bytes = 0
+            if self._finalizer is not None:
+                self._finalizer()
+            self._spill_dir = None
+            self._finalizer = None
+
+    def get_features(self, page) -> Any:
+        """
+        Return the features kept with a page or None if there are none or the page is not in memory.
+
+        Parameters
+        ----------
+        page : int
+
+        Returns
+        -------
+        Any
+        """
+        with self._lock:
+            return self._features.get(page)
+
+    def set_features(self, page, features: Any):
+        """
+        Keep features computed from a page in memory with it. Ignored for pages that are not in memory.
+
+        Parameters
+        ----------
+        page : int
+        features : Any
+            Must report the bytes it holds with an `nbytes` attribute
+        """
+        with self._lock:
+            if page in self._memory:
+                self._pop_features(page)
+                self._features[page] = features
+                self._feature_sizes[page] = features.nbytes
+                self._feature_bytes += self._feature_sizes[page]
+                self._evict()
+
+    def trim(self):
+        """Evict pages until the cache is within its budget again, e.g. after features kept with pages have grown."""
+        with self._lock:
+            self._measure_features()
+            self._evict()
+
+    @property
+    def budget(self):
+        return self._budget
+
+    @budget.setter
+    def budget(self, b: Union[int, None]):
+        assert b is None or b >= 0, "The cache budget cannot be negative"
+        with self._lock:
+            self._budget = b
+            self._measure_features()
+            self._evict()
+
+    @property
+    def dropped(self):
+        """Pages that were evicted without being spilled to disk"""
+        return set(self._dropped)
+
+    @property
+    def nbytes(self):
+        """Bytes of decoded pixel data and page features currently held in memory"""
+        with self._lock:
+            self._measure_features()
+            return self._memory_bytes()
+
+    @property
+    def stats(self):
+        """
+        Counters describing the cache behavior.
+
+        Returns
+        -------
+        Dict[str, int]
+        """
+        return {'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'spills': self._spills,
+                'reloads': self._reloads,
+                'in_memory': len(self._memory),
+                'on_disk': len(self._spilled),
+                'bytes': self.nbytes}
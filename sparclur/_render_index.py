@@ -0,0 +1,232 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from sparclur._parser import Parser, SparclurHash, RENDER, RENDER_HASH_SIZE, _pack_render_hash, _popcount
+
+# Number of LSH bands and of min-hashes per band. Pages whose render hashes have a set bit overlap of s share at least
+# one band with a probability of 1 - (1 - s^rows)^bands.
+_INDEX_BANDS = 32
+_INDEX_ROWS = 4
+# Default similarity above which candidates are returned
+_INDEX_THRESHOLD = 0.5
+# Pages with fewer set bits, e.g. blank pages or a lone page number, carry too little information to be told apart and
+# are kept out of the buckets. Pages of text set about a hundred bits.
+_MIN_SET_BITS = 16
+
+
+def _render_hash_sim(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Overlap of the set bits of packed render hashes, i.e. the Jaccard similarity of the edges found by the difference
+    hash. Pages of text set only a small share of the bits, so this separates pages far better than the share of equal
+    bits. Pages without any set bit are identical to each other.
+    """
+    intersect = _popcount(np.bitwise_and(left, right))
+    union = _popcount(np.bitwise_or(left, right))
+    return np.where(union > 0, intersect / np.maximum(union, 1), 1.0)
+
+
+class RenderIndex:
+    """
+    Persistent index of page render hashes for finding the documents that render nearly identically to a given one,
+    e.g. re-uploads of altered documents. Pages are placed in locality sensitive hash buckets of min-hashes over the set
+    bits of their render hash, so a query only looks at the pages that share a bucket with it instead of the whole
+    corpus. Candidates are then scored exactly from their stored hashes. Blank and nearly blank pages are stored but
+    never bucketed, so they neither match nor make a document a candidate. The index is an SQLite database and can be
+    shared between processes.
+    """
+
+    def __init__(self, path: str, bands: int = _INDEX_BANDS, rows: int = _INDEX_ROWS):
+        """
+        Parameters
+        ----------
+        path : str
+            Path of the index database. Created if it does not exist.
+        bands : int
+            Number of LSH bands. More bands find more of the pages with a low similarity at the cost of more candidates.
+        rows : int
+            Number of min-hashes per band. More rows make each band more selective.
+            The bands and rows of an existing index are read from the index and these parameters are ignored.
+        """
+        assert bands > 0 and rows > 0, "Bands and rows must be positive"
+        self._path = os.path.abspath(path)
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value INTEGER)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS pages (id INTEGER PRIMARY KEY, doc TEXT, '
+                                     'page INTEGER, hash BLOB, UNIQUE(doc, page))')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS buckets (band INTEGER, bucket INTEGER, '
+                                     'page_id INTEGER)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS bucket_index ON buckets (band, bucket)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS page_index ON buckets (page_id)')
+            self._connection.executemany('INSERT OR IGNORE INTO settings VALUES (?, ?)',
+                                         [('bands', bands), ('rows', rows)])
+            settings = dict(self._connection.execute('SELECT name, value FROM settings'))
+        self._bands = settings['bands']
+        self._rows = settings['rows']
+        rng = np.random.default_rng(0)
+        num_bits = RENDER_HASH_SIZE * RENDER_HASH_SIZE
+        self._ranks = np.stack([rng.permutation(num_bits) for _ in range(self._bands * self._rows)]).astype(np.int32)
+
+    def __getstate__(self):
+        return {'path': self._path, 'bands': self._bands, 'rows': self._rows}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['bands'], state['rows'])
+
+    def __repr__(self):
+        return 'RenderIndex(%s)' % self._path
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def bands(self):
+        return self._bands
+
+    @property
+    def rows(self):
+        return self._rows
+
+    def close(self):
+        """Close the connection to the index database"""
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self):
+        """Number of indexed documents"""
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(DISTINCT doc) FROM pages').fetchone()[0]
+
+    def __contains__(self, doc: str):
+        with self._lock:
+            return self._connection.execute('SELECT 1 FROM pages WHERE doc = ? LIMIT 1', (doc,)).fetchone() is not None
+
+    def _buckets(self, words: np.ndarray) -> List[int]:
+        """The bucket of the page in each band, or no buckets for a page with too little information"""
+        bits = np.unpackbits(words.view(np.uint8))
+        positions = np.flatnonzero(bits[:self._ranks.shape[1]])
+        if len(positions) < _MIN_SET_BITS:
+            return []
+        min_hashes = self._ranks[:, positions].min(axis=1).astype('<u4').reshape(self._bands, self._rows)
+        return [int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), 'little', signed=True)
+                for band in min_hashes]
+
+    @staticmethod
+    def _render_hashes(item: Union[SparclurHash, Parser]) -> Tuple[str, Dict[int, np.ndarray]]:
+        sparclur_hash = item.sparclur_hash if isinstance(item, Parser) else item
+        renders = sparclur_hash.get(RENDER, dict())
+        return sparclur_hash.file_hash, {page: _pack_render_hash(h) for (page, h) in renders.items() if h is not None}
+
+    def insert(self, item: Union[SparclurHash, Parser], doc: str = None):
+        """
+        Add the page render hashes of a document to the index, replacing any pages already indexed for it.
+
+        Parameters
+        ----------
+        item : SparclurHash or Renderer
+            The SPARCLUR hash of the document or a renderer of it
+        doc : str
+            The key the document is indexed under. Defaults to the sha256 of the document.
+        """
+        file_hash, renders = self._render_hashes(item)
+        doc = file_hash if doc is None else doc
+        entries = [(page, words, self._buckets(words)) for (page, words) in sorted(renders.items())]
+        with self._lock, self._connection:
+            self._delete(doc)
+            for page, words, buckets in entries:
+                cursor = self._connection.execute('INSERT INTO pages (doc, page, hash) VALUES (?, ?, ?)',
+                                                  (doc, page, words.astype('<u8').tobytes()))
+                self._connection.executemany('INSERT INTO buckets VALUES (?, ?, ?)',
+                                             [(band, bucket, cursor.lastrowid) for (band, bucket) in
+                                              enumerate(buckets)])
+
+    def _delete(self, doc):
+        self._connection.execute('DELETE FROM buckets WHERE page_id IN (SELECT id FROM pages WHERE doc = ?)', (doc,))
+        self._connection.execute('DELETE FROM pages WHERE doc = ?', (doc,))
+
+    def remove(self, doc: str):
+        """
+        Remove a document from the index.
+
+        Parameters
+        ----------
+        doc : str
+            The key the document was indexed under
+        """
+        with self._lock, self._connection:
+            self._delete(doc)
+
+    def query_page(self, render_hash, threshold: float = _INDEX_THRESHOLD, exclude: str = None) \
+            -> List[Tuple[str, int, float]]:
+        """
+        Find the indexed pages that render nearly identically to a page. Blank and nearly blank pages have no
+        matches.
+
+        Parameters
+        ----------
+        render_hash : np.ndarray or ImageHash
+            The render hash of the page, as found in the 'Renderer' entry of a SPARCLUR hash
+        threshold : float
+            Minimum overlap of the set bits of the two render hashes
+        exclude : str
+            Key of a document whose pages are left out of the results
+
+        Returns
+        -------
+        List[Tuple[str, int, float]]
+            The document key, page and similarity of every match, most similar first
+        """
+        words = _pack_render_hash(render_hash)
+        buckets = self._buckets(words)
+        if len(buckets) == 0:
+            return []
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT DISTINCT pages.doc, pages.page, pages.hash FROM buckets JOIN pages ON buckets.page_id = pages.id '
+                'WHERE ' + ' OR '.join(['(buckets.band = ? AND buckets.bucket = ?)'] * len(buckets)),
+                [value for band_bucket in enumerate(buckets) for value in band_bucket]).fetchall()
+        rows = [row for row in rows if row[0] != exclude and len(row[2]) == words.nbytes]
+        if len(rows) == 0:
+            return []
+        candidates = np.stack([np.frombuffer(row[2], dtype='<u8').astype(np.uint64) for row in rows])
+        sims = _render_hash_sim(words[np.newaxis], candidates)
+        matches = [(doc, page, float(sim)) for ((doc, page, _), sim) in zip(rows, sims) if sim >= threshold]
+        matches.sort(key=lambda match: (-match[2], match[0], match[1]))
+        return matches
+
+    def query_document(self, item: Union[SparclurHash, Parser], threshold: float = _INDEX_THRESHOLD,
+                       exclude_self: bool = True) -> Dict[str, Dict[int, Tuple[int, float]]]:
+        """
+        Find the indexed documents with pages that render nearly identically to the pages of a document.
+
+        Parameters
+        ----------
+        item : SparclurHash or Renderer
+            The SPARCLUR hash of the document or a renderer of it
+        threshold : float
+            Minimum overlap of the set bits of two page render hashes
+        exclude_self : bool
+            Leave the document itself out of the results if it is indexed under its sha256
+
+        Returns
+        -------
+        Dict[str, Dict[int, Tuple[int, float]]]
+            For every matching document, the best matching page and its similarity for each page of the queried
+            document that has a match in it
+        """
+        file_hash, renders = self._render_hashes(item)
+        results = dict()
+        for page, words in sorted(renders.items()):
+            for (doc, match_page, sim) in self.query_page(words, threshold=threshold,
+                                                          exclude=file_hash if exclude_self else None):
+                best = results.setdefault(doc, dict()).get(page)
+                if best is None or sim > best[1] or (sim == best[1] and match_page == page):
+                    results[doc][page] = (match_page, sim)
+        return results
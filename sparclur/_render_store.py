@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from sparclur.utils._config import _get_config_param, _load_config
+
+_RENDER_EXT = '.npy'
+_LOG_EXT = '.json'
+
+
+class RenderStore:
+    """
+    Host local store of page rasters shared between processes. Each render is written once as a raw array file keyed by
+    the content hash of the document, the renderer and its render settings, and is memory-mapped by any process that
+    reads it afterwards. Writes are atomic so concurrent workers can publish and read the same entries, and the store is
+    kept under a size bound by evicting the least recently used entries. The sizes and recency of the entries are
+    indexed in memory when the store is opened and kept up to date by the process's own reads and writes. The directory
+    is only rescanned when its modification time shows that another process changed it or an eviction finds an entry
+    already gone.
+    """
+
+    def __init__(self, path: str, max_bytes: Union[int, None] = None):
+        """
+        Parameters
+        ----------
+        path : str
+            Directory that holds the store. Created if it does not exist.
+        max_bytes : int or None
+            Upper bound on the size of the store on disk. Least recently used entries are removed once it is exceeded.
+            None leaves the store unbounded.
+        """
+        self._path = os.path.abspath(path)
+        self._max_bytes = max_bytes
+        os.makedirs(self._path, exist_ok=True)
+        self._lock = threading.RLock()
+        # Render file size of each entry, least recently used first
+        self._index: OrderedDict = OrderedDict()
+        self._total = 0
+        self._dir_mtime = None
+        self._scan()
+
+    def __getstate__(self):
+        return {'path': self._path, 'max_bytes': self._max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['max_bytes'])
+
+    def __repr__(self):
+        return 'RenderStore(%s)' % self._path
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, mb: Union[int, None]):
+        self._max_bytes = mb
+        with self._lock:
+            self._sync()
+            self._evict()
+            self._dir_mtime = self._directory_mtime()
+
+    @staticmethod
+    def key(file_hash: str, renderer: str, dpi: int, page: int, **params) -> str:
+        """
+        Build the store key for a single page render.
+
+        Parameters
+        ----------
+        file_hash : str
+            The sha256 of the document
+        renderer : str
+            The name of the renderer
+        dpi : int
+            The dots-per-inch of the render
+        page : int
+            Zero-indexed page
+        params
+            Any other setting that changes the raster, e.g. a fixed output size
+
+        Returns
+        -------
+        str
+        """
+        key_parts = [file_hash, renderer, dpi, page, sorted((k, str(v)) for (k, v) in params.items())]
+        return hashlib.sha256(json.dumps(key_parts).encode()).hexdigest()
+
+    def _render_path(self, key):
+        return os.path.join(self._path, key + _RENDER_EXT)
+
+    def _log_path(self, key):
+        return os.path.join(self._path, key + _LOG_EXT)
+
+    def __contains__(self, key):
+        return os.path.isfile(self._render_path(key))
+
+    def get(self, key: str) -> Union[Tuple[Image.Image, Dict[str, Any]], None]:
+        """
+        Retrieve a render and its log entry from the store.
+
+        Parameters
+        ----------
+        key : str
+            Key built with `RenderStore.key`
+
+        Returns
+        -------
+        Tuple[Image, Dict[str, Any]] or None
+            The render and its log or None if the key is not in the store
+        """
+        render_path = self._render_path(key)
+        try:
+            array = np.load(render_path, mmap_mode='r')
+            pil = Image.fromarray(array)
+            os.utime(render_path)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        try:
+            with open(self._log_path(key), 'r') as log_in:
+                log = json.load(log_in)
+        except (OSError, ValueError):
+            log = dict()
+        return pil, log
+
+    def put(self, key: str, pil: Image.Image, log: Union[Dict[str, Any], None] = None):
+        """
+        Publish a render to the store.
+
+        Parameters
+        ----------
+        key : str
+            Key built with `RenderStore.key`
+        pil : Image
+            The render
+        log : Dict[str, Any]
+            The render log entry for the page
+        """
+        if pil.mode not in ('L', 'RGB', 'RGBA'):
+            pil = pil.convert('RGB')
+        array = np.asarray(pil)
+        with self._lock:
+            self._sync()
+            try:
+                if log is not None:
+                    self._atomic_write(self._log_path(key), lambda f: f.write(json.dumps(log).encode()))
+                self._atomic_write(self._render_path(key), lambda f: np.save(f, array))
+                size = os.stat(self._render_path(key)).st_size
+            except OSError:
+                return
+            self._total += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self._evict()
+            self._dir_mtime = self._directory_mtime()
+
+    def _atomic_write(self, path, writer):
+        fd, temp_path = tempfile.mkstemp(dir=self._path, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as file_out:
+                writer(file_out)
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _directory_mtime(self):
+        try:
+            return os.stat(self._path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan(self):
+        """Rebuild the index from the directory"""
+        with self._lock:
+            # Taken before the scan so that changes made during it trigger another scan
+            self._dir_mtime = self._directory_mtime()
+            entries = sorted(self._entries())
+            self._index = OrderedDict((key, size) for (_, size, key) in entries)
+            self._total = sum(self._index.values())
+
+    def _sync(self):
+        """Rescan the directory if another process changed it since the index was last brought up to date"""
+        if self._directory_mtime() != self._dir_mtime:
+            self._scan()
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self._path) as it:
+            for entry in it:
+                if entry.name.endswith(_RENDER_EXT) and not entry.name.startswith('.tmp-'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.name[:-len(_RENDER_EXT)]))
+        return entries
+
+    @property
+    def nbytes(self):
+        """Size of the stored renders in bytes"""
+        with self._lock:
+            self._sync()
+            return self._total
+
+    def __len__(self):
+        with self._lock:
+            self._sync()
+            return len(self._index)
+
+    def _remove(self, key) -> bool:
+        """Remove an entry and return whether its render was still on disk"""
+        try:
+            os.remove(self._render_path(key))
+            found = True
+        except FileNotFoundError:
+            found = False
+        except OSError:
+            found = True
+        try:
+            os.remove(self._log_path(key))
+        except OSError:
+            pass
+        return found
+
+    def _evict(self):
+        if self._max_bytes is None:
+            return
+        stale = False
+        while self._total > self._max_bytes and len(self._index) > 0:
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            if not self._remove(key) and not stale:
+                # Another process removed the entry, so its other changes are not indexed either
+                stale = True
+                self._scan()
+
+    def clear(self):
+        """Remove every entry from the store"""
+        with self._lock:
+            for (_, _, key) in self._entries():
+                self._remove(key)
+            self._scan()
+
+
+def _get_render_store(render_store: Union[str, RenderStore, None]) -> Union[RenderStore, None]:
+    if render_store is None or isinstance(render_store, RenderStore):
+        return render_store
+    path = os.path.abspath(render_store)
+    max_bytes = _get_config_param(RenderStore, _load_config(), 'max_bytes', None, None)
+    return RenderStore(path, max_bytes=max_bytes)
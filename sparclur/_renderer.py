@@ -1,30 +1,288 @@
 import abc
+import copy
+import heapq
+import math
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 
 import sys
 import random
-from typing import Dict, Any, Union, List
+import subprocess
+import tempfile
+import time
+from subprocess import DEVNULL, TimeoutExpired
+from typing import Dict, Any, Union, List, Callable, Iterator, Tuple
+from PIL import Image
 from PIL.PngImagePlugin import PngImageFile
 from func_timeout import func_timeout, FunctionTimedOut
 from imagehash import dhash
+from pebble import ProcessPool
 from skimage.metrics import structural_similarity
 import numpy as np
 
 from sparclur._metaclass import Meta
+from sparclur._page_geometry import PageGeometry, _GEOMETRY_INDEX
 from sparclur._prc_sim import PRCSim
+from sparclur._render_cache import RenderCache
+from sparclur._render_store import RenderStore, _get_render_store
 from sparclur._text_compare import TextCompare
 from sparclur._parser import RENDER, RENDER_HASH_SIZE
 import re
 from pytesseract import image_to_string
-from sparclur.utils import image_compare
+from sparclur.utils import image_compare, batch_image_compare, RenderFeatures
 
 _SUCCESSFUL_RENDER_MESSAGE = 'Successfully Rendered'
 _SUCCESS_WITH_WARNINGS = "Successful with warnings"
+
+# Hash renders are drawn with their longer side at this multiple of the hash width, leaving dhash a little detail to
+# average over when it downsizes.
+_HASH_RENDER_OVERSAMPLE = 2
+
+_COLORSPACES = ('rgb', 'gray')
+
+# Pages whose boxes give their renders a size similarity below this are reported as a mismatch without rendering
+_GEOMETRY_MISMATCH_SIZE_SIM = 0.5
+
+# Largest difference in pixels per side between renders of same sized pages that is treated as a rounding difference
+_ALIGN_TOLERANCE = 2
+
+# Estimated cost of starting one more render subprocess, which re-parses the document, in units of rendered pages
+_RUN_OVERHEAD_PAGES = 2
+
+# Long edge of a US Letter page in inches, used to pick a hash render dpi for pages without known geometry
+_LETTER_LONG_EDGE = 11
+
+
+def _hash_render_size(hash_size: int) -> int:
+    """Length in pixels of the longer side of a render that is only used to compute a dhash of `hash_size`"""
+    return _HASH_RENDER_OVERSAMPLE * (hash_size + 1)
+
+
+def _hash_render_dpi(size: int, geometry: Union[PageGeometry, None] = None) -> int:
+    """
+    Resolution that renders the longer side of a page at about `size` pixels, for backends that can only be given a
+    resolution. Pages without known geometry are taken to be US Letter.
+    """
+    long_edge = _LETTER_LONG_EDGE if geometry is None or max(geometry.size) <= 0 else max(geometry.size) / 72
+    return max(1, math.ceil(size / long_edge))
 # _COMPARISON_SUCCESSFUL_MESSAGE = 'Successfully Compared'
 
 
 def _ocr_text(pil: PngImageFile):
     return re.sub(r'[\x0c]', '', image_to_string(pil))
 
+
+def _load_image(path: str) -> Image.Image:
+    """Open and fully decode an image so that it no longer depends on the file it was read from."""
+    pil = Image.open(path)
+    pil.load()
+    return pil
+
+
+def _region_pixels(bbox: Tuple[float, float, float, float], scale: float,
+                   size: Union[Tuple[int, int], None] = None) -> Tuple[int, int, int, int]:
+    """
+    Convert a bounding box in PDF points to a (left, top, right, bottom) pixel box at the given scale, clipped to the
+    pixel size of the page when it is known.
+    """
+    x0, y0, x1, y1 = (int(round(v * scale)) for v in bbox)
+    x0, y0 = max(0, x0), max(0, y0)
+    if size is not None:
+        x1, y1 = min(size[0], x1), min(size[1], y1)
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError('The region %s does not overlap the page' % str(tuple(bbox)))
+    return x0, y0, x1, y1
+
+
+def _plan_page_runs(pages: List[int], overhead: float = _RUN_OVERHEAD_PAGES) -> List[List[int]]:
+    """
+    Plan the invocations of a range based renderer for a sparse set of pages. Consecutive requested pages are grouped
+    into one run and a gap between them is only rendered through when it costs fewer pages than starting another
+    invocation. Each run lists the requested pages it covers and is rendered from its first to its last page.
+
+    Parameters
+    ----------
+    pages : List[int]
+        The requested pages
+    overhead : float
+        The cost of an extra invocation in rendered pages
+
+    Returns
+    -------
+    List[List[int]]
+    """
+    runs = []
+    for page in sorted(set(pages)):
+        if len(runs) > 0 and page - runs[-1][-1] - 1 <= overhead:
+            runs[-1].append(page)
+        else:
+            runs.append([page])
+    return runs
+
+
+def _output_page_parser(prefix: str, suffix: str) -> Callable[[str], Union[int, None]]:
+    """
+    Returns a function that maps the name of a numbered output file, e.g. `out-007.png`, to its zero-indexed page.
+    """
+    pattern = re.compile(r'^%s(\d+)%s$' % (re.escape(prefix), re.escape(suffix)))
+
+    def parse(file_name):
+        match = pattern.match(file_name)
+        return None if match is None else int(match.group(1)) - 1
+    return parse
+
+
+def _stream_output_files(sp, out_dir: str, page_index: Callable[[str], Union[int, None]],
+                         timeout: Union[float, None], poll_interval: float = 0.05,
+                         progress_timeout: Union[float, None] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Watches the output directory of a rendering subprocess and yields `(page, path)` for each output file as soon as it
+    is complete. Renderers write pages in order, so a page file is complete once a later page file appears or the
+    process has exited. When a timeout is hit the process is killed, the files written so far are yielded and
+    TimeoutExpired is raised. The last of those files may be cut off.
+
+    Parameters
+    ----------
+    sp : Popen
+        The running render process
+    out_dir : str
+        The directory the process writes its page files to
+    page_index : Callable[[str], int or None]
+        Maps an output file name to its zero-indexed page or None for unrelated files
+    timeout : float
+        Seconds the process is allowed to run in total before TimeoutExpired is raised
+    poll_interval : float
+        Seconds between directory scans
+    progress_timeout : float
+        Seconds the process is allowed to run without writing a new page file before TimeoutExpired is raised
+
+    Returns
+    -------
+    Iterator[Tuple[int, str]]
+    """
+    start_time = time.perf_counter()
+    progress_time = start_time
+    yielded = set()
+    seen = 0
+    expired = None
+    while True:
+        exited = sp.poll() is not None
+        pending = []
+        for file_name in os.listdir(out_dir):
+            page = page_index(file_name)
+            if page is not None and page not in yielded:
+                pending.append((page, file_name))
+        pending.sort()
+        now = time.perf_counter()
+        if len(yielded) + len(pending) > seen:
+            seen = len(yielded) + len(pending)
+            progress_time = now
+        if not exited:
+            if timeout is not None and now - start_time > timeout:
+                expired = timeout
+            elif progress_timeout is not None and now - progress_time > progress_timeout:
+                expired = progress_timeout
+            if expired is not None:
+                sp.kill()
+                sp.wait()
+                exited = True
+        complete = pending if exited else pending[:-1]
+        for (page, file_name) in complete:
+            yielded.add(page)
+            yield page, os.path.join(out_dir, file_name)
+        if expired is not None:
+            raise TimeoutExpired(sp.args, expired)
+        if exited:
+            return
+        time.sleep(poll_interval)
+
+
+def _align_renders(page: int, left_renderer: 'Renderer', left, right_renderer: 'Renderer', right,
+                   tolerance: int = _ALIGN_TOLERANCE):
+    """
+    Renders of pages with the same geometry can still differ by a pixel or two because backends round partial pixels
+    differently. In that case each render that is off the pixel size given by the page geometry is drawn again as a
+    full page region, which the backends draw at exactly that size, so the pair is compared directly instead of
+    through padding and template matching. Both sides are treated alike, so the result does not depend on their order.
+    The renders are returned unchanged when they cannot be matched.
+    """
+    if left is None or right is None or left.size == right.size or left_renderer.dpi != right_renderer.dpi:
+        return left, right
+    if any(abs(l_dim - r_dim) > tolerance for (l_dim, r_dim) in zip(left.size, right.size)):
+        return left, right
+    left_geometry = left_renderer.page_geometry.get(page)
+    right_geometry = right_renderer.page_geometry.get(page)
+    if left_geometry is None or right_geometry is None or left_geometry.size != right_geometry.size:
+        return left, right
+    width, height = left_geometry.size
+    x0, y0, x1, y1 = _region_pixels((0, 0, width, height), left_renderer.dpi / 72)
+    aligned = []
+    for (renderer, pil) in ((left_renderer, left), (right_renderer, right)):
+        if pil.size != (x1 - x0, y1 - y0):
+            pil = renderer.get_region(page, (0, 0, width, height))
+            if pil is None or pil.size != (x1 - x0, y1 - y0):
+                return left, right
+        aligned.append(pil)
+    return aligned[0], aligned[1]
+
+
+def _lazy_compare(left, right, metrics: List[str]) -> PRCSim:
+    sim = image_compare(left, right, False, lazy=True)
+    sim.get_metrics(metrics)
+    sim._release()
+    return sim
+
+
+def _timed_compare(left, right, full: bool, timeout: Union[int, None],
+                   metrics: Union[List[str], None] = None, diff_threshold: Union[float, None] = None) -> PRCSim:
+    """
+    Compare two renders under the timeout. When `metrics` is given only those metrics are computed, within the
+    timeout, and any other metric is dropped so the result does not hold on to the renders.
+    """
+    if metrics is None:
+        compare_func, args, kwargs = image_compare, (left, right, full), {'diff_threshold': diff_threshold}
+    else:
+        compare_func, args, kwargs = _lazy_compare, (left, right, metrics), dict()
+    try:
+        if timeout is None:
+            return compare_func(*args, **kwargs)
+        else:
+            return func_timeout(
+                timeout,
+                compare_func,
+                args=args,
+                kwargs=kwargs
+            )
+    except FunctionTimedOut:
+        return PRCSim(dict(), 'Comparison Timed Out', diff=None)
+    except Exception as e:
+        return PRCSim(dict(), str(e), diff=None)
+
+
+def _timed_batch_compare(pairs: Dict[int, Tuple[Any, Any]], timeout: Union[int, None]) -> Dict[int, PRCSim]:
+    """
+    Compare every pair with one call, under a timeout of `timeout` seconds per pair for the whole batch. When the batch
+    times out, the pairs that were already scored keep their results and only the rest are reported as timed out.
+    """
+    finished = dict()
+    try:
+        if timeout is None:
+            return batch_image_compare(pairs)
+        else:
+            return func_timeout(
+                timeout * len(pairs),
+                batch_image_compare,
+                args=(pairs,),
+                kwargs={'results': finished}
+            )
+    except FunctionTimedOut:
+        finished = dict(finished)
+        return {k: finished[k] if k in finished else PRCSim(dict(), 'Comparison Timed Out', diff=None)
+                for k in pairs.keys()}
+    except Exception as e:
+        return {k: PRCSim(dict(), str(e), diff=None) for k in pairs.keys()}
+
 # def _single_page_compare(pil1, pil2, full):
 #     """
 #     Function to compute the structural similarity of two pngs.
@@ -203,6 +461,11 @@ def _template_ssim(pil1, pil2, top_left):
     return ssim, diff
 
 
+def _render_shard(renderer: 'Renderer', pages: List[int]):
+    renders = renderer._render_range(pages)
+    return renders, renderer.logs, renderer._file_timed_out.get(RENDER, False)
+
+
 class Renderer(TextCompare, metaclass=Meta):
     """
     Abstract class for PDF renderers.
@@ -218,6 +481,12 @@ class Renderer(TextCompare, metaclass=Meta):
                  validate_hash,
                  dpi,
                  cache_renders,
+                 cache_budget=None,
+                 cache_spill=True,
+                 render_store=None,
+                 shards=1,
+                 colorspace='rgb',
+                 page_timeout=None,
                  *args,
                  **kwargs):
         """
@@ -227,6 +496,25 @@ class Renderer(TextCompare, metaclass=Meta):
             Set the dots-per-inch for the rendering
         cache_renders : bool
             Whether or not the renders should be cached in the object.
+        cache_budget : int
+            The maximum number of bytes of decoded renders to hold in memory when caching. Least recently used pages
+            beyond the budget are spilled to disk or dropped. None leaves the cache unbounded.
+        cache_spill : bool
+            Whether pages evicted from the render cache are spilled to compressed files in the temp folders directory
+            and reloaded on access, or dropped and re-rendered when requested again.
+        render_store : str or RenderStore
+            Directory of a render store shared by every process on the host. Pages found in the store are read from it
+            instead of being rendered and new renders are published to it.
+        shards : int
+            Split whole document renders into this many contiguous page ranges that are rendered concurrently. Each
+            range runs in its own process and is subject to its own timeout.
+        colorspace : {'rgb', 'gray'}
+            Colorspace of the renders. 'gray' has each backend render single channel 8-bit pages natively, which takes
+            a third of the memory, cache and store space of 'rgb'. The comparison metrics accept either.
+        page_timeout : int
+            Seconds a whole document render may go without finishing a page. The stuck page is then abandoned, the
+            pages finished so far are kept and rendering resumes after the stuck page. None applies the timeout to the
+            whole document as a single unit.
         page_hashes : int, Tuple
             Specify specific pages to hash or a specific scheme for selecting page hashes. Tuple can be `('first', x)`
             where x is the number of pages or `('random', x, [seed])` where x is the number of pages and seed is
@@ -246,12 +534,24 @@ class Renderer(TextCompare, metaclass=Meta):
                        'logs': '(Property) Any logs collected during the rendering process',
                        'caching': '(Property) Whether renders are cached or not',
                        'clear_renders': 'Clears any renders that have been cached inside this object',
+                       'cache_stats': '(Property) Hit, miss and eviction counters for the render cache',
                        'dpi': '(Property) The DPI setting for this object',
+                       'colorspace': '(Property) The colorspace of the renders, rgb or gray',
+                       'page_geometry': '(Property) The MediaBox, CropBox and rotation of each page',
                        'get_renders': 'Retrieve the render for the specified page or all pages if not specified',
+                       'iter_renders': 'Yield (page, render) pairs as soon as each page is rendered',
+                       'hash_renders': 'Yield small grayscale renders used to compute render hashes',
+                       'get_region': 'Render a rectangular region of a page at a chosen dpi',
                        'compare': 'Compare the renders for this object with the renders of another Renderer'}
         self._api.update(render_apis)
         self._full_doc_rendered = False
-        self._renders: Dict[int, PngImageFile] = dict()
+        self._renders: RenderCache = RenderCache(budget=cache_budget, spill=cache_spill,
+                                                 temp_folders_dir=temp_folders_dir)
+        self._render_store: Union[RenderStore, None] = _get_render_store(render_store)
+        self._shards = shards
+        assert colorspace in _COLORSPACES, "colorspace must be one of %s" % ', '.join(_COLORSPACES)
+        self._colorspace = colorspace
+        self._page_timeout = page_timeout
         self._dpi = dpi
         self._caching = cache_renders
         self._logs = dict()
@@ -312,9 +612,8 @@ class Renderer(TextCompare, metaclass=Meta):
         if RENDER not in self._sparclur_hash and RENDER not in self._sparclur_hash.excluded:
             pages = self._parse_page_hashes
             try:
-                renders = self.get_renders(pages)
                 hashes = dict()
-                for page, pil in renders.items():
+                for page, pil in self.hash_renders(pages):
                     hashes[page] = dhash(pil, hash_size=RENDER_HASH_SIZE)
             except:
                 hashes = dict()
@@ -410,7 +709,199 @@ class Renderer(TextCompare, metaclass=Meta):
         Clears any PIL's that have been retained in the renderer object.
         """
         self._full_doc_rendered = False
-        self._renders: Dict[int, PngImageFile] = dict()
+        self._renders.clear()
+
+    @property
+    def cache_budget(self):
+        """
+        Return the memory budget of the render cache in bytes
+        Returns
+        -------
+        int or None
+        """
+        return self._renders.budget
+
+    @cache_budget.setter
+    def cache_budget(self, budget: Union[int, None]):
+        """
+        Set the memory budget of the render cache. Pages over the new budget are evicted immediately.
+        Parameters
+        ----------
+        budget : int or None
+        """
+        self._renders.budget = budget
+
+    @property
+    def cache_stats(self):
+        """
+        Return the hit, miss, eviction, spill and reload counters of the render cache
+        Returns
+        -------
+        Dict[str, int]
+        """
+        return self._renders.stats
+
+    @property
+    def shards(self):
+        """
+        Return the number of page ranges whole document renders are split into
+        Returns
+        -------
+        int
+        """
+        return self._shards
+
+    @shards.setter
+    def shards(self, s: int):
+        """
+        Set the number of page ranges whole document renders are split into
+        Parameters
+        ----------
+        s : int
+        """
+        assert s is None or s > 0, "The number of shards must be positive"
+        self._shards = s
+
+    @property
+    def page_timeout(self):
+        """
+        Return the number of seconds a whole document render may go without finishing a page
+        Returns
+        -------
+        int
+        """
+        return self._page_timeout
+
+    @page_timeout.setter
+    def page_timeout(self, t: int):
+        """
+        Set the number of seconds a whole document render may go without finishing a page
+        Parameters
+        ----------
+        t : int
+        """
+        assert t is None or t > 0, "The page timeout must be positive"
+        self._page_timeout = t
+
+    @property
+    def colorspace(self):
+        """
+        Return the colorspace of the renders
+        Returns
+        -------
+        str
+        """
+        return self._colorspace
+
+    @colorspace.setter
+    def colorspace(self, c: str):
+        """
+        Set the colorspace of the renders. Cached renders are cleared when it changes.
+        Parameters
+        ----------
+        c : {'rgb', 'gray'}
+        """
+        assert c in _COLORSPACES, "colorspace must be one of %s" % ', '.join(_COLORSPACES)
+        if c != self._colorspace:
+            self.clear_renders()
+            self._colorspace = c
+
+    @property
+    def page_geometry(self) -> Dict[int, PageGeometry]:
+        """
+        Return the MediaBox, CropBox and rotation of each page, read without rendering. The geometry is computed once
+        per document and shared by every renderer in the process. `compare` uses it to skip rendering pages whose sizes
+        already rule out a match and to align renders of same sized pages.
+
+        Returns
+        -------
+        Dict[int, PageGeometry]
+        """
+        return _GEOMETRY_INDEX.get(self._doc, self._sparclur_hash.file_hash)
+
+    @property
+    def _gray(self):
+        return self._colorspace == 'gray'
+
+    @property
+    def _sharded(self):
+        return self._shards is not None and self._shards > 1 and self.num_pages > 1
+
+    def _page_ranges(self, num_pages: int) -> List[List[int]]:
+        shards = min(self._shards, num_pages)
+        bounds = [round(i * num_pages / shards) for i in range(shards + 1)]
+        return [list(range(bounds[i], bounds[i + 1])) for i in range(shards)]
+
+    def _render_range(self, pages: List[int]):
+        """
+        Renders a contiguous range of pages for a single shard of a sharded document render.
+
+        Returns
+        -------
+        Dict[int, PngImageFile or Image]
+        """
+        return self._render_pages(pages=pages)
+
+    def _shard_clone(self):
+        clone = copy.copy(self)
+        clone._renders = RenderCache(temp_folders_dir=self._temp_folders_dir)
+        clone._full_doc_rendered = False
+        clone._logs = dict()
+        clone._file_timed_out = dict()
+        clone._caching = False
+        clone._render_store = None
+        clone._shards = 1
+        return clone
+
+    def _render_sharded(self, processes: bool = False):
+        """
+        Renders the document as concurrent page ranges and merges the ranges back into a single page dictionary.
+
+        Parameters
+        ----------
+        processes : bool
+            Render each range in a worker process (for in-process libraries) instead of a thread that drives a
+            subprocess of its own.
+
+        Returns
+        -------
+        Dict[int, PngImageFile or Image]
+        """
+        ranges = self._page_ranges(self.num_pages)
+        result = dict()
+        timed_out = False
+        if processes:
+            clone = self._shard_clone()
+            with ProcessPool(max_workers=len(ranges), context=multiprocessing.get_context('spawn')) as pool:
+                futures = [(pages, time.perf_counter(),
+                            pool.schedule(_render_shard, args=(clone, pages),
+                                          timeout=None if self._timeout is None else self._timeout * len(pages)))
+                           for pages in ranges]
+                for (pages, start_time, future) in futures:
+                    try:
+                        renders, logs, range_timed_out = future.result()
+                        result.update(renders)
+                        self._logs.update(logs)
+                        timed_out = timed_out or range_timed_out
+                    except TimeoutError:
+                        self._logs[pages[0]] = {'result': 'Timed out', 'timing': self._timeout * len(pages)}
+                        timed_out = True
+                    except Exception as e:
+                        self._logs[pages[0]] = {'result': str(e), 'timing': time.perf_counter() - start_time}
+        else:
+            # Each thread renders with a clone of its own, so the logs and timeout flag of one range are not
+            # overwritten by another
+            clones = [self._shard_clone() for _ in ranges]
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                for (renders, logs, range_timed_out) in executor.map(_render_shard, clones, ranges):
+                    result.update(renders)
+                    self._logs.update(logs)
+                    timed_out = timed_out or range_timed_out
+        self._file_timed_out[RENDER] = timed_out
+        if self._caching:
+            self._full_doc_rendered = True
+            self._renders.update(result)
+        return dict(sorted(result.items()))
 
     @property
     def dpi(self):
@@ -425,11 +916,13 @@ class Renderer(TextCompare, metaclass=Meta):
     @dpi.setter
     def dpi(self, new_dpi):
         """
-        Set dots per inch for the renders
+        Set dots per inch for the renders. Renders cached at another dpi are cleared.
         Parameters
         ----------
         new_dpi : int
         """
+        if new_dpi != self._dpi:
+            self.clear_renders()
         self._dpi = new_dpi
 
     @abc.abstractmethod
@@ -470,6 +963,79 @@ class Renderer(TextCompare, metaclass=Meta):
         """
         pass
 
+    def _render_params(self, page: int) -> Dict[str, Any]:
+        """
+        Any renderer settings, other than the dpi, that change the raster of the page. Used to key shared renders.
+        """
+        return dict()
+
+    def _store_key(self, page: int):
+        params = self._render_params(page)
+        if self._gray:
+            params['colorspace'] = self._colorspace
+        return RenderStore.key(self._sparclur_hash.file_hash, self.get_name(), self._dpi, page, **params)
+
+    def _from_store(self, pages):
+        found = dict()
+        for page in pages:
+            stored = self._render_store.get(self._store_key(page))
+            if stored is not None:
+                pil, log = stored
+                found[page] = pil
+                self._logs[page] = log
+                if self._caching:
+                    self._renders[page] = pil
+        if len(found) > 0 and RENDER not in self._file_timed_out:
+            self._file_timed_out[RENDER] = False
+        return found
+
+    def _publish(self, renders):
+        for (page, pil) in renders.items():
+            if pil is not None and page in self._logs:
+                self._render_store.put(self._store_key(page), pil, self._logs[page])
+
+    def _fetch_page(self, page: int):
+        if self._render_store is None:
+            return self._render_page(page=page)
+        found = self._from_store([page])
+        if page in found:
+            return found[page]
+        pil = self._render_page(page=page)
+        self._publish({page: pil})
+        return pil
+
+    def _fetch_pages(self, pages: List[int]):
+        if self._render_store is None:
+            return self._render_pages(pages=pages)
+        result = self._from_store(pages)
+        missing_pages = [page for page in pages if page not in result]
+        if len(missing_pages) > 0:
+            renders = self._render_pages(pages=missing_pages)
+            self._publish(renders)
+            result.update(renders)
+        return result
+
+    def _fetch_doc(self):
+        num_pages = self.num_pages if self._render_store is not None else 0
+        if num_pages == 0:
+            renders = self._render_doc()
+            if self._render_store is not None:
+                self._publish(renders)
+            return renders
+        result = self._from_store(range(num_pages))
+        if len(result) == 0:
+            renders = self._render_doc()
+            self._publish(renders)
+            return renders
+        missing_pages = [page for page in range(num_pages) if page not in result]
+        if len(missing_pages) > 0:
+            renders = self._render_pages(pages=missing_pages)
+            self._publish(renders)
+            result.update(renders)
+        if self._caching:
+            self._full_doc_rendered = True
+        return result
+
     def get_renders(self, page: Union[int, List[int]] = None):
         """
         Return the renders of the object document. If page is None, return the entire rendered document. Otherwise
@@ -487,25 +1053,28 @@ class Renderer(TextCompare, metaclass=Meta):
         if self._renders:
             if page is not None:
                 if isinstance(page, int):
-                    if page in self._renders:
-                        result = self._renders[page]
-                    else:
-                        result = self._render_page(page=page)
+                    result = self._renders.get(page)
+                    if result is None:
+                        result = self._fetch_page(page=page)
                 else:
                     result = dict()
                     missing_pages = []
                     for p in page:
-                        if p in self._renders:
-                            result[p] = self._renders[p]
+                        pil = self._renders.get(p)
+                        if pil is not None:
+                            result[p] = pil
                         else:
                             missing_pages.append(p)
-                    remaining_renders = self._render_pages(pages=missing_pages) if len(missing_pages) > 0 else dict()
+                    remaining_renders = self._fetch_pages(pages=missing_pages) if len(missing_pages) > 0 else dict()
                     result.update(remaining_renders)
             else:
                 if self._full_doc_rendered:
-                    result = self._renders
+                    dropped = self._renders.dropped
+                    result = dict(self._renders.items())
+                    if len(dropped) > 0:
+                        result.update(self._fetch_pages(pages=sorted(dropped)))
                 else:
-                    result = self._render_doc()
+                    result = self._fetch_doc()
         else:
             if self._full_doc_rendered:
                 if page is not None:
@@ -514,16 +1083,367 @@ class Renderer(TextCompare, metaclass=Meta):
                     result = dict()
             elif page is not None:
                 if isinstance(page, int):
-                    result = self._render_page(page=page)
+                    result = self._fetch_page(page=page)
                 else:
-                    result = self._render_pages(pages=page)
+                    result = self._fetch_pages(pages=page)
+            else:
+                result = self._fetch_doc()
+        return result
+
+    def iter_renders(self, pages: Union[int, List[int]] = None) -> Iterator[Tuple[int, Any]]:
+        """
+        Yield the renders of the object document one page at a time, in page order, as soon as each page is available.
+        Unlike `get_renders` only the page currently being processed needs to be held in memory unless caching is on.
+
+        Parameters
+        ----------
+        pages: int, List[int], or None
+            zero-indexed page or list of pages to be rendered. Iterates over the whole document if None
+        Returns
+        -------
+        Iterator[Tuple[int, PngImageFile or Image]]
+        """
+        assert self._skip_check or self._check_for_renderer(), "%s not found" % self.get_name()
+        if isinstance(pages, int):
+            pages = [pages]
+        if pages is None and self._full_doc_rendered:
+            pages = list(self._renders.keys()) + list(self._renders.dropped)
+        if pages is None:
+            cached = iter(())
+            rendered = self._iter_stream(None)
+        else:
+            pages = sorted(set(pages))
+            cached_pages = [page for page in pages if page in self._renders]
+            missing_pages = [page for page in pages if page not in self._renders]
+            cached = ((page, self._renders[page]) for page in cached_pages)
+            rendered = self._iter_stream(missing_pages) if len(missing_pages) > 0 else iter(())
+        for (page, pil) in heapq.merge(cached, rendered, key=lambda entry: entry[0]):
+            yield page, pil
+        if pages is None and self._caching:
+            self._full_doc_rendered = True
+
+    def _iter_stream(self, pages: Union[List[int], None]):
+        if self._render_store is not None and pages is None and self.num_pages > 0:
+            pages = list(range(self.num_pages))
+        if self._render_store is not None and pages is not None:
+            stored = [page for page in pages if self._store_key(page) in self._render_store]
+        else:
+            stored = []
+        to_render = None if pages is None else [page for page in pages if page not in stored]
+        from_store = ((page, self._from_store([page]).get(page)) for page in stored)
+        rendered = self._iter_render_pages(to_render) if to_render is None or len(to_render) > 0 else iter(())
+        for (page, pil) in heapq.merge(from_store, rendered, key=lambda entry: entry[0]):
+            if pil is None:
+                continue
+            if page not in stored:
+                if self._caching:
+                    self._renders[page] = pil
+                if self._render_store is not None:
+                    self._publish({page: pil})
+            yield page, pil
+
+    def _iter_render_pages(self, pages: Union[List[int], None]):
+        """
+        Renders the specified pages, or the whole document if None, yielding each page in order as soon as it is done.
+        Renderers that can report progress on a whole document render should override this.
+
+        Returns
+        -------
+        Iterator[Tuple[int, PngImageFile or Image]]
+        """
+        if pages is None:
+            num_pages = self.num_pages
+            if num_pages == 0:
+                for (page, pil) in sorted(self._render_doc().items(), key=lambda entry: entry[0]):
+                    yield page, pil
+                return
+            pages = range(num_pages)
+        for page in pages:
+            pil = self._render_page(page)
+            if pil is not None:
+                yield page, pil
+
+    def hash_renders(self, pages: Union[int, List[int]] = None,
+                     hash_size: int = RENDER_HASH_SIZE) -> Iterator[Tuple[int, Image.Image]]:
+        """
+        Yield small grayscale renders of the document that are only meant to be hashed. Each backend draws the page
+        directly at a few times the hash resolution, so computing render signatures costs a fraction of a full render.
+        Every backend sizes each page from its own geometry. These renders are neither cached nor logged. The render
+        hashes of a SPARCLUR hash are computed from them, which is version 2 of the render hashes (RENDER_HASH_VERSION).
+
+        Parameters
+        ----------
+        pages: int, List[int], or None
+            zero-indexed page or list of pages to be rendered. Iterates over the whole document if None
+        hash_size: int
+            The hash size the renders will be reduced to
+        Returns
+        -------
+        Iterator[Tuple[int, Image]]
+        """
+        if isinstance(pages, int):
+            pages = [pages]
+        elif pages is not None:
+            pages = sorted(set(pages))
+        return self._iter_hash_renders(pages, _hash_render_size(hash_size))
+
+    def _iter_hash_renders(self, pages: Union[List[int], None], size: int):
+        """
+        Yield grayscale renders with the longer side about `size` pixels. Backends override this with a native low
+        resolution grayscale render; the fallback converts the regular renders.
+        """
+        for (page, pil) in self.iter_renders(pages):
+            yield page, pil.convert('L')
+
+    def _hash_dpi_runs(self, pages: Union[List[int], None], size: int) -> List[Tuple[int, Union[List[int], None]]]:
+        """
+        Split the pages to hash, in order, into runs of pages that share a hash render dpi, computed from the geometry
+        of each page, for backends that can only be given one resolution per command.
+
+        Returns
+        -------
+        List[Tuple[int, List[int] or None]]
+            The dpi of each run and its pages. A single run of None stands for the whole document when its page count
+            is unknown.
+        """
+        geometry = self.page_geometry
+        if pages is None:
+            if self.num_pages == 0:
+                return [(_hash_render_dpi(size), None)]
+            pages = range(self.num_pages)
+        runs = []
+        for page in pages:
+            dpi = _hash_render_dpi(size, geometry.get(page))
+            if len(runs) > 0 and runs[-1][0] == dpi:
+                runs[-1][1].append(page)
             else:
-                result = self._render_doc()
+                runs.append((dpi, [page]))
+        return runs
+
+    def get_region(self, page: int, bbox: Tuple[float, float, float, float], dpi: int = None) -> Image.Image:
+        """
+        Render only a rectangular region of a page. Backends that support clipping draw just the region, so a small
+        area can be inspected at a high dpi without rendering the whole page at that resolution. Region renders are
+        neither cached nor logged.
+
+        Parameters
+        ----------
+        page : int
+            Zero-indexed page
+        bbox : Tuple[float, float, float, float]
+            The region as (x0, y0, x1, y1) in PDF points (1/72 inch) measured from the top left corner of the rendered
+            page. Multiply a pixel box from a render by 72 / dpi of that render to get its bbox.
+        dpi : int
+            The resolution of the region render. Defaults to the dpi of the renderer.
+        Returns
+        -------
+        Image or None
+            The region render or None if the page could not be rendered
+        """
+        assert self._skip_check or self._check_for_renderer(), "%s not found" % self.get_name()
+        x0, y0, x1, y1 = bbox
+        assert x1 > x0 and y1 > y0, "The region must have a positive width and height"
+        dpi = self._dpi if dpi is None else dpi
+        try:
+            return self._render_region(page, (x0, y0, x1, y1), dpi)
+        except Exception:
+            return None
+
+    def _render_region(self, page: int, bbox: Tuple[float, float, float, float], dpi: int) -> Image.Image:
+        """
+        Render the region of the page given in points at the given dpi. Backends that can clip while drawing override
+        this; the fallback renders the full page at the region dpi and crops it.
+        """
+        clone = self._shard_clone()
+        clone._dpi = dpi
+        if getattr(clone, '_size', None) is not None:
+            clone._size = None
+        pil = clone._render_page(page)
+        if pil is None:
+            return None
+        return pil.crop(_region_pixels(bbox, dpi / 72, pil.size))
+
+    def _stream_subprocess(self, args: List[str], out_dir: str, page_index: Callable[[str], Union[int, None]],
+                           pages: Union[List[int], None] = None, first_page: int = 0, log: bool = True,
+                           stderr: Union[List[Tuple[int, bytes]], None] = None):
+        """
+        Run a render command that writes one numbered image per page into `out_dir` and yield `(page, render)` as each
+        page is completed. Each file is decoded and deleted as soon as it is handed over.
+
+        Parameters
+        ----------
+        args : List[str]
+            The render command
+        out_dir : str
+            The directory the command writes its page images to
+        page_index : Callable[[str], int or None]
+            Maps an output file name to the zero-indexed position of the page in the rendered range
+        pages : List[int] or None
+            The pages to yield. All rendered pages are yielded if None
+        first_page : int
+            The zero-indexed page the command starts rendering at
+        log : bool
+            Whether to record the results in the render logs
+        stderr : List[Tuple[int, bytes]] or None
+            If given, the exit code and the stderr output of the command are appended to it once the command ends.
+            The output is spooled to a temporary file so a chatty command cannot block on a full pipe.
+
+        Returns
+        -------
+        int or None
+            The page the command was stuck on when it timed out or None if it finished. This can be a page in a gap
+            between the requested pages; a resumed render then starts at the next requested page.
+        """
+        timeout = self._timeout or 600
+        err_file = None if stderr is None else tempfile.TemporaryFile(dir=self._temp_folders_dir)
+        try:
+            sp = subprocess.Popen(args, stderr=DEVNULL if err_file is None else err_file, stdout=DEVNULL, shell=False)
+        except Exception as e:
+            if err_file is not None:
+                err_file.close()
+            if log:
+                self._logs[first_page] = {'result': str(e), 'timing': 0}
+            return None
+        last_page = first_page - 1
+        start_time = time.perf_counter()
+        try:
+            for (i, path) in _stream_output_files(sp, out_dir, page_index, timeout,
+                                                  progress_timeout=self._page_timeout):
+                page = i + first_page
+                if pages is not None and page not in pages:
+                    # A page in a gap the run renders through; it is neither decoded, logged nor handed over
+                    os.remove(path)
+                    last_page = page
+                    continue
+                try:
+                    pil = _load_image(path)
+                except Exception:
+                    # Only a file cut off by a timeout fails to load; the page is reported as the stuck page below
+                    continue
+                finally:
+                    os.remove(path)
+                last_page = page
+                if log:
+                    timing = time.perf_counter() - start_time
+                    self._logs[page] = {'result': _SUCCESSFUL_RENDER_MESSAGE, 'timing': timing}
+                start_time = time.perf_counter()
+                yield page, pil
+            if log:
+                self._file_timed_out[RENDER] = False
+            return None
+        except TimeoutExpired as e:
+            if log:
+                # The command may be stuck on a gap page, which counts against the next page that was asked for
+                requested = [page for page in pages if page > last_page] if pages is not None else []
+                timed_out_page = min(requested) if len(requested) > 0 else last_page + 1
+                self._logs[timed_out_page] = {'result': 'Timed out', 'timing': e.timeout}
+                self._file_timed_out[RENDER] = True
+            return last_page + 1
+        finally:
+            if sp.poll() is None:
+                sp.kill()
+                sp.communicate()
+            if err_file is not None:
+                err_file.seek(0)
+                stderr.append((sp.returncode, err_file.read()))
+                err_file.close()
+
+    def _stream_salvaging(self, pages: Union[List[int], None], stream_range: Callable, log: bool = True):
+        """
+        Stream a set of pages with `stream_range`, one call per run planned by `_plan_page_runs`. When a page timeout
+        is set and the render gets stuck on a page, the pages finished so far are kept and rendering resumes with the
+        pages after the stuck page.
+
+        Parameters
+        ----------
+        pages : List[int] or None
+            The pages to render or None for the whole document
+        stream_range : Callable
+            Generator function taking a list of pages (or None) and a `stderr` list for `_stream_subprocess`,
+            yielding `(page, render)` and returning the stuck page if it timed out
+        log : bool
+            Whether the stream records its results in the render logs. The messages of a logged render of the whole
+            document are handed to `_collect_stream_messages`.
+        """
+        stderr = [] if log and pages is None else None
+        if pages is None and self._page_timeout is not None and self.num_pages > 0:
+            pages = list(range(self.num_pages))
+        runs = [pages] if pages is None else _plan_page_runs(pages)
+        timed_out = False
+        for remaining in runs:
+            while True:
+                stuck = yield from stream_range(remaining, stderr=stderr)
+                if stuck is None:
+                    break
+                timed_out = True
+                if self._page_timeout is None or remaining is None:
+                    break
+                remaining = [page for page in remaining if page > stuck]
+                if len(remaining) == 0:
+                    break
+        if log and timed_out:
+            self._file_timed_out[RENDER] = True
+        if stderr is not None:
+            self._collect_stream_messages(stderr, timed_out)
+
+    def _collect_stream_messages(self, stderr: List[Tuple[int, bytes]], timed_out: bool):
+        """
+        Receives the exit code and stderr output of every command of a streamed render of the whole document.
+        Backends whose render messages double as their trace override this to record them, as their non-streamed
+        renders do.
+        """
+        pass
+
+    def _render_runs(self, runs: List[List[int]], render_range: Callable[[List[int]], Dict[int, Any]]):
+        """
+        Render each planned run of pages with `render_range` and merge the results.
+
+        Returns
+        -------
+        Dict[int, PngImageFile or Image]
+        """
+        result = dict()
+        timed_out = False
+        for run in runs:
+            result.update(render_range(run))
+            timed_out = timed_out or self._file_timed_out.get(RENDER, False)
+        self._file_timed_out[RENDER] = timed_out
         return result
 
-    def compare(self, other: 'Renderer', page=None, full=False):
+    def _render_streamed(self, pages: Union[List[int], None] = None):
+        """
+        Renders a whole document or range by collecting the page stream, so a page timeout only costs the stuck page.
+
+        Returns
+        -------
+        Dict[int, PngImageFile or Image]
+        """
+        renders = dict(self._iter_render_pages(pages))
+        if self._caching:
+            if pages is None:
+                self._full_doc_rendered = True
+            self._renders.update(renders)
+        return renders
+
+    def _page_features(self, page: int, pil) -> Union[RenderFeatures, None]:
         """
-        Performs a structural similarity comparison between two renders
+        Return the feature bundle of a page render. While caching, the bundle is kept in the render cache entry of the
+        page so every comparison the page takes part in reuses its hashes and entropy, and it is evicted with the page.
+        """
+        if pil is None:
+            return None
+        if not self._caching:
+            return RenderFeatures(pil)
+        features = self._renders.get_features(page)
+        if features is None or features.pil is not pil:
+            features = RenderFeatures(pil)
+            self._renders.set_features(page, features)
+        return features
+
+    def compare(self, other: 'Renderer', page=None, full=False, batch=False, diff_threshold=None,
+                skip_geometry_mismatch=False):
+        """
+        Performs a structural similarity comparison between two renders.
 
         Parameters
         ----------
@@ -534,48 +1454,82 @@ class Renderer(TextCompare, metaclass=Meta):
             If 'None', all pages are compared.
         full : bool, default=False
             Return an image of the comparison of the two document renders for each page or the specified page.
+        batch : bool, default=False
+            Compare all of the pages with one call to `batch_image_compare` under a single timeout instead of one
+            timed comparison per page. Ignored when `full` is set.
+        diff_threshold : float, default=None
+            With `full`, only generate the comparison image for pages whose similarity is at or below this threshold.
+        skip_geometry_mismatch : bool, default=False
+            Report pages whose boxes make their sizes too different to match as a page geometry mismatch without
+            rendering them. The boxes are always read with MuPDF, so a page that another backend draws at a
+            different size than MuPDF would is not caught by this check and is still rendered and compared.
 
         Returns
         -------
         Dict[int, PRCSim] or PRCSim
         """
-        if page is not None:
-            if isinstance(page, int):
-                left = {page: self.get_renders(page=page)}
-                right = {page: other.get_renders(page=page)}
-            else:
-                left = self.get_renders(page)
-                right = self.get_renders(page)
+        requested = None if page is None else [page] if isinstance(page, int) else list(page)
+        incomparable = dict()
+        if skip_geometry_mismatch:
+            left_geometry = self.page_geometry
+            right_geometry = other.page_geometry
+        else:
+            left_geometry = right_geometry = dict()
+        for k in (left_geometry.keys() if requested is None else requested):
+            if k in left_geometry and k in right_geometry:
+                geometry_sim = left_geometry[k].size_sim(right_geometry[k])
+                if geometry_sim < _GEOMETRY_MISMATCH_SIZE_SIM:
+                    incomparable[k] = PRCSim({'size_sim': geometry_sim}, 'Page geometry mismatch', diff=None)
+
+        if isinstance(page, int):
+            if page in incomparable:
+                return incomparable[page]
+            left = {page: self.get_renders(page=page)}
+            right = {page: other.get_renders(page=page)}
+        elif len(incomparable) == 0:
+            left = self.get_renders() if page is None else self.get_renders(page)
+            right = other.get_renders() if page is None else other.get_renders(page)
         else:
-            left = self.get_renders()
-            right = other.get_renders()
+            # Pages whose boxes already rule out a match are not rendered
+            left_pages = list(range(self.num_pages)) if requested is None else requested
+            right_pages = list(range(other.num_pages)) if requested is None else requested
+            left_pages = [k for k in left_pages if k not in incomparable]
+            right_pages = [k for k in right_pages if k not in incomparable]
+            left = self.get_renders(left_pages) if len(left_pages) > 0 else dict()
+            right = other.get_renders(right_pages) if len(right_pages) > 0 else dict()
 
-        keyset = {*left}.union({*right})
+        keyset = {*left}.union({*right}).union({*incomparable})
         if len(keyset) == 0:
             empty_sim = PRCSim(dict(), 'No comparisons to make', diff=None)
-            if page is None:
+            if not isinstance(page, int):
                 return {0: empty_sim}
             else:
                 return empty_sim
         result = dict()
-        for k in keyset:
-            try:
-                if self._timeout is None:
-                    result[k] = image_compare(left.get(k, None), right.get(k, None), full)
-                else:
-                    result[k] = func_timeout(
-                        self._timeout,
-                        image_compare,
-                        args=(left.get(k, None), right.get(k, None), full)
-                    )
-            except FunctionTimedOut:
-                result[k] = PRCSim(dict(), 'Comparison Timed Out', diff=None)
-            except Exception as e:
-                result[k] = PRCSim(dict(), e.message, diff=None)
-        return result if page is None else result[page]
+        pairs = dict()
+        for k in sorted(keyset):
+            if k in incomparable:
+                result[k] = incomparable[k]
+                continue
+            left_pil, right_pil = left.get(k, None), right.get(k, None)
+            aligned_left, aligned_right = _align_renders(k, self, left_pil, other, right_pil)
+            left_features = self._page_features(k, left_pil) if aligned_left is left_pil else aligned_left
+            right_features = other._page_features(k, right_pil) if aligned_right is right_pil else aligned_right
+            if batch and not full:
+                pairs[k] = (left_features, right_features)
+            else:
+                result[k] = _timed_compare(left_features, right_features, full, self._timeout,
+                                           diff_threshold=diff_threshold)
+        if len(pairs) > 0:
+            result.update(_timed_batch_compare(pairs, self._timeout))
+            result = {k: result[k] for k in sorted(keyset)}
+        # The features kept with the cached pages grew while comparing
+        self._renders.trim()
+        other._renders.trim()
+        return result[page] if isinstance(page, int) else result
 
     def _extract_doc(self):
-        for (page, pil) in self.get_renders().items():
+        for (page, pil) in self.iter_renders():
             self._text[page] = _ocr_text(pil)
         self._full_text_extracted = True
 
@@ -20,6 +20,8 @@ def _render_compare_worker(entry):
     right_version, right_raw = entry['right']
     parser = entry['parser']
     parser_args = entry['parser_args']
+    if entry.get('render_store') is not None:
+        parser_args = dict(parser_args, render_store=entry['render_store'])
     left = get_parser(parser)(left_raw, **parser_args)
     right = get_parser(parser)(right_raw, **parser_args)
     page_sims = left.compare(right)
@@ -171,7 +173,8 @@ class RollBack:
                         timeout=120,
                         display_width=10,
                         display_height=10,
-                        ncols=5):
+                        ncols=5,
+                        render_store=None):
         """
         Compares the renders between subsequent versions of incremental updates. If the versions are not specified and
         there are more than 11 versions detected, only the lastest 11 versions will be compared. The rendering
@@ -200,6 +203,9 @@ class RollBack:
             The height of the resulting plot
         ncols : int
             The number of columns in the final subplot of comparisons.
+        render_store : str or RenderStore
+            Directory of a shared render store. Each version appears in two neighboring comparisons and is only
+            rendered once when a store is given.
 
         Returns
         -------
@@ -231,7 +237,8 @@ class RollBack:
             entry = {'left': (version, self.get_version(version)),
                      'right': (versions[idx+1], self.get_version(versions[idx+1])),
                      'parser': parser,
-                     'parser_args': parser_args}
+                     'parser_args': parser_args,
+                     'render_store': render_store}
             comparisons.append(entry)
         if num_workers == 1:
             render_diffs = dict()
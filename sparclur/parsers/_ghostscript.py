@@ -7,16 +7,17 @@ import shlex
 import tempfile
 import time
 import warnings
+from functools import partial
 from typing import Dict, Tuple, List, Union, Any
 
 #import ghostscript as external_gs
-from PIL import Image
 from PIL.PngImagePlugin import PngImageFile
 import yaml
 
 from sparclur._reforge import Reforger
 from sparclur._renderer import Renderer
-from sparclur._renderer import _SUCCESSFUL_RENDER_MESSAGE as SUCCESS
+from sparclur._renderer import _SUCCESSFUL_RENDER_MESSAGE as SUCCESS, _load_image, \
+    _output_page_parser, _region_pixels
 from sparclur._parser import VALID, REJECTED, REJECTED_AMBIG, RENDER, TIMED_OUT
 from sparclur.utils import hash_file
 from sparclur.utils._config import _get_config_param, _load_config
@@ -29,6 +30,12 @@ class Ghostscript(Renderer, Reforger):
                  dpi: int = None,
                  size: Union[Tuple[int], int, None] = None,
                  cache_renders: bool = None,
+                 cache_budget: int = None,
+                 cache_spill: bool = None,
+                 render_store: str = None,
+                 shards: int = None,
+                 colorspace: str = None,
+                 page_timeout: int = None,
                  timeout: int = None,
                  hash_exclude: Union[str, List[str], None] = None,
                  page_hashes: Union[int, Tuple[Any], None] = None,
@@ -46,6 +53,12 @@ class Ghostscript(Renderer, Reforger):
         dpi = _get_config_param(Ghostscript, config, 'dpi', dpi, 200)
         size = _get_config_param(Ghostscript, config, 'size', size, None)
         cache_renders = _get_config_param(Ghostscript, config, 'cache_renders', cache_renders, False)
+        cache_budget = _get_config_param(Ghostscript, config, 'cache_budget', cache_budget, None)
+        cache_spill = _get_config_param(Ghostscript, config, 'cache_spill', cache_spill, True)
+        render_store = _get_config_param(Ghostscript, config, 'render_store', render_store, None)
+        shards = _get_config_param(Ghostscript, config, 'shards', shards, 1)
+        colorspace = _get_config_param(Ghostscript, config, 'colorspace', colorspace, 'rgb')
+        page_timeout = _get_config_param(Ghostscript, config, 'page_timeout', page_timeout, None)
         timeout = _get_config_param(Ghostscript, config, 'timeout', timeout, None)
         hash_exclude = _get_config_param(Ghostscript, config, 'hash_exclude', hash_exclude, None)
 
@@ -57,6 +70,12 @@ class Ghostscript(Renderer, Reforger):
                          validate_hash=validate_hash,
                          dpi=dpi,
                          cache_renders=cache_renders,
+                         cache_budget=cache_budget,
+                         cache_spill=cache_spill,
+                         render_store=render_store,
+                         shards=shards,
+                         colorspace=colorspace,
+                         page_timeout=page_timeout,
                          verbose=True,
                          timeout=timeout)
         # self._ghostscript_present = 'ghostscript' in sys.modules.keys()
@@ -204,7 +223,7 @@ class Ghostscript(Renderer, Reforger):
                         "-dBATCH",
                         "-dUseCropBox",
                         "-dNOPAUSE",
-                        "-sDEVICE=png16m",
+                        self._gs_device,
                         "-dTextAlphaBits=4",
                         "-dFirstPage="+str(page + 1),
                         "-dLastPage="+str(page + 1),
@@ -226,7 +245,7 @@ class Ghostscript(Renderer, Reforger):
                 args.append(doc_path)
 
                 subprocess.run(args, timeout=self._timeout or 600, shell=False)
-                pil = Image.open(os.path.join(tmpdir, "out.png"))
+                pil = _load_image(os.path.join(tmpdir, "out.png"))
                 if self._caching:
                     self._renders[page] = pil
                 timing = time.perf_counter() - start_time
@@ -245,10 +264,112 @@ class Ghostscript(Renderer, Reforger):
             #     external_gs.cleanup()
         return pil
 
+    def _render_region(self, page, bbox, dpi):
+        geometry = self.page_geometry.get(page)
+        if geometry is None:
+            return super()._render_region(page, bbox, dpi)
+        # The output device is sized to the region and the page is shifted so the region lands on it. PostScript
+        # measures from the bottom left, so the shift is taken from the height of the rendered page.
+        page_width, page_height = geometry.pixel_size(dpi)
+        x0, y0, x1, y1 = _region_pixels(bbox, dpi / 72, (page_width, page_height))
+        offset_x = -x0 * 72 / dpi
+        offset_y = -(page_height - y1) * 72 / dpi
+        with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as tmpdir:
+            if isinstance(self._doc, bytes):
+                doc_path = os.path.join(tmpdir, hash_file(self._doc))
+                with open(doc_path, 'wb') as doc_out:
+                    doc_out.write(self._doc)
+            else:
+                doc_path = self._doc
+            out_path = os.path.join(tmpdir, "region.png")
+            args = ["gs",
+                    "-dSAFER",
+                    "-dBATCH",
+                    "-dUseCropBox",
+                    "-dNOPAUSE",
+                    self._gs_device,
+                    "-dTextAlphaBits=4",
+                    "-dFirstPage=" + str(page + 1),
+                    "-dLastPage=" + str(page + 1),
+                    "-r" + str(dpi),
+                    "-g%ix%i" % (x1 - x0, y1 - y0),
+                    "-dFIXEDMEDIA",
+                    "-sOutputFile=" + out_path,
+                    "-c", "<</PageOffset [%f %f]>> setpagedevice" % (offset_x, offset_y),
+                    "-f", doc_path]
+            try:
+                subprocess.run(args, timeout=self._timeout or 600, shell=False, stdout=DEVNULL, stderr=DEVNULL)
+            except TimeoutExpired:
+                return None
+            return _load_image(out_path) if os.path.isfile(out_path) else None
+
     def _render_doc(self):
+        if self._sharded:
+            return self._render_sharded()
+        if self._page_timeout is not None:
+            return self._render_streamed()
+        pils = self._gs_render(pages=None)
+        if self._caching:
+            self._full_doc_rendered = True
+            self._renders.update(pils)
+        return pils
 
-        start_time = time.perf_counter()
+    def _render_range(self, pages):
+        if self._page_timeout is not None:
+            return dict(self._iter_render_pages(pages))
+        return self._gs_render(pages=pages)
+
+    @property
+    def _gs_device(self):
+        return "-sDEVICE=pnggray" if self._gray else "-sDEVICE=png16m"
+
+    def _gs_args(self, pages, doc_path, out_dir, hash_dpi=None):
+        if hash_dpi is not None:
+            device = "-sDEVICE=pnggray"
+            dpi = hash_dpi
+        else:
+            device = self._gs_device
+            dpi = self._dpi
+        args = ["gs",
+                "-dSAFER",
+                "-dBATCH",
+                "-dUseCropBox",
+                "-dNOPAUSE",
+                device,
+                "-dTextAlphaBits=4",
+                "-r%s" % dpi]
+        if pages is not None:
+            args.extend(["-dFirstPage=%i" % (min(pages) + 1), "-dLastPage=%i" % (max(pages) + 1)])
+
+        if hash_dpi is not None:
+            size = None
+        elif isinstance(self._size, dict):
+            warnings.warn("""Ghostscript does not support page specific sizing when rendering the entire 
+                document. If you want to size each page individually render each page individually. The 
+                first size will be selected from the dictionary for this rendering attempt.""")
+            sizes = [self._size.values()]
+            size = sizes[0] if len(sizes) > 0 else None
+        else:
+            size = self._size
+        if size is not None:
+            if isinstance(size, tuple):
+                size_arg = "-g%sx%s" % (str(size[0]), str(size[1]))
+            else:
+                size_arg = "-g%sx%s" % (str(size), str(size))
+            args.append(size_arg)
+
+        args.append("-sOutputFile="+os.path.join(out_dir, "page-%04d.png"))
+        args.append(doc_path)
+        return args
 
+    def _iter_render_pages(self, pages):
+        return self._stream_salvaging(pages, self._stream_gs)
+
+    def _iter_hash_renders(self, pages, size):
+        for (dpi, run) in self._hash_dpi_runs(pages, size):
+            yield from self._stream_salvaging(run, partial(self._stream_gs, hash_dpi=dpi), log=False)
+
+    def _stream_gs(self, pages, hash_dpi=None, stderr=None):
         with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as tmpdir:
             if isinstance(self._doc, bytes):
                 file_hash = hash_file(self._doc)
@@ -257,46 +378,39 @@ class Ghostscript(Renderer, Reforger):
                     doc_out.write(self._doc)
             else:
                 doc_path = self._doc
-            try:
-                args = ["gs",
-                        "-dSAFER",
-                        "-dBATCH",
-                        "-dUseCropBox",
-                        "-dNOPAUSE",
-                        "-sDEVICE=png16m",
-                        "-dTextAlphaBits=4",
-                        "-r%s" % self._dpi]
+            out_dir = os.path.join(tmpdir, 'renders')
+            os.mkdir(out_dir)
+            args = self._gs_args(pages, doc_path, out_dir, hash_dpi=hash_dpi)
+            stuck = yield from self._stream_subprocess(args, out_dir, _output_page_parser('page-', '.png'),
+                                                       pages=pages, first_page=0 if pages is None else min(pages),
+                                                       log=hash_dpi is None)
+        return stuck
 
-                if isinstance(self._size, dict):
-                    warnings.warn("""Ghostscript does not support page specific sizing when rendering the entire 
-                        document. If you want to size each page individually render each page individually. The 
-                        first size will be selected from the dictionary for this rendering attempt.""")
-                    sizes = [self._size.values()]
-                    size = sizes[0] if len(sizes) > 0 else None
-                else:
-                    size = self._size
-                if size is not None:
-                    if isinstance(size, tuple):
-                        size_arg = "-g%sx%s" % (str(size[0]), str(size[1]))
-                    else:
-                        size_arg = "-g%sx%s" % (str(size), str(size))
-                    args.append(size_arg)
+    def _gs_render(self, pages=None):
 
-                args.append("-sOutputFile="+os.path.join(tmpdir, "page-%04d.png"))
-                args.append(doc_path)
+        start_time = time.perf_counter()
+        first_page = 0 if pages is None else min(pages)
+
+        with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as tmpdir:
+            if isinstance(self._doc, bytes):
+                file_hash = hash_file(self._doc)
+                doc_path = os.path.join(tmpdir, file_hash)
+                with open(doc_path, 'wb') as doc_out:
+                    doc_out.write(self._doc)
+            else:
+                doc_path = self._doc
+            try:
+                args = self._gs_args(pages, doc_path, tmpdir)
                 subprocess.run(args, timeout=self._timeout or 600, shell=False)
 
                 pils: Dict[int, PngImageFile] = dict()
                 for png in [file for file in os.listdir(tmpdir) if file.endswith('.png')]:
                     try:
-                        i = int(re.sub('.png', '', re.sub('page-', '', png))) - 1
-                        pil = Image.open(os.path.join(tmpdir, png))
+                        i = int(re.sub('.png', '', re.sub('page-', '', png))) - 1 + first_page
+                        pil = _load_image(os.path.join(tmpdir, png))
                         pils[i] = pil
                     except Exception as e:
                        pass
-                if self._caching:
-                    self._full_doc_rendered = True
-                    self._renders.update(pils)
                 timing = time.perf_counter() - start_time
                 num_pages = len(pils)
                 for page in pils.keys():
@@ -304,17 +418,20 @@ class Ghostscript(Renderer, Reforger):
                 self._file_timed_out[RENDER] = False
             except TimeoutExpired:
                 pils: Dict[int, PngImageFile] = dict()
-                self._logs[0] = {'result': 'Timed out', 'timing': self._timeout}
+                self._logs[first_page] = {'result': 'Timed out', 'timing': self._timeout}
                 self._file_timed_out[RENDER] = True
             except Exception as e:
                 pils: Dict[int, PngImageFile] = dict()
                 timing = time.perf_counter() - start_time
-                self._logs[0] = {'result': str(e), 'timing': timing}
+                self._logs[first_page] = {'result': str(e), 'timing': timing}
                 self._file_timed_out[RENDER] = False
             # finally:
             #     external_gs.cleanup()
         return pils
 
+    def _render_params(self, page: int):
+        return dict() if self._size is None else {'size': self._size}
+
     def _render_pages(self, pages):
         result = dict()
         for page in pages:
@@ -10,9 +10,9 @@ from sparclur._hybrid import Hybrid
 from sparclur._reforge import Reforger
 from sparclur._renderer import _SUCCESSFUL_RENDER_MESSAGE as SUCCESS
 from sparclur._renderer import _SUCCESS_WITH_WARNINGS as SUCCESS_WITH_WARNINGS
-from sparclur._renderer import _ocr_text
+from sparclur._renderer import _ocr_text, _region_pixels
 from sparclur._tracer import Tracer
-from sparclur.utils import fix_splits, hash_file
+from sparclur.utils import fix_splits, hash_file, DocumentHandle
 
 import os
 import sys
@@ -42,6 +42,11 @@ class MuPDF(Tracer, Hybrid, Reforger):
                  temp_folders_dir: Union[str, None] = None,
                  dpi: Union[int, None] = None,
                  cache_renders: Union[bool, None] = None,
+                 cache_budget: Union[int, None] = None,
+                 cache_spill: Union[bool, None] = None,
+                 render_store: Union[str, None] = None,
+                 shards: Union[int, None] = None,
+                 colorspace: Union[str, None] = None,
                  timeout: Union[int, None] = None,
                  ocr: Union[bool, None] = None
                  ):
@@ -63,6 +68,11 @@ class MuPDF(Tracer, Hybrid, Reforger):
         temp_folders_dir = _get_config_param(MuPDF, config, 'temp_folders_dir', temp_folders_dir, None)
         dpi = _get_config_param(MuPDF, config, 'dpi', dpi, 200)
         cache_renders = _get_config_param(MuPDF, config, 'cache_renders', cache_renders, False)
+        cache_budget = _get_config_param(MuPDF, config, 'cache_budget', cache_budget, None)
+        cache_spill = _get_config_param(MuPDF, config, 'cache_spill', cache_spill, True)
+        render_store = _get_config_param(MuPDF, config, 'render_store', render_store, None)
+        shards = _get_config_param(MuPDF, config, 'shards', shards, 1)
+        colorspace = _get_config_param(MuPDF, config, 'colorspace', colorspace, 'rgb')
         timeout = _get_config_param(MuPDF, config, 'timeout', timeout, None)
         ocr = _get_config_param(MuPDF, config, 'ocr', ocr, False)
 
@@ -74,11 +84,46 @@ class MuPDF(Tracer, Hybrid, Reforger):
                          validate_hash=validate_hash,
                          dpi=dpi,
                          cache_renders=cache_renders,
+                         cache_budget=cache_budget,
+                         cache_spill=cache_spill,
+                         render_store=render_store,
+                         shards=shards,
+                         colorspace=colorspace,
                          timeout=timeout,
                          ocr=ocr)
         self._parse_streams = parse_streams
         self._cmd_path = 'mutool clean' if binary_path is None else binary_path.strip() + ' clean'
         self._trace_exit_code = None
+        self._open_warnings = ''
+        self._document = DocumentHandle(self._open_document, self._close_document)
+
+    def _open_document(self):
+        fitz.TOOLS.reset_mupdf_warnings()
+        if isinstance(self._doc, bytes):
+            doc = fitz.open(stream=self._doc, filetype='pdf')
+        else:
+            doc = fitz.open(self._doc)
+        self._open_warnings = fitz.TOOLS.mupdf_warnings()
+        return doc
+
+    @staticmethod
+    def _close_document(doc):
+        doc.close()
+
+    def _warnings(self, include_open: bool = True):
+        warnings = fitz.TOOLS.mupdf_warnings()
+        if include_open and self._open_warnings != '':
+            warnings = self._open_warnings if warnings == '' else self._open_warnings + '\n' + warnings
+        return warnings
+
+    def close(self):
+        """Close the open fitz document. It is re-opened on the next page level call."""
+        self._document.close()
+
+    def _shard_clone(self):
+        clone = super()._shard_clone()
+        clone._document = DocumentHandle(clone._open_document, clone._close_document)
+        return clone
 
     def _check_for_renderer(self) -> bool:
         if self._can_render is None:
@@ -125,46 +170,70 @@ class MuPDF(Tracer, Hybrid, Reforger):
     #     return 'MuDraw'
 
     def _get_num_pages(self):
-        with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
-            if isinstance(self._doc, bytes):
-                file_hash = hash_file(self._doc)
-                doc_path = os.path.join(temp_path, file_hash)
-                with open(doc_path, 'wb') as doc_out:
-                    doc_out.write(self._doc)
-            else:
-                doc_path = self._doc
-            try:
-                doc = fitz.open(doc_path)
-                self._num_pages = doc.pageCount
-            except Exception as e:
-                print(e)
-                self._num_pages = 0
-            finally:
-                try:
-                    doc.close()
-                except:
-                    pass
-
-    def _mudraw(self, page, mat):
-        pix = page.get_pixmap(matrix=mat)
+        try:
+            with self._document.use() as doc:
+                self._num_pages = len(doc)
+        except Exception as e:
+            print(e)
+            self._num_pages = 0
+
+    def _mudraw(self, page, mat, clip=None):
+        colorspace = fitz.csGRAY if self._gray else fitz.csRGB
+        pix = page.get_pixmap(matrix=mat, colorspace=colorspace, clip=clip, alpha=False)
         width = pix.width
         height = pix.height
-        return Image.frombytes("RGB", [width, height], pix.samples)
+        return Image.frombytes("L" if self._gray else "RGB", [width, height], pix.samples)
 
-    def _render_page(self, page):
-        with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
-            if isinstance(self._doc, bytes):
-                file_hash = hash_file(self._doc)
-                doc_path = os.path.join(temp_path, file_hash)
-                with open(doc_path, 'wb') as doc_out:
-                    doc_out.write(self._doc)
-            else:
-                doc_path = self._doc
-            start_time = time.perf_counter()
+    @staticmethod
+    def _mudraw_gray(page, size):
+        rect = page.rect
+        scale = size / max(rect.width, rect.height, 1)
+        pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY, alpha=False)
+        return Image.frombytes("L", [pix.width, pix.height], pix.samples)
+
+    def _iter_hash_renders(self, pages, size):
+        try:
+            with self._document.use() as doc:
+                yield from self._iter_hash_pages(doc, range(len(doc)) if pages is None else pages, size)
+        except Exception:
+            return
+
+    def _iter_hash_pages(self, doc, pages, size):
+        for page in pages:
+            try:
+                if self._timeout is None:
+                    pil = self._mudraw_gray(doc[page], size)
+                else:
+                    pil = func_timeout(self._timeout, self._mudraw_gray, args=(doc[page], size))
+            except FunctionTimedOut:
+                self._document.discard()
+                return
+            except Exception:
+                continue
+            yield page, pil
+
+    def _mudraw_region(self, page, bbox, scale):
+        x0, y0, x1, y1 = _region_pixels(bbox, scale)
+        clip = fitz.Rect(x0 / scale, y0 / scale, x1 / scale, y1 / scale)
+        return self._mudraw(page, fitz.Matrix(scale, scale), clip=clip)
+
+    def _render_region(self, page, bbox, dpi):
+        with self._document.use() as doc:
             try:
-                mat = fitz.Matrix(self._dpi / 72, self._dpi / 72)
+                if self._timeout is None:
+                    return self._mudraw_region(doc[page], bbox, dpi / 72)
+                else:
+                    return func_timeout(self._timeout, self._mudraw_region, args=(doc[page], bbox, dpi / 72))
+            except FunctionTimedOut:
+                self._document.discard()
+                return None
+
+    def _render_page(self, page):
+        start_time = time.perf_counter()
+        try:
+            mat = fitz.Matrix(self._dpi / 72, self._dpi / 72)
+            with self._document.use() as doc:
                 fitz.TOOLS.reset_mupdf_warnings()
-                doc = fitz.open(doc_path)
                 if self._timeout is None:
                     mu_pil: PngImageFile = self._mudraw(doc[page], mat)
                 else:
@@ -176,39 +245,33 @@ class MuPDF(Tracer, Hybrid, Reforger):
                             'mat': mat
                         }
                     )
-                doc.close()
                 if self._caching:
                     self._renders[page] = mu_pil
                 timing = time.perf_counter() - start_time
-                warnings = fitz.TOOLS.mupdf_warnings()
+                warnings = self._warnings()
                 result = SUCCESS if warnings == '' else SUCCESS_WITH_WARNINGS
                 self._logs[page] = {'result': result, 'timing': timing}
                 self._file_timed_out[RENDER] = False
-            except FunctionTimedOut:
-                mu_pil: PngImageFile = None
-                self._logs[page] = {'result': 'Timed out', 'timing': self._timeout}
-                self._file_timed_out[RENDER] = True
-            except Exception as e:
-                mu_pil: PngImageFile = None
-                timing = time.perf_counter() - start_time
-                self._logs[page] = {'result': str(e), 'timing': timing}
-                self._file_timed_out[RENDER] = False
-            return mu_pil
+        except FunctionTimedOut:
+            self._document.discard()
+            mu_pil: PngImageFile = None
+            self._logs[page] = {'result': 'Timed out', 'timing': self._timeout}
+            self._file_timed_out[RENDER] = True
+        except Exception as e:
+            mu_pil: PngImageFile = None
+            timing = time.perf_counter() - start_time
+            self._logs[page] = {'result': str(e), 'timing': timing}
+            self._file_timed_out[RENDER] = False
+        return mu_pil
 
     def _render_doc(self, pages=None):
-        with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
-            if isinstance(self._doc, bytes):
-                file_hash = hash_file(self._doc)
-                doc_path = os.path.join(temp_path, file_hash)
-                with open(doc_path, 'wb') as doc_out:
-                    doc_out.write(self._doc)
-            else:
-                doc_path = self._doc
-            start_time = time.perf_counter()
-            try:
-                mat = fitz.Matrix(self._dpi / 72, self._dpi / 72)
-                doc = fitz.open(doc_path)
-                num_pages = doc.pageCount
+        if pages is None and self._sharded:
+            return self._render_sharded(processes=True)
+        start_time = time.perf_counter()
+        try:
+            mat = fitz.Matrix(self._dpi / 72, self._dpi / 72)
+            with self._document.use() as doc:
+                num_pages = len(doc)
                 if num_pages == 0 and pages is not None:
                     num_pages = max(pages) + 1
                 if pages is None:
@@ -216,7 +279,6 @@ class MuPDF(Tracer, Hybrid, Reforger):
                 else:
                     page_range = [page for page in pages if -1 < page < num_pages]
                 if len(doc) == 0:
-                    doc.close()
                     raise Exception('Document failed to load')
                 pils: Dict[int, PngImageFile] = dict()
                 for page in page_range:
@@ -235,31 +297,28 @@ class MuPDF(Tracer, Hybrid, Reforger):
                                 }
                             )
                         timing = time.perf_counter() - page_start
-                        warnings = fitz.TOOLS.mupdf_warnings()
+                        warnings = self._warnings(include_open=False)
                         result = SUCCESS if warnings == '' else SUCCESS_WITH_WARNINGS
                         self._logs[page] = {'result': result, 'timing': timing}
                         self._file_timed_out[RENDER] = False
                     except FunctionTimedOut:
+                        self._document.discard()
+                        doc = self._document.get()
                         self._logs[page] = {'result': 'Timed out', 'timing': self._timeout}
                         self._file_timed_out[RENDER] = True
                     except Exception as e:
                         self._logs[page] = {'result': str(e), 'timing': time.perf_counter() - page_start}
                         self._file_timed_out[RENDER] = False
-                doc.close()
-                if self._caching:
-                    if pages is None:
-                        self._full_doc_rendered = True
-                    self._renders.update(pils)
-                # timing = time.perf_counter() - start_time
-                # num_pages = len(pils)
-                # for page in pils.keys():
-                #     self._logs[page] = {'result': SUCCESS, 'timing': timing / num_pages}
-            except Exception as e:
-                pils: Dict[int, PngImageFile] = dict()
-                timing = time.perf_counter() - start_time
-                self._logs[0] = {'result': str(e), 'timing': timing}
-                self._file_timed_out[RENDER] = False
-            return pils
+            if self._caching:
+                if pages is None:
+                    self._full_doc_rendered = True
+                self._renders.update(pils)
+        except Exception as e:
+            pils: Dict[int, PngImageFile] = dict()
+            timing = time.perf_counter() - start_time
+            self._logs[0] = {'result': str(e), 'timing': timing}
+            self._file_timed_out[RENDER] = False
+        return pils
 
     def _render_pages(self, pages: List[int]):
         return self._render_doc(pages)
@@ -304,46 +363,33 @@ class MuPDF(Tracer, Hybrid, Reforger):
     @property
     def validate_text(self) -> Dict[str, Any]:
         if TEXT not in self._validity:
-            fitz.TOOLS.reset_mupdf_warnings()
             validity_results = dict()
-            with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
-                if isinstance(self._doc, bytes):
-                    file_hash = hash_file(self._doc)
-                    doc_path = os.path.join(temp_path, file_hash)
-                    with open(doc_path, 'wb') as doc_out:
-                        doc_out.write(self._doc)
-                else:
-                    doc_path = self._doc
-                try:
-                    doc = fitz.open(doc_path)
+            try:
+                with self._document.use() as doc:
+                    fitz.TOOLS.reset_mupdf_warnings()
                     for page in doc:
-                        text = page.getText()
+                        text = page.get_text()
                         if not self._ocr and page.number not in self._text:
                             self._text[page.number] = text
                     if not self._ocr:
                         self._full_text_extracted = True
-                    warnings = fitz.TOOLS.mupdf_warnings()
+                    warnings = self._warnings()
                     error = None
-                except Exception as e:
-                    error = str(e)
-                    warnings = None
-                finally:
-                    try:
-                        doc.close()
-                    except:
-                        pass
-                if error is not None:
-                    validity_results['valid'] = False
-                    validity_results['status'] = REJECTED
-                    validity_results['info'] = error
+            except Exception as e:
+                error = str(e)
+                warnings = None
+            if error is not None:
+                validity_results['valid'] = False
+                validity_results['status'] = REJECTED
+                validity_results['info'] = error
+            else:
+                validity_results['valid'] = True
+                if warnings == '':
+                    validity_results['status'] = VALID
                 else:
-                    validity_results['valid'] = True
-                    if warnings == '':
-                        validity_results['status'] = VALID
-                    else:
-                        validity_results['status'] = VALID_WARNINGS
-                        validity_results['info'] = warnings
-                self._validity[TEXT] = validity_results
+                    validity_results['status'] = VALID_WARNINGS
+                    validity_results['info'] = warnings
+            self._validity[TEXT] = validity_results
         return self._validity[TEXT]
 
     def _check_for_tracer(self) -> bool:
@@ -587,34 +633,15 @@ class MuPDF(Tracer, Hybrid, Reforger):
         if self._ocr:
             self._text[page] = _ocr_text(self.get_renders(page=page))
         else:
-            with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
-                if isinstance(self._doc, bytes):
-                    file_hash = hash_file(self._doc)
-                    doc_path = os.path.join(temp_path, file_hash)
-                    with open(doc_path, 'wb') as doc_out:
-                        doc_out.write(self._doc)
-                else:
-                    doc_path = self._doc
-                doc = fitz.open(doc_path)
-                text = doc[page].get_text()
-                doc.close()
-                self._text[page] = text
+            with self._document.use() as doc:
+                self._text[page] = doc[page].get_text()
 
     def _extract_doc(self):
         if self._ocr:
-            for (page, pil) in self.get_renders().items():
+            for (page, pil) in self.iter_renders():
                 self._text[page] = _ocr_text(pil)
         else:
-            with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
-                if isinstance(self._doc, bytes):
-                    file_hash = hash_file(self._doc)
-                    doc_path = os.path.join(temp_path, file_hash)
-                    with open(doc_path, 'wb') as doc_out:
-                        doc_out.write(self._doc)
-                else:
-                    doc_path = self._doc
-                doc = fitz.open(doc_path)
+            with self._document.use() as doc:
                 for page in doc:
                     self._text[page.number] = page.get_text()
-                doc.close()
             self._full_text_extracted = True
@@ -1,16 +1,20 @@
+import ctypes
+import math
 from typing import Union, List, Tuple, Any
 import time
 import sys
 
 import pypdfium2 as pdfium
+from PIL import Image as PILImage
 from PIL.Image import Image
 from func_timeout import func_timeout, FunctionTimedOut
 from PIL.PngImagePlugin import PngImageFile
 
 from sparclur._parser import VALID, VALID_WARNINGS, REJECTED, RENDER, TIMED_OUT
-from sparclur._renderer import Renderer
+from sparclur._renderer import Renderer, _region_pixels
 from sparclur._renderer import _SUCCESSFUL_RENDER_MESSAGE as SUCCESS
 from sparclur._renderer import _SUCCESS_WITH_WARNINGS as SUCCESS_WITH_WARNINGS
+from sparclur.utils import DocumentHandle
 from sparclur.utils._config import _get_config_param, _load_config
 
 
@@ -24,6 +28,11 @@ class PDFium(Renderer):
                  temp_folders_dir: Union[str, None] = None,
                  dpi: Union[int, None] = None,
                  cache_renders: Union[bool, None] = None,
+                 cache_budget: Union[int, None] = None,
+                 cache_spill: Union[bool, None] = None,
+                 render_store: Union[str, None] = None,
+                 shards: Union[int, None] = None,
+                 colorspace: Union[str, None] = None,
                  timeout: Union[int, None] = None):
 
         config = _load_config()
@@ -32,6 +41,11 @@ class PDFium(Renderer):
         temp_folders_dir = _get_config_param(PDFium, config, 'temp_folders_dir', temp_folders_dir, None)
         dpi = _get_config_param(PDFium, config, 'dpi', dpi, 200)
         cache_renders = _get_config_param(PDFium, config, 'cache_renders', cache_renders, False)
+        cache_budget = _get_config_param(PDFium, config, 'cache_budget', cache_budget, None)
+        cache_spill = _get_config_param(PDFium, config, 'cache_spill', cache_spill, True)
+        render_store = _get_config_param(PDFium, config, 'render_store', render_store, None)
+        shards = _get_config_param(PDFium, config, 'shards', shards, 1)
+        colorspace = _get_config_param(PDFium, config, 'colorspace', colorspace, 'rgb')
         timeout = _get_config_param(PDFium, config, 'timeout', timeout, None)
 
         super().__init__(doc=doc,
@@ -42,7 +56,38 @@ class PDFium(Renderer):
                          validate_hash=validate_hash,
                          dpi=dpi,
                          cache_renders=cache_renders,
+                         cache_budget=cache_budget,
+                         cache_spill=cache_spill,
+                         render_store=render_store,
+                         shards=shards,
+                         colorspace=colorspace,
                          timeout=timeout)
+        self._document = DocumentHandle(self._open_document, self._close_document)
+
+    def _open_document(self):
+        return pdfium.open_pdf_auto(self._doc)
+
+    @staticmethod
+    def _close_document(handle):
+        pdf, ld_data = handle
+        pdfium.close_pdf(pdf, ld_data)
+
+    def close(self):
+        """Close the open PDFium document. It is re-opened on the next page level call."""
+        self._document.close()
+
+    def _shard_clone(self):
+        clone = super()._shard_clone()
+        clone._document = DocumentHandle(clone._open_document, clone._close_document)
+        return clone
+
+    def _render_range(self, pages: List[int]):
+        result = dict()
+        for page in pages:
+            pil = self._render_page(page)
+            if pil is not None:
+                result[page] = pil
+        return result
 
     @staticmethod
     def get_name():
@@ -91,24 +136,20 @@ class PDFium(Renderer):
 
     def _get_num_pages(self):
         try:
-            doc = pdfium.FPDF_LoadDocument(self._doc, None)
-            self._num_pages = pdfium.FPDF_GetPageCount(doc)
+            with self._document.use() as (pdf, _):
+                self._num_pages = pdfium.FPDF_GetPageCount(pdf)
         except Exception as e:
             self._num_pages = 0
-        finally:
-            try:
-                pdfium.FPDF_CloseDocument(doc)
-            except:
-                pass
 
     def _render_page(self, page):
         start_time = time.perf_counter()
         try:
-            with pdfium.PdfContext(self._doc) as pdf:
+            with self._document.use() as (pdf, _):
                 kwargs = {
                     'pdf': pdf,
                     'page_index': page,
-                    'scale': self._dpi / 72
+                    'scale': self._dpi / 72,
+                    'greyscale': self._gray
                 }
                 if self._timeout is None:
                     pil_image: Image = pdfium.render_page(**kwargs)
@@ -118,26 +159,105 @@ class PDFium(Renderer):
                         pdfium.render_page,
                         kwargs=kwargs
                     )
-                if self._caching:
-                    self._renders[page] = pil_image
-                timing = time.perf_counter() - start_time
-                result = SUCCESS
-                self._logs[page] = {'result': result, 'timing': timing}
-                self._file_timed_out = False
+            if self._caching:
+                self._renders[page] = pil_image
+            timing = time.perf_counter() - start_time
+            result = SUCCESS
+            self._logs[page] = {'result': result, 'timing': timing}
+            self._file_timed_out[RENDER] = False
         except FunctionTimedOut:
+            self._document.discard()
             pil_image: Image = None
             self._logs[page] = {'result': 'Timed out', 'timing': self._timeout}
-            self._file_timed_out = True
+            self._file_timed_out[RENDER] = True
         except Exception as e:
             pil_image: Image = None
             timing = time.perf_counter() - start_time
             self._logs[page] = {'result': str(e), 'timing': timing}
-            self._file_timed_out = False
+            self._file_timed_out[RENDER] = False
         return pil_image
 
+    @staticmethod
+    def _pdfium_render_gray(pdf, page, size):
+        width, height = ctypes.c_double(), ctypes.c_double()
+        if not pdfium.FPDF_GetPageSizeByIndex(pdf, page, ctypes.byref(width), ctypes.byref(height)):
+            raise IndexError('Page %i could not be loaded' % page)
+        scale = size / max(width.value, height.value, 1)
+        return pdfium.render_page(pdf, page_index=page, scale=scale, greyscale=True).convert('L')
+
+    def _iter_hash_renders(self, pages, size):
+        try:
+            with self._document.use() as (pdf, _):
+                yield from self._iter_hash_pages(pdf, range(pdfium.FPDF_GetPageCount(pdf)) if pages is None else pages,
+                                                 size)
+        except Exception:
+            return
+
+    def _iter_hash_pages(self, pdf, pages, size):
+        for page in pages:
+            try:
+                if self._timeout is None:
+                    pil = self._pdfium_render_gray(pdf, page, size)
+                else:
+                    pil = func_timeout(self._timeout, self._pdfium_render_gray, args=(pdf, page, size))
+            except FunctionTimedOut:
+                self._document.discard()
+                return
+            except Exception:
+                continue
+            yield page, pil
+
+    @staticmethod
+    def _pdfium_render_region(pdf, page, bbox, scale, gray=False):
+        if not 0 <= page < pdfium.FPDF_GetPageCount(pdf):
+            raise IndexError('Page %i could not be loaded' % page)
+        # The form environment keeps a pointer to its config, which has to outlive it
+        form_config = pdfium.FPDF_FORMFILLINFO(2)
+        form_fill = pdfium.FPDFDOC_InitFormFillEnvironment(pdf, form_config)
+        page_handle = pdfium.FPDF_LoadPage(pdf, page)
+        pdfium.FORM_OnAfterLoadPage(page_handle, form_fill)
+        bitmap = None
+        try:
+            width = math.ceil(pdfium.FPDF_GetPageWidthF(page_handle) * scale)
+            height = math.ceil(pdfium.FPDF_GetPageHeightF(page_handle) * scale)
+            x0, y0, x1, y1 = _region_pixels(bbox, scale, (width, height))
+            region_width, region_height = x1 - x0, y1 - y0
+            mode, raw_mode, bitmap_format, channels = ('L', 'L', pdfium.FPDFBitmap_Gray, 1) if gray else \
+                ('RGB', 'BGR', pdfium.FPDFBitmap_BGR, 3)
+            bitmap = pdfium.FPDFBitmap_CreateEx(region_width, region_height, bitmap_format, None,
+                                                region_width * channels)
+            pdfium.FPDFBitmap_FillRect(bitmap, 0, 0, region_width, region_height, 0xFFFFFFFF)
+            # Drawing the full page offset by the region origin lets PDFium clip everything outside the bitmap
+            flags = pdfium.FPDF_ANNOT | pdfium.FPDF_GRAYSCALE if gray else pdfium.FPDF_ANNOT
+            render_args = [bitmap, page_handle, -x0, -y0, width, height, 0, flags]
+            pdfium.FPDF_RenderPageBitmap(*render_args)
+            pdfium.FPDF_FFLDraw(form_fill, *render_args)
+            buffer = ctypes.cast(pdfium.FPDFBitmap_GetBuffer(bitmap),
+                                 ctypes.POINTER(ctypes.c_ubyte * (region_width * channels * region_height)))
+            return PILImage.frombytes(mode, (region_width, region_height), bytes(buffer.contents), 'raw', raw_mode)
+        finally:
+            if bitmap is not None:
+                pdfium.FPDFBitmap_Destroy(bitmap)
+            pdfium.FORM_OnBeforeClosePage(page_handle, form_fill)
+            pdfium.FPDF_ClosePage(page_handle)
+            pdfium.FPDFDOC_ExitFormFillEnvironment(form_fill)
+
+    def _render_region(self, page, bbox, dpi):
+        with self._document.use() as (pdf, _):
+            try:
+                if self._timeout is None:
+                    return self._pdfium_render_region(pdf, page, bbox, dpi / 72, self._gray)
+                else:
+                    return func_timeout(self._timeout, self._pdfium_render_region,
+                                        args=(pdf, page, bbox, dpi / 72, self._gray))
+            except FunctionTimedOut:
+                self._document.discard()
+                return None
+
     def _pdfium_render_pdf(self, page_indices):
         result = dict()
-        for image, suffix in pdfium.render_pdf(self._doc, page_indices=page_indices, scale=self._dpi/72):
+        for image, suffix in pdfium.render_pdf(self._doc, page_indices=page_indices, scale=self._dpi/72,
+                                               greyscale=self._gray):
             result[int(suffix) - 1] = image
         return result
 
@@ -195,5 +315,7 @@ class PDFium(Renderer):
         return result
 
     def _render_doc(self):
+        if self._sharded:
+            return self._render_sharded(processes=True)
         renders = self._render_pages(pages=None)
         return renders
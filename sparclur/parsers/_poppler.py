@@ -1,4 +1,5 @@
 import locale
+from functools import partial
 import shlex
 import time
 import warnings
@@ -8,10 +9,12 @@ from sparclur._parser import VALID, VALID_WARNINGS, REJECTED, REJECTED_AMBIG, RE
 from sparclur._hybrid import Hybrid
 from sparclur._reforge import Reforger
 from sparclur._tracer import Tracer
-from sparclur._renderer import _SUCCESSFUL_RENDER_MESSAGE as SUCCESS, _ocr_text
+from sparclur._renderer import _SUCCESSFUL_RENDER_MESSAGE as SUCCESS, _ocr_text, _load_image, \
+    _output_page_parser, _region_pixels, _plan_page_runs
 from sparclur._font_extractor import FontExtractor
 from sparclur._image_data_extractor import ImageDataExtractor
-from sparclur.parsers._poppler_helpers import _parse_poppler_size, _pdftocairo_clean_message, _pdftoppm_clean_message
+from sparclur.parsers._poppler_helpers import _parse_poppler_size, _pdftocairo_clean_message, \
+    _pdftoppm_clean_message, _FAST_TRACE_ARGS
 from sparclur.utils import fix_splits, hash_file
 from sparclur.utils._config import _get_config_param, _load_config
 
@@ -23,7 +26,6 @@ import re
 import os
 from typing import Tuple
 
-from PIL import Image
 from PIL.PngImagePlugin import PngImageFile
 
 
@@ -36,6 +38,7 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
                  page_hashes: Union[int, Tuple[Any], None] = None,
                  validate_hash: bool = False,
                  trace: str = None,
+                 fast_trace: bool = None,
                  binary_path: str = None,
                  temp_folders_dir: str = None,
                  page_delimiter: str = None,
@@ -43,6 +46,12 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
                  dpi: int = None,
                  size: Tuple[int] or int = None,
                  cache_renders: bool = None,
+                 cache_budget: int = None,
+                 cache_spill: bool = None,
+                 render_store: str = None,
+                 shards: int = None,
+                 colorspace: str = None,
+                 page_timeout: int = None,
                  timeout: int = None,
                  ocr: bool = None
                  ):
@@ -51,6 +60,9 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
         ----------
         trace : {'pdftoppm', 'pdftocairo'}
             Specify which tool to collect trace messaging from
+        fast_trace : bool
+            Collect the trace messages from a render at a low resolution instead of a full render. The content streams
+            are still fully interpreted and images decoded the same way, but far fewer pixels are drawn and encoded.
         binary_path : str
             If the Poppler binaries are not in the system PATH, add the path to the binaries here. Can also be used to
             use and compare specific versions of the binary.
@@ -66,6 +78,7 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
         skip_check = _get_config_param(Poppler, config, 'skip_check', skip_check, False)
         hash_exclude = _get_config_param(Poppler, config, 'hash_exclude', hash_exclude, None)
         trace = _get_config_param(Poppler, config, 'trace', trace, 'pdftoppm')
+        fast_trace = _get_config_param(Poppler, config, 'fast_trace', fast_trace, False)
         binary_path = _get_config_param(Poppler, config, 'binary_path', binary_path, None)
         temp_folders_dir = _get_config_param(Poppler, config, 'temp_folders_dir', temp_folders_dir, None)
         page_delimiter = _get_config_param(Poppler, config, 'page_delimiter', page_delimiter, '\x0c')
@@ -73,6 +86,12 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
         dpi = _get_config_param(Poppler, config, 'dpi', dpi, 200)
         size = _get_config_param(Poppler, config, 'size', size, None)
         cache_renders = _get_config_param(Poppler, config, 'cache_renders', cache_renders, False)
+        cache_budget = _get_config_param(Poppler, config, 'cache_budget', cache_budget, None)
+        cache_spill = _get_config_param(Poppler, config, 'cache_spill', cache_spill, True)
+        render_store = _get_config_param(Poppler, config, 'render_store', render_store, None)
+        shards = _get_config_param(Poppler, config, 'shards', shards, 1)
+        colorspace = _get_config_param(Poppler, config, 'colorspace', colorspace, 'rgb')
+        page_timeout = _get_config_param(Poppler, config, 'page_timeout', page_timeout, None)
         timeout = _get_config_param(Poppler, config, 'timeout', timeout, None)
         ocr = _get_config_param(Poppler, config, 'ocr', ocr, False)
 
@@ -84,9 +103,16 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
                          validate_hash=validate_hash,
                          dpi=dpi,
                          cache_renders=cache_renders,
+                         cache_budget=cache_budget,
+                         cache_spill=cache_spill,
+                         render_store=render_store,
+                         shards=shards,
+                         colorspace=colorspace,
+                         page_timeout=page_timeout,
                          timeout=timeout,
                          ocr=ocr)
         self._trace = trace
+        self._fast_trace = fast_trace
         self._page_delimiter = page_delimiter
         self._maintain_layout = maintain_layout
         self._size = size
@@ -127,6 +153,14 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
         self._clear_renders()
         self._size = s
 
+    @property
+    def fast_trace(self):
+        return self._fast_trace
+
+    @fast_trace.setter
+    def fast_trace(self, f: bool):
+        self._fast_trace = f
+
     @property
     def page_delimiter(self):
         return self._page_delimiter
@@ -432,8 +466,10 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
             else:
                 doc_path = self._doc
             try:
-                cmd = [self._trace_cmd,
-                       doc_path]
+                cmd = [self._trace_cmd]
+                if self._fast_trace and self._trace == 'pdftoppm':
+                    cmd.extend(_FAST_TRACE_ARGS)
+                cmd.append(doc_path)
                 if self._validate_hash:
                     pages = self._parse_page_hashes
                     if pages is not None:
@@ -517,7 +553,7 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
 
     def _render_page(self, page):
         render: PngImageFile = self._poppler_render(pages=page).get(page)
-        if self._caching:
+        if self._caching and render is not None:
             self._renders[page] = render
         return render
 
@@ -552,25 +588,31 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
     #     return renders
 
     def _render_doc(self):
+        if self._sharded:
+            return self._render_sharded()
+        if self._page_timeout is not None:
+            return self._render_streamed()
         renders: Dict[int, PngImageFile] = self._poppler_render(pages=None)
         if self._caching:
             self._full_doc_rendered = True
-            self._renders = renders
+            self._renders.update(renders)
         return renders
 
+    def _render_range(self, pages):
+        if self._page_timeout is not None:
+            return dict(self._iter_render_pages(pages))
+        return self._poppler_render(pages=pages)
+
     def _render_pages(self, pages):
         renders: Dict[int, PngImageFile] = self._poppler_render(pages=pages)
         if self._caching:
             self._renders.update(renders)
         return renders
 
-    def _poppler_render(self, pages=None):
-        if isinstance(pages, int):
-            pages = [pages]
-        num_pages = self.num_pages
-        if num_pages == 0 and pages is not None:
-            num_pages = max(pages) + 1
-        start_time = time.perf_counter()
+    def _render_params(self, page: int):
+        return dict() if self._size is None else {'size': self._size}
+
+    def _pdftoppm_render_args(self, pages):
         if isinstance(self._size, dict):
             if pages is None or isinstance(pages, list):
                 warnings.warn("""Poppler does not support page specific sizing when rendering more than one page of 
@@ -583,16 +625,101 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
         else:
             size = self._size
 
-        # return_single_page = False
         cmd = [self._pdftoppm_path, '-png', '-cropbox', '-r', str(self._dpi)]
+        if self._gray:
+            cmd.append('-gray')
         size = _parse_poppler_size(size)
         if size is not None:
             cmd.extend(size)
+        return cmd
+
+    def _pdftoppm_command(self, pages, num_pages, doc_path, out_prefix, hash_size=None):
+        if hash_size is not None:
+            cmd = [self._pdftoppm_path, '-png', '-gray', '-cropbox', '-scale-to', str(hash_size)]
+        else:
+            cmd = self._pdftoppm_render_args(pages)
         if pages is not None:
             first_page = str(min(max(0, min(pages)), num_pages - 1) + 1)
             last_page = str(min(num_pages - 1, max(pages)) + 1)
             # return_single_page = True
             cmd.extend(['-f', first_page, '-l', last_page])
+        cmd.extend([doc_path, out_prefix])
+        return shlex.split(' '.join([entry for entry in cmd]))
+
+    def _iter_render_pages(self, pages):
+        return self._stream_salvaging(pages, self._stream_pdftoppm)
+
+    def _iter_hash_renders(self, pages, size):
+        return self._stream_salvaging(pages, partial(self._stream_pdftoppm, hash_size=size), log=False)
+
+    def _collect_stream_messages(self, stderr, timed_out):
+        if len(stderr) == 0:
+            return
+        self._render_exit_code = 0 if timed_out else max(code for (code, _) in stderr)
+        if self._messages is None and self._trace == 'pdftoppm':
+            err = fix_splits(b''.join(err for (_, err) in stderr).decode(self._decoder))
+            error_arr = [message for message in err.split('\n') if len(message) > 0]
+            if timed_out:
+                error_arr.insert(0, 'Error: Subprocess timed out: %i' % (self._page_timeout or self._timeout or 600))
+            self._messages = ['No warnings'] if len(error_arr) == 0 else error_arr
+            self._trace_exit_code = self._render_exit_code
+            self._file_timed_out[TRACER] = timed_out
+
+    def _stream_pdftoppm(self, pages, hash_size=None, stderr=None):
+        num_pages = self.num_pages
+        if num_pages == 0 and pages is not None:
+            num_pages = max(pages) + 1
+        with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
+            if isinstance(self._doc, bytes):
+                file_hash = hash_file(self._doc)
+                doc_path = os.path.join(temp_path, file_hash)
+                with open(doc_path, 'wb') as doc_out:
+                    doc_out.write(self._doc)
+            else:
+                doc_path = self._doc
+            out_dir = os.path.join(temp_path, 'renders')
+            os.mkdir(out_dir)
+            cmd = self._pdftoppm_command(pages, num_pages, doc_path, os.path.join(out_dir, 'out'), hash_size=hash_size)
+            stuck = yield from self._stream_subprocess(cmd, out_dir, _output_page_parser('out-', '.png'), pages=pages,
+                                                       first_page=0, log=hash_size is None, stderr=stderr)
+        return stuck
+
+    def _render_region(self, page, bbox, dpi):
+        x0, y0, x1, y1 = _region_pixels(bbox, dpi / 72)
+        with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
+            if isinstance(self._doc, bytes):
+                doc_path = os.path.join(temp_path, hash_file(self._doc))
+                with open(doc_path, 'wb') as doc_out:
+                    doc_out.write(self._doc)
+            else:
+                doc_path = self._doc
+            out_prefix = os.path.join(temp_path, 'region')
+            cmd = [self._pdftoppm_path, '-png', '-cropbox', '-r', str(dpi), '-f', str(page + 1), '-l', str(page + 1),
+                   '-x', str(x0), '-y', str(y0), '-W', str(x1 - x0), '-H', str(y1 - y0), '-singlefile']
+            if self._gray:
+                cmd.append('-gray')
+            cmd.extend([doc_path, out_prefix])
+            sp = subprocess.Popen(cmd, stderr=DEVNULL, stdout=DEVNULL, shell=False)
+            try:
+                sp.communicate(timeout=self._timeout or 600)
+            except TimeoutExpired:
+                sp.kill()
+                sp.communicate()
+                return None
+            out_path = out_prefix + '.png'
+            return _load_image(out_path) if os.path.isfile(out_path) else None
+
+    def _poppler_render(self, pages=None):
+        if isinstance(pages, int):
+            pages = [pages]
+        if pages is not None:
+            runs = _plan_page_runs(pages)
+            if len(runs) > 1:
+                return self._render_runs(runs, self._poppler_render)
+        num_pages = self.num_pages
+        if num_pages == 0 and pages is not None:
+            num_pages = max(pages) + 1
+        start_time = time.perf_counter()
         with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
             if isinstance(self._doc, bytes):
                 file_hash = hash_file(self._doc)
@@ -602,9 +729,8 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
             else:
                 doc_path = self._doc
             try:
-                cmd.extend([doc_path, os.path.join(temp_path, 'out')])
-                cmd = ' '.join([entry for entry in cmd])
-                sp = subprocess.Popen(shlex.split(cmd), stderr=subprocess.PIPE, stdout=DEVNULL, shell=False)
+                cmd = self._pdftoppm_command(pages, num_pages, doc_path, os.path.join(temp_path, 'out'))
+                sp = subprocess.Popen(cmd, stderr=subprocess.PIPE, stdout=DEVNULL, shell=False)
                 (_, err) = sp.communicate(timeout=self._timeout or 600)
                 self._render_exit_code = sp.returncode
                 if pages is None and self._messages is None and self._trace == 'pdftoppm':
@@ -617,29 +743,34 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
                 for render in [file for file in os.listdir(temp_path) if file.endswith('.png')]:
                     page_index = int(re.sub('out-', '', re.sub('.png', '', render))) - 1
                     if pages is None or page_index in pages:
-                        result[page_index] = Image.open(os.path.join(temp_path, render))
+                        result[page_index] = _load_image(os.path.join(temp_path, render))
                 num_pages = len(result)
                 timing = time.perf_counter() - start_time
                 for page in result.keys():
                     self._logs[page] = {'result': SUCCESS, 'timing': timing / num_pages}
-            except TimeoutError:
+                self._file_timed_out[RENDER] = False
+            except TimeoutExpired:
+                sp.kill()
+                sp.communicate()
                 self._render_exit_code = 0
-                if page is None and self._messages is None and self._trace == 'pdftoppm':
+                if pages is None and self._messages is None and self._trace == 'pdftoppm':
                     error_arr = ['Error: Subprocess timed out: %i' % (self._timeout or 600)]
                     self._messages = error_arr
                     self._trace_exit_code = 0
                     self._file_timed_out[TRACER] = True
                 result: Dict[int, PngImageFile] = dict()
-                self._logs[0] = {'result': 'Timed out', 'timing': (self._timeout or 600)}
+                self._logs[0 if pages is None else min(pages)] = {'result': 'Timed out',
+                                                                  'timing': (self._timeout or 600)}
+                self._file_timed_out[RENDER] = True
             except Exception as e:
-                if page is None and self._messages is None and self._trace == 'pdftoppm':
+                if pages is None and self._messages is None and self._trace == 'pdftoppm':
                     error_arr = str(e).split('\n')
                     self._messages = error_arr
                     self._trace_exit_code = 0
                     self._file_timed_out[TRACER] = False
                 result: Dict[int, PngImageFile] = dict()
                 timing = time.perf_counter() - start_time
-                self._logs[0] = {'result': str(e), 'timing': timing}
+                self._logs[0 if pages is None else min(pages)] = {'result': str(e), 'timing': timing}
 
         # if return_single_page:
         if pages is not None and len(pages) == 1:
@@ -652,7 +783,7 @@ class Poppler(Tracer, Hybrid, FontExtractor, ImageDataExtractor, Reforger):
 
     def _extract_doc(self):
         if self._ocr:
-            for (page, pil) in self.get_renders().items():
+            for (page, pil) in self.iter_renders():
                 self._text[page] = _ocr_text(pil)
         else:
             with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
@@ -1,5 +1,10 @@
 import re
 
+# pdftoppm options for collecting trace messages with less raster work. Every page is still fully interpreted and
+# drawn in color, only at a lower resolution. Monochrome output and very low resolutions are avoided as they take
+# different image decoding and transparency paths, which can change the messages.
+_FAST_TRACE_ARGS = ['-r', '36']
+
 
 def _parse_poppler_size(size):
     """
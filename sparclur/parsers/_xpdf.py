@@ -1,4 +1,5 @@
 import locale
+from functools import partial
 import shlex
 import time
 
@@ -6,7 +7,7 @@ from sparclur._parser import VALID, VALID_WARNINGS, REJECTED, REJECTED_AMBIG, RE
 from sparclur._hybrid import Hybrid
 from sparclur._tracer import Tracer
 from sparclur._font_extractor import FontExtractor
-from sparclur.parsers._poppler_helpers import _pdftoppm_clean_message
+from sparclur.parsers._poppler_helpers import _pdftoppm_clean_message, _FAST_TRACE_ARGS
 from sparclur.utils import fix_splits, hash_file
 
 from typing import List, Dict, Any, Union
@@ -17,9 +18,9 @@ import re
 import os
 from typing import Tuple
 
-from PIL import Image
 from PIL.PngImagePlugin import PngImageFile
-from sparclur._renderer import _SUCCESSFUL_RENDER_MESSAGE as SUCCESS, _ocr_text
+from sparclur._renderer import _SUCCESSFUL_RENDER_MESSAGE as SUCCESS, _ocr_text, _load_image, _output_page_parser, \
+    _plan_page_runs
 from sparclur.utils._config import _get_config_param, _load_config
 
 
@@ -31,6 +32,7 @@ class XPDF(Tracer, Hybrid, FontExtractor):
                  hash_exclude: Union[str, List[str], None] = None,
                  page_hashes: Union[int, Tuple[Any], None] = None,
                  validate_hash: bool = False,
+                 fast_trace: Union[bool, None] = None,
                  binary_path: Union[str, None] = None,
                  temp_folders_dir: Union[str, None] = None,
                  page_delimiter: Union[str, None] = None,
@@ -38,12 +40,21 @@ class XPDF(Tracer, Hybrid, FontExtractor):
                  dpi: Union[int, None] = None,
                  size: Union[Tuple[int], int, None] = None,
                  cache_renders: Union[bool, None] = None,
+                 cache_budget: Union[int, None] = None,
+                 cache_spill: Union[bool, None] = None,
+                 render_store: Union[str, None] = None,
+                 shards: Union[int, None] = None,
+                 colorspace: Union[str, None] = None,
+                 page_timeout: Union[int, None] = None,
                  timeout: Union[int, None] = None,
                  ocr: Union[bool, None] = None
                  ):
         """
         Parameters
         ----------
+        fast_trace : bool
+            Collect the trace messages from a render at a low resolution instead of a full render. The content streams
+            are still fully interpreted and images decoded the same way, but far fewer pixels are drawn and encoded.
         binary_path : str
             If the Poppler binaries are not in the system PATH, add the path to the binaries here. Can also be used to
             use and compare specific versions of the binary.
@@ -57,6 +68,7 @@ class XPDF(Tracer, Hybrid, FontExtractor):
         config = _load_config()
         skip_check = _get_config_param(XPDF, config, 'skip_check', skip_check, False)
         hash_exclude = _get_config_param(XPDF, config, 'hash_exclude', hash_exclude, None)
+        fast_trace = _get_config_param(XPDF, config, 'fast_trace', fast_trace, False)
         binary_path = _get_config_param(XPDF, config, 'binary_path', binary_path, None)
         temp_folders_dir = _get_config_param(XPDF, config, 'temp_folders_dir', temp_folders_dir, None)
         page_delimiter = _get_config_param(XPDF, config, 'page_delimiter', page_delimiter, '\x0c')
@@ -64,6 +76,12 @@ class XPDF(Tracer, Hybrid, FontExtractor):
         dpi = _get_config_param(XPDF, config, 'dpi', dpi, 200)
         size = _get_config_param(XPDF, config, 'size', size, None)
         cache_renders = _get_config_param(XPDF, config, 'cache_renders', cache_renders, False)
+        cache_budget = _get_config_param(XPDF, config, 'cache_budget', cache_budget, None)
+        cache_spill = _get_config_param(XPDF, config, 'cache_spill', cache_spill, True)
+        render_store = _get_config_param(XPDF, config, 'render_store', render_store, None)
+        shards = _get_config_param(XPDF, config, 'shards', shards, 1)
+        colorspace = _get_config_param(XPDF, config, 'colorspace', colorspace, 'rgb')
+        page_timeout = _get_config_param(XPDF, config, 'page_timeout', page_timeout, None)
         timeout = _get_config_param(XPDF, config, 'timeout', timeout, None)
         ocr = _get_config_param(XPDF, config, 'ocr', ocr, False)
 
@@ -75,9 +93,16 @@ class XPDF(Tracer, Hybrid, FontExtractor):
                          validate_hash=validate_hash,
                          dpi=dpi,
                          cache_renders=cache_renders,
+                         cache_budget=cache_budget,
+                         cache_spill=cache_spill,
+                         render_store=render_store,
+                         shards=shards,
+                         colorspace=colorspace,
+                         page_timeout=page_timeout,
                          timeout=timeout,
                          ocr=ocr)
         self._page_delimiter = page_delimiter
+        self._fast_trace = fast_trace
         self._maintain_layout = maintain_layout
         self._size = size
         self._decoder = locale.getpreferredencoding()
@@ -92,6 +117,14 @@ class XPDF(Tracer, Hybrid, FontExtractor):
         self._font_messages = None
         self._fonts_exit_code = None
 
+    @property
+    def fast_trace(self):
+        return self._fast_trace
+
+    @fast_trace.setter
+    def fast_trace(self, f: bool):
+        self._fast_trace = f
+
     @property
     def page_delimiter(self):
         return self._page_delimiter
@@ -306,8 +339,10 @@ class XPDF(Tracer, Hybrid, FontExtractor):
             else:
                 doc_path = self._doc
             try:
-                cmd = [self._pdftoppm_path,
-                       doc_path]
+                cmd = [self._pdftoppm_path]
+                if self._fast_trace:
+                    cmd.extend(_FAST_TRACE_ARGS)
+                cmd.append(doc_path)
                 if self._validate_hash:
                     pages = self._parse_page_hashes
                     if pages is not None:
@@ -388,35 +423,102 @@ class XPDF(Tracer, Hybrid, FontExtractor):
 
     def _render_page(self, page: int):
         render: PngImageFile = self._xpdf_render(pages=page).get(page)
-        if self._caching:
+        if self._caching and render is not None:
             self._renders[page] = render
         return render
 
     def _render_doc(self):
+        if self._sharded:
+            return self._render_sharded()
+        if self._page_timeout is not None:
+            return self._render_streamed()
         renders: Dict[int, PngImageFile] = self._xpdf_render(pages=None)
         if self._caching:
             self._full_doc_rendered = True
-            self._renders = renders
+            self._renders.update(renders)
         return renders
 
+    def _render_range(self, pages):
+        if self._page_timeout is not None:
+            return dict(self._iter_render_pages(pages))
+        return self._xpdf_render(pages=pages)
+
     def _render_pages(self, pages):
         renders: Dict[int, PngImageFile] = self._xpdf_render(pages=pages)
         if self._caching:
             self._renders.update(renders)
         return renders
 
+    @property
+    def _render_suffix(self):
+        return '.pgm' if self._gray else '.ppm'
+
+    def _pdftoppm_command(self, pages, num_pages, doc_path, out_prefix, hash_dpi=None):
+        if hash_dpi is not None:
+            # xpdf's pdftoppm has no option to scale to a pixel size, so the resolution is picked from the page size
+            cmd = [self._pdftoppm_path, '-gray', '-r', str(hash_dpi)]
+        else:
+            cmd = [self._pdftoppm_path, '-r', str(self._dpi)]
+            if self._gray:
+                cmd.append('-gray')
+        if pages is not None:
+            first_page = str(min(max(0, min(pages)), num_pages - 1) + 1)
+            last_page = str(min(num_pages - 1, max(pages)) + 1)
+            cmd.extend(['-f', first_page, '-l', last_page])
+        cmd.extend([doc_path, out_prefix])
+        return shlex.split(' '.join([entry for entry in cmd]))
+
+    def _iter_render_pages(self, pages):
+        return self._stream_salvaging(pages, self._stream_pdftoppm)
+
+    def _iter_hash_renders(self, pages, size):
+        for (dpi, run) in self._hash_dpi_runs(pages, size):
+            yield from self._stream_salvaging(run, partial(self._stream_pdftoppm, hash_dpi=dpi), log=False)
+
+    def _collect_stream_messages(self, stderr, timed_out):
+        if len(stderr) == 0:
+            return
+        self._render_exit_code = 0 if timed_out else max(code for (code, _) in stderr)
+        if self._messages is None:
+            err = fix_splits(b''.join(err for (_, err) in stderr).decode(locale.getpreferredencoding()))
+            error_arr = [message for message in err.split('\n') if len(message) > 0]
+            if timed_out:
+                error_arr.insert(0, 'Error: Subprocess timed out: %i' % (self._page_timeout or self._timeout or 600))
+            self._messages = ['No warnings'] if len(error_arr) == 0 else error_arr
+            self._trace_exit_code = self._render_exit_code
+            self._file_timed_out[TRACER] = timed_out
+
+    def _stream_pdftoppm(self, pages, hash_dpi=None, stderr=None):
+        num_pages = self.num_pages
+        if num_pages == 0 and pages is not None:
+            num_pages = max(pages) + 1
+        with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
+            if isinstance(self._doc, bytes):
+                file_hash = hash_file(self._doc)
+                doc_path = os.path.join(temp_path, file_hash)
+                with open(doc_path, 'wb') as doc_out:
+                    doc_out.write(self._doc)
+            else:
+                doc_path = self._doc
+            out_dir = os.path.join(temp_path, 'renders')
+            os.mkdir(out_dir)
+            cmd = self._pdftoppm_command(pages, num_pages, doc_path, os.path.join(out_dir, 'out'), hash_dpi=hash_dpi)
+            suffix = self._render_suffix if hash_dpi is None else '.pgm'
+            stuck = yield from self._stream_subprocess(cmd, out_dir, _output_page_parser('out-', suffix), pages=pages,
+                                                       first_page=0, log=hash_dpi is None, stderr=stderr)
+        return stuck
+
     def _xpdf_render(self, pages=None):
         if isinstance(pages, int):
             pages = [pages]
+        if pages is not None:
+            runs = _plan_page_runs(pages)
+            if len(runs) > 1:
+                return self._render_runs(runs, self._xpdf_render)
         num_pages = self.num_pages
         if num_pages == 0 and pages is not None:
             num_pages = max(pages) + 1
         start_time = time.perf_counter()
-        cmd = [self._pdftoppm_path, '-r', str(self._dpi)]
-        if pages is not None:
-            first_page = str(min(max(0, min(pages)), num_pages - 1) + 1)
-            last_page = str(min(num_pages - 1, max(pages)) + 1)
-            cmd.extend(['-f', first_page, '-l', last_page])
         with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
             if isinstance(self._doc, bytes):
                 file_hash = hash_file(self._doc)
@@ -426,11 +528,10 @@ class XPDF(Tracer, Hybrid, FontExtractor):
             else:
                 doc_path = self._doc
             try:
-                cmd.extend([doc_path, os.path.join(temp_path, 'out')])
-                cmd = ' '.join([entry for entry in cmd])
-                sp = subprocess.Popen(shlex.split(cmd), stderr=subprocess.PIPE, stdout=subprocess.PIPE, shell=False)
+                cmd = self._pdftoppm_command(pages, num_pages, doc_path, os.path.join(temp_path, 'out'))
+                sp = subprocess.Popen(cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, shell=False)
+                (_, err) = sp.communicate(timeout=self._timeout or 600)
                 self._render_exit_code = sp.returncode
-                (_, err) = sp.communicate(self._timeout or 600)
                 if pages is None and self._messages is None:
                     self._trace_exit_code = sp.returncode
                     decoder = locale.getpreferredencoding()
@@ -439,32 +540,38 @@ class XPDF(Tracer, Hybrid, FontExtractor):
                     self._messages = ['No warnings'] if len(error_arr) == 0 else error_arr
                     self._file_timed_out[TRACER] = False
                 result: Dict[int, PngImageFile] = dict()
-                for render in [file for file in os.listdir(temp_path) if file.endswith('.ppm')]:
-                    page_index = int(re.sub('out-', '', re.sub('.ppm', '', render))) - 1
+                suffix = self._render_suffix
+                for render in [file for file in os.listdir(temp_path) if file.endswith(suffix)]:
+                    page_index = int(re.sub('out-', '', re.sub(suffix, '', render))) - 1
                     if pages is None or page_index in pages:
-                        result[page_index] = Image.open(os.path.join(temp_path, render))
+                        result[page_index] = _load_image(os.path.join(temp_path, render))
                 num_pages = len(result)
                 timing = time.perf_counter() - start_time
                 for page in result.keys():
                     self._logs[page] = {'result': SUCCESS, 'timing': timing / num_pages}
-            except TimeoutError:
+                self._file_timed_out[RENDER] = False
+            except TimeoutExpired:
+                sp.kill()
+                sp.communicate()
                 self._render_exit_code = 0
-                if page is None and self._messages is None:
+                if pages is None and self._messages is None:
                     error_arr = ['Error: Subprocess timed out: %i' % (self._timeout or 600)]
                     self._messages = error_arr
                     self._trace_exit_code = 0
                     self._file_timed_out[TRACER] = True
                 result: Dict[int, PngImageFile] = dict()
-                self._logs[0] = {'result': 'Timed out', 'timing': (self._timeout or 600)}
+                self._logs[0 if pages is None else min(pages)] = {'result': 'Timed out',
+                                                                  'timing': (self._timeout or 600)}
+                self._file_timed_out[RENDER] = True
             except Exception as e:
-                if page is None and self._messages is None:
+                if pages is None and self._messages is None:
                     error_arr = str(e).split('\n')
                     self._messages = error_arr
                     self._trace_exit_code = 0
                     self._file_timed_out[TRACER] = False
                 result: Dict[int, PngImageFile] = dict()
                 timing = time.perf_counter() - start_time
-                self._logs[0] = {'result': str(e), 'timing': timing}
+                self._logs[0 if pages is None else min(pages)] = {'result': str(e), 'timing': timing}
 
         if pages is not None and len(pages) == 1:
             page = pages[0]
@@ -476,7 +583,7 @@ class XPDF(Tracer, Hybrid, FontExtractor):
 
     def _extract_doc(self):
         if self._ocr:
-            for (page, pil) in self.get_renders().items():
+            for (page, pil) in self.iter_renders():
                 self._text[page] = _ocr_text(pil)
         else:
             with tempfile.TemporaryDirectory(dir=self._temp_folders_dir) as temp_path:
@@ -4,9 +4,10 @@ from func_timeout import func_timeout, FunctionTimedOut
 
 from sparclur._parser import REJECTED_AMBIG
 from sparclur._prc_sim import PRCSim
+from sparclur._renderer import _timed_compare, _align_renders
 from sparclur.parsers.present_parsers import get_sparclur_renderers
 from sparclur.prc._prc import _parse_renderers
-from sparclur.utils._tools import create_file_list, gen_flatten
+from sparclur.utils._tools import create_file_list, gen_flatten, RenderFeatures
 from tqdm import tqdm
 from pebble import ProcessPool
 from concurrent.futures import TimeoutError
@@ -25,44 +26,123 @@ AVAILABLE_METRICS = ['sim',
                      ]
 
 
-def _prc_worker(entry):
-    path = entry['path']
-    file = path.split(os.path.sep)[-1]
+def _col_name(combo):
+    return '%s_%s' % (combo[0], combo[1]) if combo[0] < combo[1] else '%s_%s' % (combo[1], combo[0])
+
+
+def _load_renderers(entry, dpi=None):
     renderers = {renderer: AVAILABLE_RENDERERS[renderer] for renderer in entry['renderers']}
-    metrics = entry['metrics']
     parser_args = entry['parser_args']
-    timeout = entry['timeout']
-    result = {'file': file, 'path': path}
     renders = dict()
     for (name, renderer) in renderers.items():
-        args = parser_args.get(name, dict())
-        args['cache_renders'] = True
-        args['timeout'] = timeout
-        renders[name] = renderer(doc=path, skip_check=True, **args)
-    observed_pages = []
-    for renderer in renders.values():
-        r = renderer.get_renders()
-        observed_pages.append(len(r))
-    num_pages = max(max(observed_pages), 1)
-    overall_result = []
-    for i in range(num_pages):
+        args = dict(parser_args.get(name, dict()))
+        args['cache_renders'] = False
+        args['timeout'] = entry['timeout']
+        if dpi is not None:
+            args['dpi'] = dpi
+        if entry.get('render_store') is not None:
+            args['render_store'] = entry['render_store']
+        renders[name] = renderer(doc=entry['path'], skip_check=True, **args)
+    return renders
+
+
+def _compare_streams(renders, metrics, timeout, result, pages=None, lowest_sims=False):
+    """
+    Walk the render streams of every renderer in lockstep so only the current page of each renderer is held in
+    memory, and compare each pair of renderers page by page. Only the requested metrics are computed, plus the
+    overall similarity when `lowest_sims` is set.
+
+    Returns
+    -------
+    Tuple[Dict[int, Dict[str, Any]], Dict[int, float]]
+        The result row of each page and, when `lowest_sims` is set, the lowest similarity of the page over all
+        renderer pairs
+    """
+    compared_metrics = list(metrics) + (['sim'] if lowest_sims and 'sim' not in metrics else [])
+    streams = {name: renderer.iter_renders(pages) for (name, renderer) in renders.items()}
+    heads = {name: next(stream, None) for (name, stream) in streams.items()}
+    rows = dict()
+    lowest = dict()
+
+    def page_result(i, pils):
         i_result = {key: val for (key, val) in result.items()}
         i_result['page'] = i
         for (name, renderer) in renders.items():
-            renderer.get_renders(i)
-            page_log = renderer.logs[i]
+            page_log = renderer.logs.get(i, dict())
             i_result['%s_render' % name] = page_log.get('result', None)
             i_result['%s_timing' % name] = page_log.get('timing', None)
-            i_result['%s_status' % name] = renderer.validate_renderer['status']
+        sims = []
+        # The features of each render are computed once and shared by every pair the renderer is part of
+        features = {name: RenderFeatures(pil) for (name, pil) in pils.items() if pil is not None}
         for combo in itertools.combinations(renders.keys(), 2):
-            col_name = '%s_%s' % (combo[0], combo[1]) if combo[0] < combo[1] else '%s_%s' % (combo[1], combo[0])
-            sim_result: PRCSim = renders[combo[0]].compare(renders[combo[1]], page=i, full=False)
-            sim_metrics = sim_result.all_metrics
+            col_name = _col_name(combo)
+            # Every renderer draws the same document, so renders that differ by a rounding pixel are aligned
+            left_pil, right_pil = pils.get(combo[0]), pils.get(combo[1])
+            left, right = _align_renders(i, renders[combo[0]], left_pil, renders[combo[1]], right_pil)
+            left = features.get(combo[0]) if left is left_pil else left
+            right = features.get(combo[1]) if right is right_pil else right
+            sim_result: PRCSim = _timed_compare(left, right, False, timeout, metrics=compared_metrics)
+            sim_metrics = sim_result.get_metrics(compared_metrics)
             for metric in metrics:
                 i_result['%s_%s' % (col_name, metric)] = sim_metrics[metric]
-            # i_result['%s_sim' % col_name] = ssim_result.sim
             i_result['%s_result' % col_name] = sim_result.result
-        overall_result.append(i_result)
+            if lowest_sims:
+                sims.append(sim_metrics['sim'])
+        rows[i] = i_result
+        if lowest_sims:
+            lowest[i] = None if len(sims) == 0 or None in sims else min(sims)
+
+    next_page = 0
+    while True:
+        available = [head[0] for head in heads.values() if head is not None]
+        if len(available) == 0:
+            break
+        i = min(available)
+        if pages is None:
+            for missing in range(next_page, i):
+                page_result(missing, dict())
+        pils = dict()
+        for (name, head) in heads.items():
+            if head is not None and head[0] == i:
+                pils[name] = head[1]
+                heads[name] = next(streams[name], None)
+        page_result(i, pils)
+        next_page = i + 1
+    for missing in ([0] if pages is None else pages):
+        if missing not in rows:
+            page_result(missing, dict())
+    return rows, lowest
+
+
+def _prc_worker(entry):
+    path = entry['path']
+    file = path.split(os.path.sep)[-1]
+    metrics = entry['metrics']
+    timeout = entry['timeout']
+    adaptive_dpi = entry.get('adaptive_dpi')
+    result = {'file': file, 'path': path}
+    renders = _load_renderers(entry, dpi=adaptive_dpi)
+    rows, lowest_sims = _compare_streams(renders, metrics, timeout, result, lowest_sims=adaptive_dpi is not None)
+    statuses = {name: renderer.validate_renderer['status'] for (name, renderer) in renders.items()}
+    if adaptive_dpi is not None:
+        # Only pages that do not look near-identical at the coarse resolution are rendered again at the target dpi
+        threshold = entry['refine_threshold']
+        refine = sorted(page for (page, sim) in lowest_sims.items() if sim is None or sim < threshold)
+        col_names = [_col_name(combo) for combo in itertools.combinations(renders.keys(), 2)]
+        for (page, i_result) in rows.items():
+            for col_name in col_names:
+                for metric in metrics:
+                    i_result['%s_coarse_%s' % (col_name, metric)] = i_result['%s_%s' % (col_name, metric)]
+            i_result['refined'] = page in refine
+        if len(refine) > 0:
+            fine_renders = _load_renderers(entry)
+            fine_rows, _ = _compare_streams(fine_renders, metrics, timeout, result, pages=refine)
+            for page in refine:
+                rows[page].update(fine_rows[page])
+    overall_result = [rows[page] for page in sorted(rows.keys())]
+    for (name, status) in statuses.items():
+        for i_result in overall_result:
+            i_result['%s_status' % name] = status
     return overall_result
 
 
@@ -75,7 +155,7 @@ def _error_result(path, error, renderers, metrics):
         d['%s_timing' % renderer] = None
         d['%s_status' % renderer] = REJECTED_AMBIG
     for combo in combos:
-        col_name = '%s_%s' % (combo[0], combo[1]) if combo[0] < combo[1] else '%s_%s' % (combo[1], combo[0])
+        col_name = _col_name(combo)
         for metric in metrics:
             d['%s_%s' % (col_name, metric)] = None
         d['%s_result' % col_name] = error
@@ -155,7 +235,7 @@ def _set_metrics(m):
                 "Please select one or more of the available metrics: %s" % ', '.join(AVAILABLE_METRICS)
             metrics = [m]
     elif isinstance(m, list):
-        metrics = AVAILABLE_METRICS.intersection(m)
+        metrics = [metric for metric in AVAILABLE_METRICS if metric in m]
         assert len(metrics) != 0, \
             "Please select one or more of the available metrics: %s" % ', '.join(AVAILABLE_METRICS)
     return metrics
@@ -174,7 +254,10 @@ class Analyzer:
                  recurse=False,
                  base_path=None,
                  progress_bar=True,
-                 save_path=None):
+                 save_path=None,
+                 render_store=None,
+                 adaptive_dpi=None,
+                 refine_threshold=0.95):
         """
 
         Parameters
@@ -204,6 +287,16 @@ class Analyzer:
             Whether or not to display a progress bar
         save_path: str
             If specified, will save a csv of the run results to save_path
+        render_store: str or RenderStore
+            Directory of a shared render store. Workers read renders of the same document, renderer and dpi from the
+            store instead of re-rendering them and publish their own renders to it.
+        adaptive_dpi: int
+            If specified, every page is first rendered and compared at this low dpi. Only the pages where a pair of
+            renderers scores a SPARCLUR similarity below refine_threshold are rendered again at the renderers' target
+            dpi and compared again. The coarse scores are reported in the `<pair>_coarse_<metric>` columns and the
+            `refined` column marks the re-compared pages.
+        refine_threshold: float
+            The similarity below which a page compared at adaptive_dpi is re-compared at the target dpi
         """
         self._renderers = _parse_renderers(renderers)
         self._metrics = _set_metrics(metrics)
@@ -214,6 +307,9 @@ class Analyzer:
         self._overall_timeout = overall_timeout
         self._progress_bar = progress_bar
         self._save_path = save_path
+        self._render_store = render_store
+        self._adaptive_dpi = adaptive_dpi
+        self._refine_threshold = refine_threshold
 
     @property
     def max_workers(self):
@@ -285,6 +381,24 @@ class Analyzer:
     def progress_bar(self):
         self._progress_bar = False
 
+    @property
+    def adaptive_dpi(self):
+        """Return the dpi of the coarse comparison pass or None if every page is compared at the target dpi"""
+        return self._adaptive_dpi
+
+    @adaptive_dpi.setter
+    def adaptive_dpi(self, dpi):
+        self._adaptive_dpi = dpi
+
+    @property
+    def refine_threshold(self):
+        """Return the similarity below which coarse comparisons are refined at the target dpi"""
+        return self._refine_threshold
+
+    @refine_threshold.setter
+    def refine_threshold(self, t):
+        self._refine_threshold = t
+
     @property
     def save_path(self):
         return self._save_path
@@ -309,7 +423,10 @@ class Analyzer:
              'renderers': self._renderers,
              'parser_args': self._parser_args,
              'timeout': self._timeout,
-             'metrics': self._metrics}
+             'metrics': self._metrics,
+             'render_store': self._render_store,
+             'adaptive_dpi': self._adaptive_dpi,
+             'refine_threshold': self._refine_threshold}
             for path in self._files
         ]
         if self._max_workers == 1:
@@ -25,7 +25,10 @@ class PRCViz:
                  renderers=get_sparclur_renderers(),
                  parser_args=dict(),
                  dpi=200,
-                 verbose=False):
+                 verbose=False,
+                 adaptive_dpi=None,
+                 refine_threshold=0.95,
+                 diff_threshold=None):
         """
 
         Parameters
@@ -37,13 +40,25 @@ class PRCViz:
         parser_args : Dict[str, Dict[str, Any]]
             A dictionary of dictionaries containing any optional parameters to pass into the renderers. See each
             renderer for it's possible parameters.
+        adaptive_dpi : int
+            If specified, the pages are first compared at this low dpi and only the pages where a pair of renderers
+            scores below refine_threshold are rendered and compared again at the target dpi.
+        refine_threshold : float
+            The similarity below which a page compared at adaptive_dpi is re-compared at the target dpi
+        diff_threshold : float
+            If specified, the difference images are only generated up front for pages whose similarity is at or below
+            this threshold. The difference of any other page is generated when the page is displayed.
         """
         self._doc_path = doc_path
         self._doc = doc_path.split('/')[-1]
         self._renderers = _parse_viz_renderers(renderers)
         self._renders = dict()
         self._sims = dict()
+        self._coarse_sims = dict()
+        self._refined_pages = None
         self._ssims_fig = None
+        self._diff_threshold = diff_threshold
+        self._displayed_diffs = dict()
         if verbose:
             print('Rendering:')
         for name, renderer in self._renderers.items():
@@ -66,11 +81,52 @@ class PRCViz:
         assert len(set([renderer.doc for renderer in self._renders.values()])) == 1, \
             "Document paths do not match for all renderers"
         self._sim_keys = list(itertools.combinations(self._renders.keys(), 2))
+        if adaptive_dpi is None:
+            for combo in self._sim_keys:
+                if verbose:
+                    print('SIMing %s/%s' % (combo[0], combo[1]))
+                self._sims[combo] = self._renders[combo[0]].compare(self._renders[combo[1]], full=True,
+                                                                    diff_threshold=diff_threshold)
+        else:
+            self._adaptive_sims(adaptive_dpi, refine_threshold, verbose)
+        self._observed_pages = max(len(entry) for entry in self._sims.values())
+
+    def _adaptive_sims(self, adaptive_dpi, refine_threshold, verbose):
+        target_dpis = {name: renderer.dpi for (name, renderer) in self._renders.items()}
+        for renderer in self._renders.values():
+            renderer.caching = False
+            renderer.dpi = adaptive_dpi
         for combo in self._sim_keys:
             if verbose:
-                print('SIMing %s/%s' % (combo[0], combo[1]))
-            self._sims[combo] = self._renders[combo[0]].compare(self._renders[combo[1]], full=True)
-        self._observed_pages = max(len(entry) for entry in self._sims.values())
+                print('Coarse SIMing %s/%s at %i dpi' % (combo[0], combo[1], adaptive_dpi))
+            self._coarse_sims[combo] = self._renders[combo[0]].compare(self._renders[combo[1]], full=True,
+                                                                       diff_threshold=self._diff_threshold)
+        for (name, renderer) in self._renders.items():
+            renderer.dpi = target_dpis[name]
+            renderer.caching = True
+        refine = set()
+        for sims in self._coarse_sims.values():
+            refine.update(page for (page, prc_sim) in sims.items()
+                          if prc_sim.sim is None or prc_sim.sim < refine_threshold)
+        self._refined_pages = sorted(refine)
+        for combo in self._sim_keys:
+            if verbose:
+                print('SIMing %s/%s on %i pages' % (combo[0], combo[1], len(self._refined_pages)))
+            self._sims[combo] = dict(self._coarse_sims[combo])
+            for page in self._refined_pages:
+                self._sims[combo][page] = self._renders[combo[0]].compare(self._renders[combo[1]], page=page,
+                                                                          full=True,
+                                                                          diff_threshold=self._diff_threshold)
+
+    @property
+    def coarse_sims(self):
+        """The comparisons of the low dpi pass of an adaptive run for each pair of renderers"""
+        return self._coarse_sims
+
+    @property
+    def refined_pages(self):
+        """The pages that were compared again at the target dpi in an adaptive run"""
+        return self._refined_pages
 
     def get_observed_pages(self):
         """Return the number of observed pages from the renderers"""
@@ -123,6 +179,16 @@ class PRCViz:
             self._ssims_fig = fig
         return self._ssims_fig
 
+    def _page_diff(self, combo, page):
+        """The difference image of a page, generated on first display if the diff threshold skipped it"""
+        diff = self._sims[combo][page].diff
+        if diff is None and self._diff_threshold is not None:
+            if (combo, page) not in self._displayed_diffs:
+                self._displayed_diffs[(combo, page)] = \
+                    self._renders[combo[0]].compare(self._renders[combo[1]], page=page, full=True).diff
+            diff = self._displayed_diffs[(combo, page)]
+        return diff
+
     def display(self, page, renderers=None, width=10, height=10, save_path=None):
         """
         Show the comparison between the specified renderers and the visual difference between them.
@@ -153,7 +219,8 @@ class PRCViz:
         fig.suptitle('Comparisons for %s\nPage: %s' % (self._doc, page))
 
         for (row, combo) in enumerate(renderers):
-            images = [self._renders[combo[0]].get_renders(page), self._renders[combo[1]].get_renders(page), self._sims[combo][page].diff]
+            images = [self._renders[combo[0]].get_renders(page), self._renders[combo[1]].get_renders(page),
+                      self._page_diff(combo, page)]
             labels = ['', '', self._sims[combo][page].sim]
             titles = [combo[0], combo[1], 'diff']
             if nrows > 1:
@@ -164,7 +231,7 @@ class PRCViz:
                     axes[row, col].set_yticklabels([])
                     axes[row, col].set_xticks([])
                     axes[row, col].set_yticks([])
-                    axes[row, col].imshow(image)
+                    axes[row, col].imshow(image, cmap='gray')
                     axes[row, col].set_xlabel(labels[col])
             else:
                 for col in range(3):
@@ -174,7 +241,7 @@ class PRCViz:
                     axes[col].set_yticklabels([])
                     axes[col].set_xticks([])
                     axes[col].set_yticks([])
-                    axes[col].imshow(image)
+                    axes[col].imshow(image, cmap='gray')
                     axes[col].set_xlabel(labels[col])
 
         if save_path is not None:
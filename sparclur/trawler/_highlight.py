@@ -16,7 +16,7 @@ import cv2
 from tqdm import tqdm
 from pebble import ProcessPool
 
-from sparclur.utils._tools import _get_contours
+from sparclur.utils._tools import _get_contours, _changed_regions
 
 
 def _parse_renderers(parsers):
@@ -54,21 +54,33 @@ def _worker(entry):
     ent_threshold = entry['ent_threshold']
     renderers = entry['renderers']
     parser_args = entry['parser_args']
+    render_store = entry.get('render_store', None)
+    localizer = entry.get('localizer', 'ssim')
     results = []
     for (name, parser) in renderers.items():
         try:
             args = parser_args.get(name, dict())
+            if render_store is not None:
+                args['render_store'] = render_store
             orig: Renderer = parser(doc=orig_file, dpi=dpi, timeout=timeout, cache_renders=True, **args)
             mod: Renderer = parser(doc=mod_file, dpi=dpi, timeout=timeout, cache_renders=True, **args)
-            prc: Dict[int, PRCSim] = orig.compare(mod, full=True)
+            if localizer == 'tiles':
+                # Regions come from the tile hashes, so no page needs an SSIM diff up front
+                prc: Dict[int, PRCSim] = orig.compare(mod)
+            else:
+                # Diffs are only needed for the pages that fall under the threshold
+                prc: Dict[int, PRCSim] = orig.compare(mod, full=True, diff_threshold=prc_threshold)
             for (page, sim) in prc.items():
                 if sim.sim <= prc_threshold:
                     try:
-                        orig_page = pil_to_hex_array(orig.get_renders(page))
-                        mod_page = pil_to_hex_array(mod.get_renders(page))
-                        filtered_contours = _get_contours(min_region, sim.diff)
-                        for c in filtered_contours:
-                            x, y, w, h = cv2.boundingRect(c)
+                        orig_pil, mod_pil = orig.get_renders(page), mod.get_renders(page)
+                        orig_page = pil_to_hex_array(orig_pil)
+                        mod_page = pil_to_hex_array(mod_pil)
+                        regions = _changed_regions(orig_pil, mod_pil, min_region) if localizer == 'tiles' else None
+                        if regions is None:
+                            diff = sim.diff if sim.diff is not None else orig.compare(mod, page=page, full=True).diff
+                            regions = [cv2.boundingRect(c) for c in _get_contours(min_region, diff)]
+                        for (x, y, w, h) in regions:
                             w = int(w)
                             h = int(h)
                             x = int(x)
@@ -134,7 +146,8 @@ class Highlight:
                  max_workers: int = 1,
                  timeout: int = None,
                  overall_timeout: int = None,
-                 progress_bar: bool = True):
+                 progress_bar: bool = True,
+                 render_store: str = None):
         """
 
         Parameters
@@ -151,6 +164,9 @@ class Highlight:
             The number of seconds before the task is cancelled in the mutli-processing.
         progress_bar: bool
             Whether or not a progress bar should be displayed during message gathering.
+        render_store: str or RenderStore
+            Directory of a shared render store so that an original compared against many modified files is only
+            rendered once across all of the workers.
         """
 
         self._renderers = _parse_renderers(renderers)
@@ -159,6 +175,7 @@ class Highlight:
         self._timeout = timeout
         self._overall_timeout = overall_timeout
         self._progress_bar = progress_bar
+        self._render_store = render_store
 
     @property
     def renderers(self):
@@ -226,7 +243,8 @@ class Highlight:
                             recurse: bool = False,
                             extension: str = None,
                             base_path: str = None,
-                            save_path: str = None):
+                            save_path: str = None,
+                            localizer: str = 'ssim'):
         """
 
         Parameters
@@ -256,8 +274,14 @@ class Highlight:
             A base directory that should be appended to the list of files passed into file_set
         save_path: str
             If specified, will save a csv of the run results to save_path
+        localizer: str
+            How the regions of difference are found. 'ssim' thresholds the SSIM diff of the page and takes the
+            contours. 'tiles' hashes fixed-size tiles of both renders and merges the tiles that differ into regions,
+            which needs no SSIM and suits documents where only a small area, e.g. a signature or stamp, changed.
         """
 
+        assert localizer in ['ssim', 'tiles'], "The localizer must be 'ssim' or 'tiles'"
+
         mod_files = create_file_list(file_set, recurse=recurse, base_path=base_path, extension=extension)
 
         if isinstance(matching_criteria, dict):
@@ -273,7 +297,9 @@ class Highlight:
                  'prc_threshold': prc_threshold,
                  'ent_threshold': ent_threshold,
                  'renderers': self._renderers,
-                 'parser_args': self._parser_args} for (mod_file, orig) in matched_files]
+                 'parser_args': self._parser_args,
+                 'render_store': self._render_store,
+                 'localizer': localizer} for (mod_file, orig) in matched_files]
 
         if self._num_workers == 1:
             results = [_worker(entry) for entry in data]
@@ -1,2 +1,3 @@
 from ._tools import *
-from ._config import *
\ No newline at end of file
+from ._config import *
+from ._handles import *
@@ -0,0 +1,246 @@
+import atexit
+import threading
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Union
+
+from sparclur.utils._config import _get_config_param, _load_config
+
+
+class _OpenHandles:
+    """
+    Process wide least-recently-used registry of the document handles that are currently open. When a maximum is set,
+    opening or touching a handle beyond the limit closes the least recently used handle of another instance that is
+    not currently checked out. The evicted handle is transparently re-opened the next time its owner asks for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._handles: OrderedDict = OrderedDict()
+        # Keys of garbage collected handles. Weakref callbacks can run in any thread at any point, so they only queue
+        # the key and the registry is purged under the lock.
+        self._dead = deque()
+        self._max_open = None
+        self._configured = False
+        self._exit_registered = False
+
+    @property
+    def max_open(self):
+        with self._lock:
+            if not self._configured:
+                self._max_open = _get_config_param(DocumentHandle, _load_config(), 'max_open', None, None)
+                self._configured = True
+            return self._max_open
+
+    @max_open.setter
+    def max_open(self, m: Union[int, None]):
+        assert m is None or m > 0, "The maximum number of open handles must be positive"
+        with self._lock:
+            self._max_open = m
+            self._configured = True
+        self._evict()
+
+    def __len__(self):
+        with self._lock:
+            self._purge()
+            return len(self._handles)
+
+    def _purge(self):
+        while len(self._dead) > 0:
+            key = self._dead.popleft()
+            ref = self._handles.get(key)
+            # The id may already have been reused by a handle registered after the dead one
+            if ref is not None and ref() is None:
+                del self._handles[key]
+
+    def touch(self, handle: 'DocumentHandle'):
+        key = id(handle)
+        with self._lock:
+            if not self._exit_registered:
+                # Registered on first use, i.e. after the parser libraries were imported, so that open handles are
+                # closed before the libraries run their own exit hooks and tear down.
+                atexit.register(self.close_all)
+                self._exit_registered = True
+            self._purge()
+            if key in self._handles and self._handles[key]() is handle:
+                self._handles.move_to_end(key)
+            else:
+                self._handles[key] = weakref.ref(handle, lambda _, k=key, dead=self._dead: dead.append(k))
+        self._evict(keep=handle)
+
+    def discard(self, handle: 'DocumentHandle'):
+        with self._lock:
+            self._purge()
+            ref = self._handles.get(id(handle))
+            if ref is not None and ref() is handle:
+                del self._handles[id(handle)]
+
+    def close_all(self):
+        with self._lock:
+            self._purge()
+            handles = [ref() for ref in self._handles.values()]
+        for handle in handles:
+            if handle is not None:
+                handle.close()
+
+    def _evict(self, keep=None):
+        max_open = self.max_open
+        if max_open is None:
+            return
+        with self._lock:
+            self._purge()
+            excess = len(self._handles) - max_open
+            if excess <= 0:
+                return
+            candidates = [(key, ref()) for (key, ref) in self._handles.items() if keep is None or key != id(keep)]
+        for key, handle in candidates:
+            if excess <= 0:
+                break
+            # Handles checked out by another thread are skipped and stay registered
+            if handle is None or handle._close_idle():
+                with self._lock:
+                    ref = self._handles.get(key)
+                    if ref is not None and ref() is handle:
+                        del self._handles[key]
+                excess -= 1
+
+
+_OPEN_HANDLES = _OpenHandles()
+
+
+class DocumentHandle:
+    """
+    Lazily opened, explicitly closable handle to a document loaded by an in-process parser library (e.g. fitz or
+    PDFium). The document is only parsed on the first call to `get` and the same handle is returned until `close` is
+    called, so page level calls do not repeat the xref parsing for every page.
+    """
+
+    def __init__(self, opener: Callable[[], Any], closer: Callable[[Any], None]):
+        """
+        Parameters
+        ----------
+        opener : Callable[[], Any]
+            Loads the document and returns the library specific handle.
+        closer : Callable[[Any], None]
+            Releases a handle returned by the opener.
+        """
+        self._opener = opener
+        self._closer = closer
+        self._handle = None
+        self._users = 0
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        return {'_opener': self._opener, '_closer': self._closer}
+
+    def __setstate__(self, state):
+        self.__init__(state['_opener'], state['_closer'])
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    @property
+    def is_open(self):
+        return self._handle is not None
+
+    @property
+    def in_use(self):
+        """Whether the handle is currently checked out with `use`"""
+        return self._users > 0
+
+    def get(self):
+        """
+        Return the open handle, loading the document if it is not already open.
+
+        Returns
+        -------
+        Any
+            The library specific document handle
+        """
+        with self._lock:
+            if self._handle is None:
+                self._handle = self._opener()
+            handle = self._handle
+        _OPEN_HANDLES.touch(self)
+        return handle
+
+    @contextmanager
+    def use(self):
+        """
+        Check the handle out for the duration of a `with` block. A checked out handle is never closed by the eviction
+        of other instances' handles.
+
+        Yields
+        ------
+        Any
+            The library specific document handle
+        """
+        with self._lock:
+            self._users += 1
+        try:
+            yield self.get()
+        finally:
+            with self._lock:
+                self._users -= 1
+
+    def _close_idle(self) -> bool:
+        """Close the handle for an eviction unless it is checked out. Returns whether it was closed."""
+        with self._lock:
+            if self._users > 0:
+                return False
+            handle = self._handle
+            self._handle = None
+        if handle is not None:
+            try:
+                self._closer(handle)
+            except Exception:
+                pass
+        return True
+
+    def close(self):
+        """Release the handle. The document is re-opened on the next call to `get`."""
+        with self._lock:
+            handle = self._handle
+            self._handle = None
+        _OPEN_HANDLES.discard(self)
+        if handle is not None:
+            try:
+                self._closer(handle)
+            except Exception:
+                pass
+
+    def discard(self):
+        """
+        Forget the handle without closing it. Used after a timed out call where the worker thread may still be using
+        the handle.
+        """
+        with self._lock:
+            self._handle = None
+        _OPEN_HANDLES.discard(self)
+
+
+def set_max_open_handles(max_open: Union[int, None]):
+    """
+    Bound the number of document handles that are held open at once across all parser instances. The least recently
+    used handles are closed once the bound is exceeded. `None` removes the bound.
+
+    Parameters
+    ----------
+    max_open : int or None
+        The maximum number of simultaneously open handles
+    """
+    _OPEN_HANDLES.max_open = max_open
+
+
+def get_max_open_handles():
+    """Return the bound on simultaneously open document handles or None if unbounded"""
+    return _OPEN_HANDLES.max_open
+
+
+def close_all_handles():
+    """Close every document handle that is currently open."""
+    _OPEN_HANDLES.close_all()
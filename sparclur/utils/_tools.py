@@ -2,7 +2,8 @@ import hashlib
 import os
 import site
 import sys
-from typing import Dict, List
+import threading
+from typing import Dict, List, Tuple
 
 import fitz
 import re
@@ -15,7 +16,8 @@ from PIL.PngImagePlugin import PngImageFile
 from PIL import Image
 from PIL.Image import Image as ImageType
 from func_timeout import FunctionTimedOut
-from math import log, e, sqrt
+from functools import lru_cache
+from math import sqrt
 import cv2
 import matplotlib.pyplot as plt
 
@@ -37,6 +39,46 @@ class InputError(Exception):
 
 _COMPARISON_SUCCESSFUL_MESSAGE = 'Successfully Compared'
 
+# Scores of two identical renders, which every metric rates as a perfect match
+_IDENTICAL_SCORES = {'entropy_sim': 1.0,
+                     'whash_sim': 1.0,
+                     'phash_sim': 1.0,
+                     'sum_square_sim': 1.0,
+                     'ccorr_sim': 1.0,
+                     'ccoeff_sim': 1.0,
+                     'size_sim': 1.0}
+
+# Process wide counters of the render comparisons and of those short-circuited because both renders were identical
+_COMPARISON_STATS = {'comparisons': 0, 'identical': 0}
+_COMPARISON_STATS_LOCK = threading.Lock()
+
+
+def comparison_stats() -> Dict[str, int]:
+    """
+    Return the number of render comparisons made by `image_compare` and `batch_image_compare` in this process and how
+    many of them were answered without computing any metric because the two renders were identical.
+
+    Returns
+    -------
+    Dict[str, int]
+    """
+    with _COMPARISON_STATS_LOCK:
+        return dict(_COMPARISON_STATS)
+
+
+def reset_comparison_stats():
+    """Reset the counters of `comparison_stats`"""
+    with _COMPARISON_STATS_LOCK:
+        for key in _COMPARISON_STATS.keys():
+            _COMPARISON_STATS[key] = 0
+
+
+def _record_comparison(identical: bool):
+    with _COMPARISON_STATS_LOCK:
+        _COMPARISON_STATS['comparisons'] += 1
+        if identical:
+            _COMPARISON_STATS['identical'] += 1
+
 
 def display_raw(file):
     assert os.path.isfile(file), 'File not found'
@@ -62,6 +104,53 @@ def stringify_dict(d):
         return '[' + ', '.join(result) + ']'
 
 
+# Side of the tiles the SSIM diff is computed in, and the halo a tile needs for the 7 pixel SSIM window
+_SSIM_TILE = 512
+_SSIM_HALO = 3
+
+
+def _tile_edges(length, tile):
+    edges = list(range(0, length, tile)) + [length]
+    if len(edges) > 2 and edges[-1] - edges[-2] < 2 * _SSIM_HALO + 1:
+        # A sliver at the end is merged into the previous tile
+        del edges[-2]
+    return edges
+
+
+def _tiled_ssim(gray1: np.ndarray, gray2: np.ndarray, tile: int = _SSIM_TILE):
+    """
+    `structural_similarity(gray1, gray2, full=True)` computed tile by tile. Each tile is extended by the halo of the
+    SSIM window so it sees the same local statistics as in the full-page computation, and tiles that are identical in
+    both images are filled in without computing anything. The diff is built directly as a uint8 map.
+
+    Returns
+    -------
+    Tuple[float, np.ndarray]
+        The mean SSIM and the uint8 SSIM map
+    """
+    h, w = gray1.shape[0:2]
+    diff = np.empty((h, w), dtype=np.uint8)
+    total = 0.0
+    for (y0, y1) in zip(_tile_edges(h, tile)[:-1], _tile_edges(h, tile)[1:]):
+        for (x0, x1) in zip(_tile_edges(w, tile)[:-1], _tile_edges(w, tile)[1:]):
+            ey0, ey1 = max(0, y0 - _SSIM_HALO), min(h, y1 + _SSIM_HALO)
+            ex0, ex1 = max(0, x0 - _SSIM_HALO), min(w, x1 + _SSIM_HALO)
+            tile1, tile2 = gray1[ey0:ey1, ex0:ex1], gray2[ey0:ey1, ex0:ex1]
+            # Only pixels at least a halo away from the page edges count towards the mean, as in skimage
+            cy0, cy1 = max(y0, _SSIM_HALO), min(y1, h - _SSIM_HALO)
+            cx0, cx1 = max(x0, _SSIM_HALO), min(x1, w - _SSIM_HALO)
+            if np.array_equal(tile1, tile2):
+                diff[y0:y1, x0:x1] = 255
+                total += max(cy1 - cy0, 0) * max(cx1 - cx0, 0)
+            else:
+                _, tile_map = structural_similarity(tile1, tile2, full=True)
+                tile_map = tile_map[y0 - ey0:y1 - ey0, x0 - ex0:x1 - ex0]
+                diff[y0:y1, x0:x1] = np.uint8(tile_map * 255)
+                if cy1 > cy0 and cx1 > cx0:
+                    total += tile_map[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0].sum()
+    return total / ((h - 2 * _SSIM_HALO) * (w - 2 * _SSIM_HALO)), diff
+
+
 def _template_ssim(pil1, pil2, top_left):
 
     h1, w1 = pil1.shape[0:2]
@@ -73,8 +162,7 @@ def _template_ssim(pil1, pil2, top_left):
         width_padding = (top_left[0], w1 - (w2 + top_left[0]))
         padding = (height_padding, width_padding)
         pil2 = np.pad(pil2, padding, 'constant', constant_values=255)
-    ssim, diff = structural_similarity(pil1, pil2, full=True)
-    return ssim, diff
+    return _tiled_ssim(pil1, pil2)
 
 
 def _pil_and_array(p: PngImageFile or np.array_like):
@@ -84,18 +172,172 @@ def _pil_and_array(p: PngImageFile or np.array_like):
         return Image.fromarray(p), p
 
 
-def image_compare(p1: PngImageFile or np.array_like,
-                  p2: PngImageFile or np.array_like,
-                  full: bool=False) -> PRCSim:
+def _gray_array(array: np.ndarray) -> np.ndarray:
+    """Return the single channel version of an image array, converting only when it has color channels."""
+    if array.ndim == 2:
+        return array
+    elif array.shape[2] == 4:
+        return cv2.cvtColor(array, cv2.COLOR_RGBA2GRAY)
+    else:
+        return cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
+
+
+def _display_array(array: np.ndarray) -> np.ndarray:
+    """Return a three channel copy of a single channel image array so that it can be annotated in color."""
+    return cv2.cvtColor(array, cv2.COLOR_GRAY2RGB) if array.ndim == 2 else array
+
+
+class RenderFeatures:
+    """
+    Lazily computed features of a single render: its perceptual hashes, entropy, grayscale array and size. Each
+    feature is computed on first use and kept, so a render that takes part in several comparisons is only analyzed
+    once. `image_compare` accepts these in place of images.
     """
-        Function to compute the structural similarity of two pngs.
 
+    def __init__(self, render: PngImageFile or np.array_like):
+        """
         Parameters
         ----------
-        p1 : PngImageFile or array_like
-        p2 : PngImageFile or array_like
+        render : PngImageFile or array_like
+        """
+        if isinstance(render, PngImageFile) or isinstance(render, ImageType):
+            self._pil, self._array = render, None
+        else:
+            self._pil, self._array = None, render
+        self._gray = None
+        self._entropy = None
+        self._digest = None
+        self._hashes = dict()
+
+    @property
+    def pil(self):
+        if self._pil is None:
+            self._pil = Image.fromarray(self._array)
+        return self._pil
+
+    @property
+    def array(self) -> np.ndarray:
+        """The pixel array of the render. Arrays converted from an image are read-only."""
+        if self._array is None:
+            self._array = np.asarray(self._pil)
+        return self._array
+
+    @property
+    def channels(self) -> int:
+        if self._pil is not None:
+            return len(self._pil.getbands())
+        return 1 if self._array.ndim == 2 else self._array.shape[2]
+
+    @property
+    def size(self):
+        """Width and height of the render in pixels"""
+        return self._pil.size if self._pil is not None else (self._array.shape[1], self._array.shape[0])
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Single channel array of the render"""
+        if self._gray is None:
+            self._gray = _gray_array(self.array)
+        return self._gray
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the arrays cached next to the image of the render"""
+        arrays = [] if self._array is None or self._pil is None else [self._array]
+        if self._gray is not None and self._gray is not self._array:
+            arrays.append(self._gray)
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def digest(self) -> bytes:
+        """Digest of the pixels of the render. Renders with equal digests are identical."""
+        if self._digest is None:
+            if self._pil is not None:
+                digest = hashlib.sha256(str((self._pil.mode, self._pil.size)).encode())
+                digest.update(self._pil.tobytes())
+            else:
+                array = np.ascontiguousarray(self._array)
+                digest = hashlib.sha256(str((array.shape, array.dtype.str)).encode())
+                digest.update(array.data)
+            self._digest = digest.digest()
+        return self._digest
+
+    @property
+    def entropy(self) -> float:
+        if self._entropy is None:
+            self._entropy = entropy(self.pil)
+        return self._entropy
+
+    def _hash(self, name, hash_func, hash_size):
+        key = (name, hash_size)
+        if key not in self._hashes:
+            self._hashes[key] = hash_func(self.pil, hash_size=hash_size)
+        return self._hashes[key]
+
+    def whash(self, hash_size: int = 128):
+        return self._hash('whash', whash, hash_size)
+
+    def phash(self, hash_size: int = 128):
+        return self._hash('phash', phash, hash_size)
+
+    def dhash(self, hash_size: int = 128):
+        return self._hash('dhash', dhash, hash_size)
+
+    def tile_hashes(self, tile: int = None) -> np.ndarray:
+        """The hash of every tile of the render, see `_tile_hashes`"""
+        tile = tile or _LOCALIZE_TILE
+        key = ('tiles', tile)
+        if key not in self._hashes:
+            self._hashes[key] = _tile_hashes(self.array, tile)
+        return self._hashes[key]
+
+
+def render_features(render: PngImageFile or np.array_like or RenderFeatures) -> RenderFeatures:
+    """Return the features of a render, wrapping images and arrays in a new `RenderFeatures`."""
+    return render if isinstance(render, RenderFeatures) else RenderFeatures(render)
+
+
+def _identical(features1: RenderFeatures, features2: RenderFeatures) -> bool:
+    if features1 is features2:
+        return True
+    if features1.size != features2.size or features1.channels != features2.channels:
+        return False
+    return features1.digest == features2.digest
+
+
+def _identical_compare(features: RenderFeatures, full: bool = False, diff_threshold: float = None) -> PRCSim:
+    """The comparison of a render with itself, as `image_compare` would score it"""
+    similarities = dict(_IDENTICAL_SCORES)
+    diff = None
+    if full and (diff_threshold is None or diff_threshold >= 1.0):
+        similarities['ssim'] = 1.0
+        diff = Image.new('L', features.size, 255)
+    return PRCSim(similarity_scores=similarities, result=_COMPARISON_SUCCESSFUL_MESSAGE, diff=diff)
+
+
+def image_compare(p1: PngImageFile or np.array_like or RenderFeatures,
+                  p2: PngImageFile or np.array_like or RenderFeatures,
+                  full: bool=False,
+                  lazy: bool=False,
+                  diff_threshold: float=None) -> PRCSim:
+    """
+        Function to compute the structural similarity of two pngs. Single channel (grayscale) images are compared
+        natively. When only one of the images is grayscale the other is converted to grayscale first. Pass
+        `RenderFeatures` to reuse the hashes and entropy of a render across comparisons. Identical renders are
+        recognized by their digest and scored as a perfect match without computing any metric.
+
+        Parameters
+        ----------
+        p1 : PngImageFile or array_like or RenderFeatures
+        p2 : PngImageFile or array_like or RenderFeatures
         full : bool
-            Flag that indicates the difference of the comparison should be returned
+            Flag that indicates the difference of the comparison should be returned. The difference is a single channel
+            SSIM map.
+        lazy : bool
+            Only compute each metric when it is first accessed on the returned PRCSim. Ignored when `full` is set.
+        diff_threshold : float
+            With `full`, only compute the SSIM and the difference when the similarity of the pages is at or below this
+            threshold. Near-identical pages are returned without a difference.
 
         Returns
         -------
@@ -104,88 +346,87 @@ def image_compare(p1: PngImageFile or np.array_like,
     if p1 is None or p2 is None:
         return PRCSim(dict(), 'Rendering failed', diff=None)
 
-    pil1, array1 = _pil_and_array(p1)
-    pil2, array2 = _pil_and_array(p2)
+    features1 = render_features(p1)
+    features2 = render_features(p2)
+
+    identical = _identical(features1, features2)
+    _record_comparison(identical)
+    if identical:
+        return _identical_compare(features1, full=full, diff_threshold=diff_threshold)
+    return _compare_features(features1, features2, full=full, lazy=lazy, diff_threshold=diff_threshold)
+
+
+def _compare_features(features1: RenderFeatures, features2: RenderFeatures, full: bool = False, lazy: bool = False,
+                      diff_threshold: float = None) -> PRCSim:
+    """Compute the metrics of `image_compare` for two renders"""
+    if (features1.channels == 1) != (features2.channels == 1):
+        features1, features2 = RenderFeatures(features1.gray), RenderFeatures(features2.gray)
+
+    array1 = features1.array
+    array2 = features2.array
 
     w1, h1 = array1.shape[0:2]
     w2, h2 = array2.shape[0:2]
 
-    similarities = dict()
     results = dict()
-    try:
-        similarities['entropy_sim'] = entropy_sim(pil1, pil2)
-        # results['entropy_sim'] = _COMPARISON_SUCCESSFUL_MESSAGE
-    except Exception as e:
-        results['entropy_sim'] = str(e)
-    try:
-        similarities['whash_sim'] = whash_sim(pil1, pil2)
-        # results['whash_sim'] = _COMPARISON_SUCCESSFUL_MESSAGE
-    except Exception as e:
-        results['whash_sim'] = str(e)
-    try:
-        similarities['phash_sim'] = phash_sim(pil1, pil2)
-        # results['phash_sim'] = _COMPARISON_SUCCESSFUL_MESSAGE
-    except Exception as e:
-        results['phash_sim'] = str(e)
-    try:
-        sss, sss_loc = sum_square_sim(array1, array2)
-        similarities['sum_square_sim'] = sss
-        # results['sum_square_sim'] = _COMPARISON_SUCCESSFUL_MESSAGE
-    except Exception as e:
-        sss_loc = None
-        results['sum_square_sim'] = str(e)
-    try:
-        ccorr, ccorr_loc = ccorr_sim(array1, array2)
-        similarities['ccorr_sim'] = ccorr
-        # results['ccorr_sim'] = _COMPARISON_SUCCESSFUL_MESSAGE
-    except Exception as e:
-        ccorr_loc = None
-        results['ccorr_sim'] = str(e)
-    try:
-        ccoeff, ccoeff_loc = ccoeff_sim(array1, array2)
-        similarities['ccoeff_sim'] = ccoeff
-    except Exception as e:
-        ccoeff_loc = None
-        results['ccoeff_sim'] = str(e)
-    try:
-        similarities['size_sim'] = size_sim(array1, array2)
-    except Exception as e:
-        results['size_sim'] = str(e)
+    template = dict()
+
+    def template_scores():
+        # The three template matching scores come from one shared computation
+        if 'error' in template:
+            raise template['error']
+        if 'scores' not in template:
+            try:
+                template['scores'] = _template_scores(array1, array2)
+            except Exception as e:
+                template['error'] = e
+                raise
+        return template['scores']
+
+    def scored(metric, compute):
+        def score():
+            try:
+                return compute()
+            except Exception as e:
+                results[metric] = str(e)
+                return None
+        return score
+
+    scores = {'entropy_sim': scored('entropy_sim', lambda: _entropy_ratio(features1.entropy, features2.entropy)),
+              'whash_sim': scored('whash_sim', lambda: _hash_sim(features1.whash(), features2.whash(), 128)),
+              'phash_sim': scored('phash_sim', lambda: _hash_sim(features1.phash(), features2.phash(), 128)),
+              'sum_square_sim': scored('sum_square_sim', lambda: template_scores()[0][0]),
+              'ccorr_sim': scored('ccorr_sim', lambda: template_scores()[0][1]),
+              'ccoeff_sim': scored('ccoeff_sim', lambda: template_scores()[0][2]),
+              'size_sim': scored('size_sim', lambda: size_sim(array1, array2))}
+
+    def comparison_result():
+        if len(results) == 0:
+            return _COMPARISON_SUCCESSFUL_MESSAGE
+        else:
+            return ', '.join(['%s: %s' % (key, val) for (key, val) in results.items()])
 
-    if full:
+    if lazy and not full:
+        return PRCSim(similarity_scores=scores, result=comparison_result, diff=None)
+
+    similarities = {metric: score() for (metric, score) in scores.items()}
+    similarities = {metric: value for (metric, value) in similarities.items() if value is not None}
+
+    if full and diff_threshold is not None and PRCSim(similarities, None).sim > diff_threshold:
+        diff = None
+    elif full:
         try:
             if w1 == w2 and h1 == h2:
-                array1_gray = cv2.cvtColor(array1, cv2.COLOR_RGB2GRAY)
-                array2_gray = cv2.cvtColor(array2, cv2.COLOR_RGB2GRAY)
-                ssim, diff = structural_similarity(array1_gray, array2_gray, full=True)
-                diff = Image.fromarray(np.uint8(diff * 255), 'L').convert('RGB')
+                ssim, diff = _tiled_ssim(features1.gray, features2.gray)
+                diff = Image.fromarray(diff, 'L')
                 similarities['ssim'] = ssim
-            elif sss_loc is not None or ccorr_loc is not None or ccoeff_loc is not None:
-                diffs = []
-                # print("before pad_images")
+            elif 'scores' in template:
+                # The diff is taken at whichever of the alignments of the three scores gives the best ssim
                 padded_pil1, padded_pil2 = pad_images(array1, array2)
-                # print("after pad_images")
-                array1_gray = cv2.cvtColor(padded_pil1, cv2.COLOR_RGB2GRAY)
-                array2_gray = cv2.cvtColor(padded_pil2, cv2.COLOR_RGB2GRAY)
-                if sss_loc is not None:
-                    # print("sss ssim")
-                    sss_ssim, sss_diff = _template_ssim(array1_gray, array2_gray, sss_loc)
-                    # print("sss ssim complete: %f" % sss_ssim)
-                    diffs.append((sss_ssim, sss_diff))
-                if ccorr_loc is not None:
-                    # print("ccorr ssim")
-                    ccorr_ssim, ccorr_diff = _template_ssim(array1_gray, array2_gray, ccorr_loc)
-                    # print("ccorr ssim complete: %f" % ccorr_ssim)
-                    diffs.append((ccorr_ssim, ccorr_diff))
-                if ccoeff_loc is not None:
-                    # print("ccoeff ssim")
-                    ccoeff_ssim, ccoeff_diff = _template_ssim(array1_gray, array2_gray, ccoeff_loc)
-                    # print("ccoeff ssim complete: %f" % ccoeff_ssim)
-                    diffs.append((ccoeff_ssim, ccoeff_diff))
-                # print(len(diffs))
-                diffs.sort(reverse=True, key=lambda x: x[0])
-                ssim, diff = diffs[0]
-                diff = Image.fromarray(np.uint8(diff * 255), 'L').convert('RGB')
+                gray1, gray2 = _gray_array(padded_pil1), _gray_array(padded_pil2)
+                diffs = [_template_ssim(gray1, gray2, top_left) for top_left in dict.fromkeys(template['scores'][1])]
+                ssim, diff = max(diffs, key=lambda d: d[0])
+                diff = Image.fromarray(diff, 'L')
                 similarities['ssim'] = ssim
             else:
                 diff = None
@@ -198,17 +439,220 @@ def image_compare(p1: PngImageFile or np.array_like,
     else:
         diff = None
 
-    if len(results) == 0:
-        result = _COMPARISON_SUCCESSFUL_MESSAGE
-    else:
-        result = ', '.join(['%s: %s' % (key, val) for (key, val) in results.items()])
+    return PRCSim(similarity_scores=similarities, result=comparison_result(), diff=diff)
+
+
+
+def _batch_entropy(features: List[RenderFeatures]) -> List[float]:
+    """
+    The entropy of each render, cached on the features. Renders whose colors fit in a byte, i.e. grayscale and neutral
+    RGB pages, are histogrammed one by one and their entropies computed together from the stacked histograms.
+    """
+    byte_valued, counts = [], []
+    for f in {id(f): f for f in features if f._entropy is None}.values():
+        values = _color_values(f.pil)
+        if values.dtype == np.uint8 and values.size > 1:
+            byte_valued.append(f)
+            counts.append(np.bincount(values.ravel(), minlength=256))
+        else:
+            f._entropy = entropy(values)
+    if len(byte_valued) > 0:
+        counts = np.stack(counts)
+        probs = counts / counts.sum(axis=1, keepdims=True)
+        terms = np.where(counts > 0, probs * np.log(np.where(counts > 0, probs, 1.0)), 0.0)
+        entropies = np.where(np.count_nonzero(counts, axis=1) > 1, -terms.sum(axis=1), 0)
+        for (f, ent) in zip(byte_valued, entropies):
+            f._entropy = float(ent)
+    return [f._entropy for f in features]
+
+
+# Same-shape pairs of a batch are scored in stacks of at most this many bytes of float64 pixels per side
+_BATCH_STACK_BYTES = 1 << 27
+
+
+def _stacked_template_scores(pairs: List[Tuple[np.ndarray, np.ndarray]]) -> List[Tuple[float, float, float]]:
+    """
+    The sum_square_sim, ccorr_sim and ccoeff_sim of pairs of image arrays that all have the same shape. The per-channel
+    sums the scores come from are computed for a whole stack of pairs at once instead of pair by pair.
+    """
+    shape = pairs[0][0].shape
+    n = shape[0] * shape[1]
+    step = max(1, _BATCH_STACK_BYTES // (pairs[0][0].size * 8))
+    scores = []
+    for start in range(0, len(pairs), step):
+        stack = pairs[start:start + step]
+        # As in _template_scores, the right render is the template and the left one the window
+        windows = np.stack([left for (left, _) in stack]).reshape(len(stack), n, -1).astype(np.float64)
+        templates = np.stack([right for (_, right) in stack]).reshape(len(stack), n, -1).astype(np.float64)
+        sums = (np.einsum('knc,knc->kc', templates, windows),
+                np.einsum('knc,knc->kc', templates, templates),
+                np.einsum('knc,knc->kc', windows, windows),
+                templates.sum(axis=1),
+                windows.sum(axis=1))
+        for i in range(len(stack)):
+            scores.append(_scores_from_sums(*(channel_sums[i].tolist() for channel_sums in sums), n))
+    return scores
+
+
+def _compare_batch(batch, results: Dict):
+    """
+    Score a batch of feature pairs, writing each result into `results` as soon as it is done. Pairs whose renders have
+    the same shape get their template matching scores from stacked sums. Pairs of different sizes need an alignment
+    search and are scored one by one.
+    """
+    keys = [key for (key, _, _) in batch]
+    lefts = [left for (_, left, _) in batch]
+    rights = [right for (_, _, right) in batch]
+    left_entropies, right_entropies = _batch_entropy(lefts), _batch_entropy(rights)
+    hash_sims = dict()
+    for name in ('whash', 'phash'):
+        left_hashes = np.stack([getattr(left, name)().hash for left in lefts])
+        right_hashes = np.stack([getattr(right, name)().hash for right in rights])
+        diffs = np.count_nonzero((left_hashes != right_hashes).reshape(len(batch), -1), axis=1)
+        hash_sims[name] = 1.0 - diffs / (128 * 128)
+
+    def finish(i, template_scores):
+        sss, ccorr, ccoeff = template_scores
+        similarities = {'entropy_sim': _entropy_ratio(left_entropies[i], right_entropies[i]),
+                        'whash_sim': hash_sims['whash'][i],
+                        'phash_sim': hash_sims['phash'][i],
+                        'sum_square_sim': sss,
+                        'ccorr_sim': ccorr,
+                        'ccoeff_sim': ccoeff,
+                        'size_sim': size_sim(lefts[i].array, rights[i].array)}
+        results[keys[i]] = PRCSim(similarity_scores=similarities, result=_COMPARISON_SUCCESSFUL_MESSAGE, diff=None)
+
+    shapes = dict()
+    for (i, (left, right)) in enumerate(zip(lefts, rights)):
+        left_array, right_array = left.array, right.array
+        # Blank renders are shifted before matching, which _template_scores takes care of
+        if left_array.shape == right_array.shape and left_array.any() and right_array.any():
+            shapes.setdefault(left_array.shape, []).append(i)
+    for indices in shapes.values():
+        stacked = _stacked_template_scores([(lefts[i].array, rights[i].array) for i in indices])
+        for (i, template_scores) in zip(indices, stacked):
+            finish(i, template_scores)
+    stacked = {i for indices in shapes.values() for i in indices}
+    for i in range(len(batch)):
+        if i not in stacked:
+            finish(i, _template_scores(lefts[i].array, rights[i].array)[0])
+
+
+def batch_image_compare(pairs: Dict, results: Dict = None) -> Dict:
+    """
+    Compare many pairs of renders at once, e.g. the pages of two documents, giving the same scores as `image_compare`
+    on each pair. The hashes and color histograms are still computed page by page, but the hash distances of all
+    pairs come from stacked hash arrays, the entropies from stacked histograms and the template matching scores of
+    pairs with same-shape renders from stacked sums. Features passed as `RenderFeatures` are reused and cached as with
+    `image_compare`.
+
+    Parameters
+    ----------
+    pairs : Dict[Any, Tuple[PngImageFile or array_like or RenderFeatures, PngImageFile or array_like or RenderFeatures]]
+        The two renders to compare, keyed by e.g. page number
+    results : Dict[Any, PRCSim]
+        Dictionary each result is written into as soon as its pair is scored, so a caller that interrupts the batch
+        keeps the pairs that were finished
+
+    Returns
+    -------
+    Dict[Any, PRCSim]
+    """
+    results = dict() if results is None else results
+    batch = []
+    for (key, (p1, p2)) in pairs.items():
+        if p1 is None or p2 is None:
+            results[key] = image_compare(p1, p2)
+            continue
+        features1, features2 = render_features(p1), render_features(p2)
+        identical = _identical(features1, features2)
+        _record_comparison(identical)
+        if identical:
+            results[key] = _identical_compare(features1)
+            continue
+        if (features1.channels == 1) != (features2.channels == 1):
+            features1, features2 = RenderFeatures(features1.gray), RenderFeatures(features2.gray)
+        batch.append((key, features1, features2))
+    if len(batch) > 0:
+        try:
+            _compare_batch(batch, results)
+        except Exception:
+            # The pairwise comparison reports which metric failed, reusing the features computed so far. These pairs
+            # were already counted.
+            for (key, features1, features2) in batch:
+                if key not in results:
+                    results[key] = _compare_features(features1, features2)
+    return {key: results[key] for key in pairs.keys()}
+
+
+# Side in pixels of the tiles compared when localizing the differences between two renders
+_LOCALIZE_TILE = 16
+
+
+@lru_cache(maxsize=8)
+def _tile_weights(shape):
+    return np.random.default_rng(0).integers(0, np.iinfo(np.uint64).max, size=shape, dtype=np.uint64, endpoint=True)
+
 
-    return PRCSim(similarity_scores=similarities, result=result, diff=diff)
+def _tile_hashes(array: np.ndarray, tile: int) -> np.ndarray:
+    """
+    A 64 bit hash of every `tile` x `tile` tile of an image array, as a (rows, columns) array. Partial tiles at the
+    right and bottom edges are padded with zeros. The hash is a fixed random linear combination of the bytes of the
+    tile modulo 2**64, so equal tiles hash the same in any render and different tiles collide with negligible
+    probability.
+    """
+    h, w = array.shape[0:2]
+    channels = 1 if array.ndim == 2 else array.shape[2]
+    rows, cols = -(-h // tile), -(-w // tile)
+    weights = _tile_weights((tile, tile * channels))
+    hashes = np.empty((rows, cols), dtype=np.uint64)
+    band = np.zeros((tile, cols * tile * channels), dtype=np.uint64)
+    for row in range(rows):
+        rows_in_band = min(tile, h - row * tile)
+        band[:rows_in_band, :w * channels] = array[row * tile:row * tile + rows_in_band].reshape(rows_in_band, -1)
+        band[rows_in_band:] = 0
+        tiles = band.reshape(tile, cols, tile * channels).transpose(1, 0, 2)
+        hashes[row] = (tiles * weights).sum(axis=(1, 2), dtype=np.uint64)
+    return hashes
+
+
+def _changed_regions(p1, p2, min_region: int = 0, tile: int = None):
+    """
+    Localize the differences between two renders without computing an SSIM diff. Both renders are cut into tiles, the
+    tiles whose hashes differ are marked and adjacent marked tiles are merged into regions.
+
+    Parameters
+    ----------
+    p1 : PngImageFile or array_like or RenderFeatures
+    p2 : PngImageFile or array_like or RenderFeatures
+    min_region : int
+        The minimum area in pixels of a region
+    tile : int
+        Side of the tiles in pixels
+
+    Returns
+    -------
+    List[Tuple[int, int, int, int]] or None
+        The (x, y, width, height) box of each region, or None if the renders are not the same size
+    """
+    features1, features2 = render_features(p1), render_features(p2)
+    if features1.size != features2.size or features1.channels != features2.channels:
+        return None
+    tile = tile or _LOCALIZE_TILE
+    width, height = features1.size
+    changed = (features1.tile_hashes(tile) != features2.tile_hashes(tile)).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(changed, connectivity=8)
+    regions = []
+    for (x, y, w, h, _) in stats[1:count]:
+        x, y = int(x) * tile, int(y) * tile
+        w, h = min(int(w) * tile, width - x), min(int(h) * tile, height - y)
+        if w * h >= min_region:
+            regions.append((x, y, w, h))
+    return regions
 
 
 def _get_contours(min_region, diff: PngImageFile):
-    diff = np.array(diff)
-    diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+    diff = _gray_array(np.array(diff))
     retval, thresh = cv2.threshold(diff, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
     contours = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     contours = contours[0] if len(contours) == 2 else contours[1]
@@ -230,21 +674,25 @@ def image_highlight(p1: PngImageFile or np.array_like,
                     right_file: str = '',
                     right_label: str = '',
                     save_display: str = None,
-                    verbose: bool = True) -> (PngImageFile, PngImageFile) or PngImageFile:
+                    verbose: bool = True,
+                    localizer: str = 'ssim') -> (PngImageFile, PngImageFile) or PngImageFile:
+
+    # The tile localizer marks the tiles whose hashes differ and needs no SSIM diff. Renders of different sizes fall
+    # back to the contours of the diff.
+    regions = _changed_regions(p1, p2, min_region) if localizer == 'tiles' else None
 
     _, array1 = _pil_and_array(p1)
     _, array2 = _pil_and_array(p2)
+    array1 = _display_array(array1)
+    array2 = _display_array(array2)
 
-
-    if prc is None:
-        prc = image_compare(p1, p2, True)
-    elif prc.diff is None:
+    if regions is None and (prc is None or prc.diff is None):
         prc = image_compare(p1, p2, True)
     try:
-        contours = _get_contours(min_region, prc.diff)
+        if regions is None:
+            regions = [cv2.boundingRect(c) for c in _get_contours(min_region, prc.diff)]
         if info_loss < 1.0:
-            for c in contours:
-                x, y, w, h = cv2.boundingRect(c)
+            for (x, y, w, h) in regions:
                 contour1 = array1[y:y + h, x:x + w]
                 contour2 = array2[y:y + h, x:x + w]
                 es = entropy_sim(contour1, contour2)
@@ -254,8 +702,7 @@ def image_highlight(p1: PngImageFile or np.array_like,
                     cv2.rectangle(array1, (x, y), (x + w, y + h), (36, 255, 12), 2)
                     cv2.rectangle(array2, (x, y), (x + w, y + h), (36, 255, 12), 2)
         else:
-            for c in contours:
-                x, y, w, h = cv2.boundingRect(c)
+            for (x, y, w, h) in regions:
                 cv2.rectangle(array1, (x, y), (x+w, y+h), (36, 255, 12), 2)
                 cv2.rectangle(array2, (x, y), (x+w, y+h), (36, 255, 12), 2)
         pil1 = Image.fromarray(array1)
@@ -325,6 +772,8 @@ def image_highlight(p1: PngImageFile or np.array_like,
 
 def pil_to_hex_array(pil):
     array = np.array(pil, dtype='uint32')
+    if array.ndim == 2:
+        return array
     return (array[:, :, 0] << 16) + (array[:, :, 1] << 8) + array[:, :, 2]
 
 
@@ -477,6 +926,10 @@ def is_pdf(file):
     return _is_pdf
 
 
+def _hash_sim(hash1, hash2, hash_size):
+    return 1.0 - (hash1 - hash2) / (hash_size * hash_size)
+
+
 def ahash_sim(pil1, pil2, hash_size=128):
     hash1 = average_hash(pil1, hash_size=hash_size)
     hash2 = average_hash(pil2, hash_size=hash_size)
@@ -509,33 +962,63 @@ def whash_sim(pil1, pil2, hash_size=128):
     return 1.0 - normalized
 
 
+# Value ranges up to this size are counted with a histogram instead of a sort
+_BINCOUNT_LIMIT = 1 << 16
+
+
+def _value_counts(a: np.ndarray) -> np.ndarray:
+    """
+    Return the number of occurrences of each distinct value of an array, in no particular order and possibly with
+    zero counts. Non-negative integers in a small range, e.g. grayscale pixels, are counted with a single bincount;
+    anything else falls back to a sort.
+    """
+    values = a.ravel()
+    if values.dtype.kind in 'ui' and values.size > 0:
+        if values.dtype.itemsize == 1 and values.dtype.kind == 'u':
+            return np.bincount(values, minlength=256)
+        if values.min() >= 0 and values.max() < _BINCOUNT_LIMIT:
+            return np.bincount(values)
+    _, counts = np.unique(values, return_counts=True)
+    return counts
+
+
+def _color_values(pil) -> np.ndarray:
+    """
+    One value per pixel identifying its color. Neutral RGB pages, e.g. black text on white, map their pixels to the
+    shared channel value, which identifies the colors just as well and can be histogrammed.
+    """
+    array = np.asarray(pil)
+    if pil.mode == 'L':
+        return array
+    if pil.mode == 'RGB' and np.array_equal(array[:, :, 0], array[:, :, 1]) and \
+            np.array_equal(array[:, :, 1], array[:, :, 2]):
+        return array[:, :, 0]
+    return pil_to_hex_array(array)
+
+
 def entropy(a):
     if isinstance(a, PngImageFile) or isinstance(a, ImageType):
-        a = pil_to_hex_array(a)
+        a = _color_values(a)
+    a = np.asarray(a)
     n = a.size
 
     if n <= 1:
         return 0
-    _, counts = np.unique(a, return_counts=True)
-    probs = counts / n
+    counts = _value_counts(a)
+    counts = counts[counts > 0]
 
-    n_classes = np.count_nonzero(probs)
-
-    if n_classes <= 1:
+    if len(counts) <= 1:
         return 0
 
-    ent = 0.
-
-    for p in probs:
-        ent -= p * log(p, e)
-
-    return ent
+    probs = counts / n
+    return float(-np.sum(probs * np.log(probs)))
 
 
 def entropy_sim(a, b):
-    a_ent = entropy(a)
-    b_ent = entropy(b)
+    return _entropy_ratio(entropy(a), entropy(b))
 
+
+def _entropy_ratio(a_ent, b_ent):
     ent_min = min(a_ent, b_ent)
     ent_max = max(a_ent, b_ent)
 
@@ -612,6 +1095,166 @@ def ccorr_sim(pil1, pil2):
     return _template_matching(pil1, pil2, cv2.TM_CCORR_NORMED)
 
 
+# Template matching of differently sized images searches a downsampled pyramid until the number of candidate offsets
+# is at most _PYRAMID_SEARCH_POSITIONS, keeping the smaller side of the template at least _PYRAMID_MIN_SIZE pixels
+_PYRAMID_SEARCH_POSITIONS = 9
+_PYRAMID_MIN_SIZE = 64
+# Offsets found on a coarse level are refined within this many pixels on the next finer level
+_PYRAMID_REFINE_RADIUS = 1
+
+
+def _normed(num, denom, sqdiff=False):
+    """Normalize a template matching score the way cv2.matchTemplate does, including its degenerate cases"""
+    if abs(num) < denom:
+        return num / denom
+    if abs(num) < denom * 1.125:
+        return 1.0 if num > 0 else -1.0
+    return 1.0 if sqdiff else 0.0
+
+
+def _scores_from_sums(cross, template_sq, window_sq, template_sum, window_sum, n):
+    """
+    The TM_SQDIFF_NORMED, TM_CCORR_NORMED and TM_CCOEFF_NORMED scores from the per-channel sums of products, squares
+    and values of a template and a window of `n` pixels.
+
+    Returns
+    -------
+    Tuple[float, float, float]
+        sum_square_sim, ccorr_sim and ccoeff_sim
+    """
+    ccoeff_num = template_var = window_var = 0.0
+    for (ti, tt, ii, t_sum, i_sum) in zip(cross, template_sq, window_sq, template_sum, window_sum):
+        ccoeff_num += ti - t_sum * i_sum / n
+        template_var += tt - t_sum * t_sum / n
+        window_var += ii - i_sum * i_sum / n
+    cross, template_sq, window_sq = float(sum(cross)), float(sum(template_sq)), float(sum(window_sq))
+    norm = sqrt(template_sq * window_sq)
+    sqdiff = _normed(template_sq + window_sq - 2 * cross, norm, sqdiff=True)
+    ccorr = _normed(cross, norm)
+    if template_var / n < np.finfo(np.float64).eps:
+        # A flat template matches every window equally well
+        ccoeff = 1.0
+    else:
+        ccoeff = _normed(ccoeff_num, sqrt(max(template_var, 0) * max(window_var, 0)))
+    return 1.0 - sqdiff, ccorr, ccoeff
+
+
+def _correlation_scores(big: np.ndarray, small: np.ndarray, top_left=(0, 0)):
+    """
+    The TM_SQDIFF_NORMED, TM_CCORR_NORMED and TM_CCOEFF_NORMED scores of `small` placed at `top_left` within `big`,
+    computed from one set of per-channel sums instead of three calls to cv2.matchTemplate.
+
+    Returns
+    -------
+    Tuple[float, float, float]
+        sum_square_sim, ccorr_sim and ccoeff_sim
+    """
+    h, w = small.shape[0:2]
+    x, y = top_left
+    n = h * w
+    template = small.reshape(n, -1)
+    window = big[y:y + h, x:x + w].reshape(n, -1)
+    sums = []
+    for c in range(template.shape[1]):
+        t = template[:, c].astype(np.float64)
+        i = window[:, c].astype(np.float64)
+        sums.append((float(t.dot(i)), float(t.dot(t)), float(i.dot(i)), float(t.sum()), float(i.sum())))
+    return _scores_from_sums(*zip(*sums), n)
+
+
+def _peak_search(big: np.ndarray, small: np.ndarray, candidates):
+    """
+    The offsets with the best TM_SQDIFF_NORMED, TM_CCORR_NORMED and TM_CCOEFF_NORMED scores. `candidates` holds the
+    offsets to search for each of the three metrics and an offset shared between them is only scored once. Ties go to
+    the first offset in row-major order, as with cv2.minMaxLoc.
+    """
+    scored = dict()
+    peaks = []
+    for (metric, metric_candidates) in enumerate(candidates):
+        best, best_score = None, None
+        for offset in sorted(metric_candidates, key=lambda c: (c[1], c[0])):
+            if offset not in scored:
+                scored[offset] = _correlation_scores(big, small, offset)
+            score = scored[offset][metric]
+            if best_score is None or score > best_score:
+                best, best_score = offset, score
+        peaks.append(best)
+    return tuple(peaks)
+
+
+# The cv2.matchTemplate methods behind sum_square_sim, ccorr_sim and ccoeff_sim, in the order of their scores
+_TEMPLATE_METHODS = (cv2.TM_SQDIFF_NORMED, cv2.TM_CCORR_NORMED, cv2.TM_CCOEFF_NORMED)
+
+
+def _pyramid_offsets(big: np.ndarray, small: np.ndarray):
+    """
+    Coarse-to-fine search for the offsets of `small` within `big` at which TM_SQDIFF_NORMED, TM_CCORR_NORMED and
+    TM_CCOEFF_NORMED each peak. Both images are downsampled until the search space is small, the coarsest level is
+    searched exhaustively for every metric and the offset of each metric is then refined in a small neighborhood of
+    its own peak on each finer level.
+    """
+    levels = [(big, small)]
+    while True:
+        level_big, level_small = levels[-1]
+        (big_h, big_w), (small_h, small_w) = level_big.shape[0:2], level_small.shape[0:2]
+        positions = (big_h - small_h + 1) * (big_w - small_w + 1)
+        if positions <= _PYRAMID_SEARCH_POSITIONS or min(small_h, small_w) < 2 * _PYRAMID_MIN_SIZE:
+            break
+        levels.append((cv2.pyrDown(level_big), cv2.pyrDown(level_small)))
+
+    level_big, level_small = levels[-1]
+    (big_h, big_w), (small_h, small_w) = level_big.shape[0:2], level_small.shape[0:2]
+    if (big_h - small_h + 1) * (big_w - small_w + 1) <= _PYRAMID_SEARCH_POSITIONS:
+        candidates = [(x, y) for y in range(big_h - small_h + 1) for x in range(big_w - small_w + 1)]
+        offsets = _peak_search(level_big, level_small, [candidates] * len(_TEMPLATE_METHODS))
+    else:
+        offsets = []
+        for method in _TEMPLATE_METHODS:
+            _, _, min_loc, max_loc = cv2.minMaxLoc(cv2.matchTemplate(level_big, level_small, method))
+            offsets.append(min_loc if method == cv2.TM_SQDIFF_NORMED else max_loc)
+
+    for level_big, level_small in reversed(levels[:-1]):
+        (big_h, big_w), (small_h, small_w) = level_big.shape[0:2], level_small.shape[0:2]
+        r = _PYRAMID_REFINE_RADIUS
+        candidates = []
+        for offset in offsets:
+            xs = range(max(0, 2 * offset[0] - r), min(big_w - small_w, 2 * offset[0] + r) + 1)
+            ys = range(max(0, 2 * offset[1] - r), min(big_h - small_h, 2 * offset[1] + r) + 1)
+            candidates.append([(x, y) for y in ys for x in xs])
+        offsets = _peak_search(level_big, level_small, candidates)
+    return tuple(tuple(offset) for offset in offsets)
+
+
+def _template_scores(pil1, pil2):
+    """
+    The sum_square_sim, ccorr_sim and ccoeff_sim of two images, each at the alignment where that score peaks, as with
+    cv2.matchTemplate. Images of the same size have a single alignment and are scored directly. Otherwise the
+    alignments are found with a coarse-to-fine pyramid search and each distinct alignment is scored once, sharing the
+    sums between the three scores.
+
+    Returns
+    -------
+    Tuple[Tuple[float, float, float], Tuple[Tuple[int, int], Tuple[int, int], Tuple[int, int]]]
+        The three scores and, for each of them, the top left corner of the smaller image within the larger one
+    """
+    if isinstance(pil1, PngImageFile) or isinstance(pil1, ImageType):
+        pil1 = np.array(pil1)
+    if isinstance(pil2, PngImageFile) or isinstance(pil2, ImageType):
+        pil2 = np.array(pil2)
+
+    if pil1.sum() == 0:
+        pil1 = pil1 + 1
+    if pil2.sum() == 0:
+        pil2 = pil2 + 1
+
+    big, small = pad_images(pil1, pil2)
+    if big.shape[0:2] == small.shape[0:2]:
+        return _correlation_scores(big, small), ((0, 0),) * len(_TEMPLATE_METHODS)
+    offsets = _pyramid_offsets(big, small)
+    scored = {offset: _correlation_scores(big, small, offset) for offset in set(offsets)}
+    return tuple(scored[offset][metric] for (metric, offset) in enumerate(offsets)), offsets
+
+
 def orientation_sim(pil1, pil2):
     if isinstance(pil1, PngImageFile) or isinstance(pil1, ImageType):
         pil1 = np.array(pil1)
@@ -1,8 +1,11 @@
 from PIL.Image import Image
 from sparclur._hybrid import Hybrid
-from sparclur._parser import Parser
+from sparclur._parser import Parser, SparclurHash
 from sparclur._parser import RENDER, TRACER, TEXT, FONT, IMAGE, META
 import os, sys, site
+import tempfile
+
+import fitz
 
 # TEST_PDF = '../../../resources/hello_world_hand_edit.pdf'
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
@@ -15,6 +18,17 @@ elif os.path.isfile(_user_path):
     TEST_PDF = _user_path
 elif os.path.isfile(_env_path):
     TEST_PDF = _env_path
+RESOURCE_PDFS = sorted(os.path.join(os.path.dirname(TEST_PDF), name) for name in os.listdir(os.path.dirname(TEST_PDF))
+                       if name.endswith('.pdf'))
+
+
+def _write_pages_pdf(path, num_pages, text='Page %i'):
+    doc = fitz.open()
+    for page in range(num_pages):
+        doc.new_page().insert_text((72, 72), text % page)
+    doc.save(path)
+    doc.close()
+
 
 class ParserTestMixin:
 
@@ -30,6 +44,13 @@ class ParserTestMixin:
     def test_parser_validity(self):
         assert isinstance(self.parser_instance.validity, dict), 'validity broken'
 
+    def test_sparclur_hash_bytes(self):
+        sparclur_hash = self.parser_instance.sparclur_hash
+        restored = SparclurHash.from_bytes(sparclur_hash.to_bytes())
+        assert restored.keyset() == sparclur_hash.keyset(), 'hash serialization lost entries'
+        assert restored.file_hash == sparclur_hash.file_hash, 'hash serialization lost the file hash'
+        assert len(restored) == 0 or sparclur_hash.equals(restored), 'hash serialization changed the hashes'
+
 
 class TracerTestMixin:
 
@@ -75,6 +96,14 @@ class RendererTestMixin:
         _ = self.parser_instance.get_renders()
         assert isinstance(self.parser_instance.logs, dict) and 0 in self.parser_instance.logs, 'logging failed'
 
+    def test_dpi_clears_cache(self):
+        self.parser_instance.caching = True
+        self.parser_instance.dpi = 72
+        pil72 = self.parser_instance.get_renders(0)
+        self.parser_instance.dpi = 144
+        pil144 = self.parser_instance.get_renders(0)
+        assert pil144.width > pil72.width, 'render cached at the previous dpi was served'
+
     def test_rendering_dpi(self):
         self.parser_instance.caching = False
         self.parser_instance.dpi = 72
@@ -87,12 +116,128 @@ class RendererTestMixin:
         height200 = pil200.height
         assert abs(width200 - (width72 * 200 / 72)) <= 1 and abs(height200 - (height72 * 200 / 72)) <=1
 
+    def test_cache_budget(self):
+        self.parser_instance.caching = True
+        self.parser_instance.cache_budget = 0
+        _ = self.parser_instance.get_renders()
+        assert isinstance(self.parser_instance.get_renders(0), Image), 'render cache broken'
+        assert self.parser_instance.cache_stats['hits'] > 0
+        assert type(self.parser_instance.get_renders()) is dict, 'cached renders not returned as a dict'
+
+    def test_iter_renders(self):
+        self.parser_instance.caching = False
+        streamed = list(self.parser_instance.iter_renders())
+        assert len(streamed) > 0 and streamed[0][0] == 0, 'streaming failed'
+        assert isinstance(streamed[0][1], Image), 'streamed render empty'
+        assert [page for (page, _) in streamed] == sorted(page for (page, _) in streamed), 'pages out of order'
+
+    def test_hash_renders(self):
+        hash_renders = dict(self.parser_instance.hash_renders(0, hash_size=16))
+        assert 0 in hash_renders, 'hash rendering failed'
+        assert hash_renders[0].mode == 'L', 'hash render is not grayscale'
+        assert max(hash_renders[0].size) < max(self.parser_instance.get_renders(0).size), 'hash render not reduced'
+
+    def test_get_region(self):
+        self.parser_instance.caching = False
+        region = self.parser_instance.get_region(0, (0, 0, 72, 36), dpi=144)
+        assert isinstance(region, Image), 'region rendering failed'
+        assert region.size == (144, 72), 'region has the wrong size'
+
+    def test_gray_renders(self):
+        rgb_pil = self.parser_instance.get_renders(0)
+        self.parser_instance.colorspace = 'gray'
+        gray_pil = self.parser_instance.get_renders(0)
+        assert gray_pil.mode == 'L', 'gray render is not single channel'
+        assert gray_pil.size == rgb_pil.size, 'gray render has the wrong size'
+        assert self.parser_instance.compare(self.parser_instance, page=0).sim > 0.99, 'gray compare failed'
+
+    def test_page_geometry(self):
+        geometry = self.parser_instance.page_geometry
+        assert len(geometry) == self.parser_instance.num_pages, 'page geometry missing'
+        width, height = geometry[0].size
+        assert width > 0 and height > 0, 'page geometry has no size'
+
+    def test_batch_compare(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            left_path, right_path = os.path.join(temp_dir, 'left.pdf'), os.path.join(temp_dir, 'right.pdf')
+            _write_pages_pdf(left_path, 3)
+            _write_pages_pdf(right_path, 3, text='Changed page %i')
+            left, right = self.parser(left_path), self.parser(right_path)
+            expected = left.compare(right)
+            batched = left.compare(right, batch=True)
+        assert batched.keys() == expected.keys(), 'batch compare pages differ'
+        assert all(prc.sim < 1.0 for prc in expected.values()), 'compared renders are identical'
+        for (page, prc) in expected.items():
+            assert abs(batched[page].sim - prc.sim) < 1e-9, 'batch compare differs'
+
+    def test_page_timeout(self):
+        self.parser_instance.caching = False
+        self.parser_instance.page_timeout = 60
+        document_pil = self.parser_instance.get_renders()
+        assert isinstance(document_pil[0], Image), 'rendering with a page timeout failed'
+
+    def test_sharded_render(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'pages.pdf')
+            _write_pages_pdf(path, 5)
+            sharded = self.parser(path, shards=2)
+            renders = sharded.get_renders()
+            assert sorted(renders.keys()) == list(range(5)), 'sharded render lost pages'
+            assert sorted(sharded.logs.keys()) == list(range(5)), 'sharded render lost logs'
+            assert not sharded._file_timed_out[RENDER], 'sharded render timed out'
+            expected = self.parser(path).get_renders()
+            assert all(renders[page].size == expected[page].size for page in range(5)), 'shards rendered differently'
+
+    def test_shard_ranges(self):
+        self.parser_instance.shards = 3
+        ranges = self.parser_instance._page_ranges(10)
+        assert len(ranges) == 3, 'wrong number of shards'
+        assert [page for pages in ranges for page in pages] == list(range(10)), 'shards do not cover the document'
+
     def test_ocr(self):
         if issubclass(self.parser, Hybrid):
             self.parser_instance.ocr = True
         assert self.parser_instance.can_extract_text, 'ocr missing'
 
 
+class FastTraceTestMixin:
+
+    def test_fast_trace_messages(self):
+        for path in RESOURCE_PDFS:
+            full = self.parser(path, fast_trace=False)
+            fast = self.parser(path, fast_trace=True)
+            assert set(fast.messages) == set(full.messages), 'fast trace messages differ for %s' % path
+            assert fast.cleaned == full.cleaned, 'fast trace message counts differ for %s' % path
+
+
+class StreamedMessagesTestMixin:
+
+    def test_streamed_messages(self):
+        full = self.parser(TEST_PDF)
+        _ = full.get_renders()
+        streamed = self.parser(TEST_PDF, page_timeout=60)
+        _ = streamed.get_renders()
+        assert streamed._messages is not None, 'streamed render dropped its messages'
+        assert streamed._messages == full._messages, 'streamed render messages differ from the full render'
+
+
+class DocumentHandleTestMixin:
+
+    def test_handle_reuse(self):
+        self.parser_instance.caching = False
+        _ = self.parser_instance.get_renders(0)
+        handle = self.parser_instance._document.get()
+        _ = self.parser_instance.get_renders(0)
+        assert self.parser_instance._document.get() is handle, 'document handle not reused'
+
+    def test_close(self):
+        _ = self.parser_instance.num_pages
+        self.parser_instance.close()
+        assert not self.parser_instance._document.is_open, 'close failed'
+        self.parser_instance.caching = False
+        assert isinstance(self.parser_instance.get_renders(0), Image), 'rendering after close failed'
+
+
 class ReforgerTestMixin:
 
     def test_can_reforge(self):
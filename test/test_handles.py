@@ -0,0 +1,42 @@
+import gc
+import unittest
+
+from sparclur.utils._handles import DocumentHandle, _OPEN_HANDLES, get_max_open_handles, set_max_open_handles
+
+
+class DocumentHandleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.max_open = get_max_open_handles()
+        self.closed = []
+
+    def tearDown(self):
+        set_max_open_handles(self.max_open)
+
+    def _handle(self, name):
+        return DocumentHandle(lambda: name, self.closed.append)
+
+    def test_eviction_skips_checked_out(self):
+        set_max_open_handles(1)
+        first, second = self._handle('first'), self._handle('second')
+        with first.use() as doc:
+            assert doc == 'first'
+            second.get()
+            assert first.is_open and self.closed == [], 'checked out handle was evicted'
+        assert not first.in_use
+        third = self._handle('third')
+        third.get()
+        assert not first.is_open and not second.is_open, 'idle handles not evicted'
+        assert sorted(self.closed) == ['first', 'second']
+        third.close()
+
+    def test_collected_handles_forgotten(self):
+        set_max_open_handles(None)
+        before = len(_OPEN_HANDLES)
+        handles = [self._handle(i) for i in range(5)]
+        for handle in handles:
+            handle.get()
+        assert len(_OPEN_HANDLES) == before + 5
+        del handles, handle
+        gc.collect()
+        assert len(_OPEN_HANDLES) == before, 'collected handles still registered'
@@ -1,12 +1,12 @@
 import unittest
 
 from parser_tests import ParserTestMixin, TracerTestMixin, RendererTestMixin, TextExtractorTestMixin, TEST_PDF, \
-    ReforgerTestMixin
+    ReforgerTestMixin, DocumentHandleTestMixin
 from sparclur.parsers import MuPDF
 
 
 class MuPDFTestCase(unittest.TestCase, ParserTestMixin, TracerTestMixin, RendererTestMixin, TextExtractorTestMixin,
-                    ReforgerTestMixin):
+                    ReforgerTestMixin, DocumentHandleTestMixin):
 
     def setUp(self):
         self.parser = MuPDF
@@ -1,9 +1,9 @@
 import unittest
 from sparclur.parsers import PDFium
-from parser_tests import ParserTestMixin, RendererTestMixin, TEST_PDF
+from parser_tests import ParserTestMixin, RendererTestMixin, DocumentHandleTestMixin, TEST_PDF
 
 
-class PDFiumTestCase(unittest.TestCase, ParserTestMixin, RendererTestMixin):
+class PDFiumTestCase(unittest.TestCase, ParserTestMixin, RendererTestMixin, DocumentHandleTestMixin):
 
     def setUp(self):
         self.parser = PDFium
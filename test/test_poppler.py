@@ -2,11 +2,13 @@ import unittest
 
 from sparclur.parsers import Poppler
 from test.parser_tests import ParserTestMixin, TracerTestMixin, RendererTestMixin, TextExtractorTestMixin, \
-    FontExtractorTestMixin, ImageDataExtractorTestMixin, ReforgerTestMixin, TEST_PDF
+    FontExtractorTestMixin, ImageDataExtractorTestMixin, ReforgerTestMixin, FastTraceTestMixin, \
+    StreamedMessagesTestMixin, TEST_PDF
 
 
 class PopplerTestCase(unittest.TestCase, ParserTestMixin, TracerTestMixin, RendererTestMixin, TextExtractorTestMixin,
-                      FontExtractorTestMixin, ImageDataExtractorTestMixin, ReforgerTestMixin):
+                      FontExtractorTestMixin, ImageDataExtractorTestMixin, ReforgerTestMixin, FastTraceTestMixin,
+                      StreamedMessagesTestMixin):
 
     def setUp(self):
         self.parser = Poppler
@@ -0,0 +1,77 @@
+import pickle
+import unittest
+
+from PIL import Image
+
+from sparclur._render_cache import RenderCache
+from sparclur.utils import RenderFeatures
+
+
+def _page(shade):
+    return Image.new('RGB', (10, 10), (shade, shade, shade))
+
+
+class RenderCacheTestCase(unittest.TestCase):
+
+    def test_unbounded(self):
+        cache = RenderCache()
+        for page in range(5):
+            cache[page] = _page(page)
+        assert len(cache) == 5
+        assert cache.stats['evictions'] == 0
+
+    def test_spill_and_reload(self):
+        cache = RenderCache(budget=300 * 2)
+        for page in range(5):
+            cache[page] = _page(page)
+        assert cache.nbytes <= 600
+        assert cache.stats['spills'] == 3
+        assert len(cache) == 5
+        assert cache[0].getpixel((0, 0)) == (0, 0, 0), 'reloaded page differs'
+        assert cache.stats['reloads'] == 1
+
+    def test_drop(self):
+        cache = RenderCache(budget=300, spill=False)
+        for page in range(3):
+            cache[page] = _page(page)
+        assert len(cache) == 1
+        assert cache.dropped == {0, 1}
+        assert cache.get(0) is None
+        assert cache.stats['misses'] == 1
+
+    def test_pickle(self):
+        cache = RenderCache(budget=300)
+        for page in range(3):
+            cache[page] = _page(page)
+        restored = pickle.loads(pickle.dumps(cache))
+        assert sorted(restored.keys()) == [0, 1, 2]
+        assert restored[1].getpixel((0, 0)) == (1, 1, 1)
+
+    def test_features(self):
+        cache = RenderCache(budget=1000)
+        for page in range(2):
+            cache[page] = _page(page)
+            features = RenderFeatures(cache[page])
+            _ = features.gray
+            cache.set_features(page, features)
+        assert cache.get_features(1).pil is cache[1]
+        assert cache.stats['spills'] == 1, 'features not counted against the budget'
+        assert cache.get_features(0) is None, 'features not evicted with their page'
+        assert cache.nbytes == 300 + 300 + 100
+        cache.set_features(3, RenderFeatures(_page(3)))
+        assert cache.get_features(3) is None, 'features kept for a page that is not cached'
+
+    def test_grown_features(self):
+        cache = RenderCache(budget=650)
+        cache[0], cache[1] = _page(0), _page(1)
+        features = RenderFeatures(cache[1])
+        cache.set_features(1, features)
+        _ = features.gray
+        assert cache.stats['spills'] == 0
+        cache.trim()
+        assert cache.stats['spills'] == 1, 'features grown after being kept not re-measured'
+        assert cache.nbytes == 300 + 300 + 100
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from sparclur._parser import SparclurHash, RENDER
+from sparclur._render_index import RenderIndex
+
+
+def _sparse_hash(rng, density=0.005):
+    return rng.random((128, 128)) < density
+
+
+def _sparclur_hash(doc, renders):
+    sparclur_hash = SparclurHash(doc)
+    sparclur_hash._add_hash(RENDER, renders)
+    return sparclur_hash
+
+
+class RenderIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'index.db')
+        self.index = RenderIndex(self.path)
+        rng = np.random.default_rng(0)
+        self.pages = [_sparse_hash(rng) for _ in range(3)]
+        self.original = _sparclur_hash(b'original', dict(enumerate(self.pages)))
+        # The same pages with an edit on page 1
+        altered = [page.copy() for page in self.pages]
+        altered[1][40:50, 40:50] = rng.random((10, 10)) < 0.3
+        self.altered = _sparclur_hash(b'altered', dict(enumerate(altered)))
+        self.others = [_sparclur_hash(b'other %i' % i, {0: _sparse_hash(rng), 1: np.zeros((128, 128), dtype=bool)})
+                       for i in range(20)]
+        for sparclur_hash in [self.original] + self.others:
+            self.index.insert(sparclur_hash)
+
+    def tearDown(self):
+        self.index.close()
+        self.temp_dir.cleanup()
+
+    def test_insert(self):
+        assert len(self.index) == 21
+        assert self.original.file_hash in self.index
+        self.index.insert(self.original)
+        assert len(self.index) == 21, 'reinserting a document duplicated it'
+
+    def test_query_page(self):
+        matches = self.index.query_page(self.original[RENDER][2])
+        assert matches[0] == (self.original.file_hash, 2, 1.0), 'identical page not found'
+        assert all(doc == self.original.file_hash or page == 1 for (doc, page, _) in matches), 'unrelated page matched'
+
+    def test_query_document(self):
+        results = self.index.query_document(self.altered)
+        assert self.original.file_hash in results, 'altered document not found'
+        found = results[self.original.file_hash]
+        assert found[0] == (0, 1.0) and found[2] == (2, 1.0)
+        assert 0.5 <= found[1][1] < 1.0 and found[1][0] == 1
+        assert all(0 not in pages for (doc, pages) in results.items() if doc != self.original.file_hash)
+        assert self.original.file_hash not in self.index.query_document(self.original), 'document matched itself'
+
+    def test_blank_pages(self):
+        blank = np.zeros((128, 128), dtype=bool)
+        assert self.index.query_page(blank) == [], 'blank page matched'
+        rng = np.random.default_rng(3)
+        query = _sparclur_hash(b'query', {0: blank, 1: _sparse_hash(rng)})
+        assert self.index.query_document(query) == dict(), 'blank page made documents candidates'
+
+    def test_remove(self):
+        self.index.remove(self.original.file_hash)
+        assert self.original.file_hash not in self.index
+        assert self.original.file_hash not in self.index.query_document(self.altered)
+
+    def test_persistence(self):
+        restored = pickle.loads(pickle.dumps(self.index))
+        assert len(restored) == 21
+        assert restored.query_page(self.original[RENDER][0])[0] == (self.original.file_hash, 0, 1.0)
+        restored.close()
+        reopened = RenderIndex(self.path, bands=4, rows=2)
+        assert (reopened.bands, reopened.rows) == (self.index.bands, self.index.rows), 'index settings not kept'
+        reopened.close()
@@ -0,0 +1,61 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from sparclur._render_store import RenderStore
+
+
+class RenderStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = RenderStore(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_key(self):
+        key = RenderStore.key('abc', 'MuPDF', 200, 0)
+        assert key == RenderStore.key('abc', 'MuPDF', 200, 0)
+        assert key != RenderStore.key('abc', 'MuPDF', 72, 0)
+        assert key != RenderStore.key('abc', 'MuPDF', 200, 0, size=100)
+
+    def test_round_trip(self):
+        key = RenderStore.key('abc', 'MuPDF', 200, 0)
+        pil = Image.new('RGB', (20, 10), (10, 20, 30))
+        self.store.put(key, pil, {'result': 'Successfully Rendered', 'timing': 1.0})
+        assert key in self.store
+        stored, log = self.store.get(key)
+        assert stored.size == (20, 10) and stored.getpixel((0, 0)) == (10, 20, 30)
+        assert log['result'] == 'Successfully Rendered'
+        assert self.store.get(RenderStore.key('abc', 'MuPDF', 200, 1)) is None
+
+    def test_eviction(self):
+        for page in range(4):
+            self.store.put(RenderStore.key('abc', 'MuPDF', 200, page), Image.new('L', (100, 100)))
+        self.store.max_bytes = 2 * 100 * 100 + 512
+        assert len(self.store) == 2
+
+    def test_index(self):
+        self.store.max_bytes = 3 * 100 * 100 + 512
+        with mock.patch.object(self.store, '_entries', side_effect=AssertionError('store rescanned')):
+            for page in range(5):
+                self.store.put(RenderStore.key('abc', 'MuPDF', 200, page), Image.new('L', (100, 100)))
+            assert len(self.store) == 3
+            assert RenderStore.key('abc', 'MuPDF', 200, 0) not in self.store
+        assert self.store.nbytes == sum(size for (_, size, _) in self.store._entries())
+
+    def test_shared(self):
+        other = RenderStore(self.temp_dir.name, max_bytes=2 * 100 * 100 + 512)
+        for page in range(2):
+            self.store.put(RenderStore.key('abc', 'MuPDF', 200, page), Image.new('L', (100, 100)))
+        assert len(other) == 2, 'entries written by another store not seen'
+        self.store.clear()
+        other.put(RenderStore.key('abc', 'MuPDF', 200, 2), Image.new('L', (100, 100)))
+        assert len(other) == 1 and len(self.store) == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from sparclur._page_geometry import PageGeometry
+from sparclur._renderer import _plan_page_runs, _hash_render_dpi, _output_page_parser, _align_renders, \
+    _RUN_OVERHEAD_PAGES
+from sparclur.parsers import PDFium
+from test.parser_tests import TEST_PDF
+
+
+class PlanPageRunsTestCase(unittest.TestCase):
+
+    def test_contiguous(self):
+        assert _plan_page_runs([0, 1, 2, 3]) == [[0, 1, 2, 3]]
+
+    def test_sparse(self):
+        assert _plan_page_runs([0, 10, 20], overhead=2) == [[0], [10], [20]]
+        assert _plan_page_runs([0, 1, 9, 10], overhead=2) == [[0, 1], [9, 10]]
+
+    def test_duplicates(self):
+        assert _plan_page_runs([2, 2, 3, 3, 3], overhead=0) == [[2, 3]]
+
+    def test_unsorted(self):
+        assert _plan_page_runs([5, 3, 1], overhead=1) == [[1, 3, 5]]
+        assert _plan_page_runs([20, 0, 21, 1], overhead=2) == [[0, 1], [20, 21]]
+
+    def test_overhead_cutoff(self):
+        overhead = _RUN_OVERHEAD_PAGES
+        # A gap of exactly the overhead is cheaper to render through than to start another run
+        assert _plan_page_runs([0, overhead + 1]) == [[0, overhead + 1]]
+        assert _plan_page_runs([0, overhead + 2]) == [[0], [overhead + 2]]
+        assert _plan_page_runs([0, 1, 3], overhead=0) == [[0, 1], [3]]
+        assert _plan_page_runs([0, 3], overhead=2) == [[0, 3]]
+        assert _plan_page_runs([0, 4], overhead=2) == [[0], [4]]
+
+    def test_empty(self):
+        assert _plan_page_runs([]) == []
+
+
+class HashRenderDpiTestCase(unittest.TestCase):
+
+    def test_page_geometry(self):
+        letter = PageGeometry((0, 0, 612, 792), (0, 0, 612, 792), 0)
+        a4 = PageGeometry((0, 0, 595, 842), (0, 0, 595, 842), 0)
+        landscape = PageGeometry((0, 0, 1224, 792), (0, 0, 1224, 792), 90)
+        assert _hash_render_dpi(258, letter) == _hash_render_dpi(258) == 24
+        for geometry in (letter, a4, landscape):
+            long_edge = max(geometry.size) * _hash_render_dpi(258, geometry) / 72
+            assert 258 <= long_edge < 258 + max(geometry.size) / 72, 'hash render not sized from the page'
+
+
+class StreamGapPagesTestCase(unittest.TestCase):
+
+    def test_gap_pages(self):
+        # Writes the first page and a gap page of the run 0-3, then hangs on the second gap page
+        script = ("import sys, time\n"
+                  "from PIL import Image\n"
+                  "for page in (1, 2):\n"
+                  "    Image.new('L', (4, 4)).save(sys.argv[1] + '-%i.png' % page)\n"
+                  "time.sleep(60)\n")
+        renderer = PDFium(TEST_PDF)
+        renderer.page_timeout = 1
+        with tempfile.TemporaryDirectory() as out_dir:
+            cmd = [sys.executable, '-c', script, os.path.join(out_dir, 'out')]
+            stream = renderer._stream_subprocess(cmd, out_dir, _output_page_parser('out-', '.png'), pages=[0, 3])
+            streamed = []
+            try:
+                while True:
+                    streamed.append(next(stream)[0])
+            except StopIteration as stop:
+                stuck = stop.value
+            assert os.listdir(out_dir) == [], 'gap page output kept'
+        assert streamed == [0], 'gap page handed over'
+        assert sorted(renderer.logs.keys()) == [0, 3], 'gap page logged'
+        assert renderer.logs[3]['result'] == 'Timed out', 'timeout not attributed to the next requested page'
+        assert stuck == 2
+
+
+class AlignRendersTestCase(unittest.TestCase):
+
+    def test_order_independent(self):
+        renderer = PDFium(TEST_PDF)
+        page = renderer.get_renders(page=0)
+        short = page.crop((0, 0, page.width - 1, page.height))
+        left, right = _align_renders(0, renderer, short, renderer, page)
+        swapped_right, swapped_left = _align_renders(0, renderer, page, renderer, short)
+        expected = renderer.page_geometry[0].pixel_size(renderer.dpi)
+        assert left.size == right.size == expected, 'renders not drawn at the page geometry size'
+        assert (left.size, right.size) == (swapped_left.size, swapped_right.size), 'alignment depends on the order'
+        far = page.crop((0, 0, page.width - 10, page.height))
+        assert _align_renders(0, renderer, far, renderer, page) == (far, page), 'unrelated sizes aligned'
@@ -0,0 +1,357 @@
+import pickle
+import unittest
+from unittest import mock
+from math import log, e
+
+import numpy as np
+from PIL import Image
+from imagehash import ImageHash
+
+from sparclur.utils import entropy, entropy_sim, pil_to_hex_array, image_compare, batch_image_compare, RenderFeatures
+from skimage.metrics import structural_similarity
+
+from sparclur.utils._tools import sum_square_sim, ccorr_sim, ccoeff_sim, _template_scores, _tiled_ssim, \
+    _changed_regions, _tile_hashes, _compare_features, _stacked_template_scores
+from sparclur.utils import comparison_stats, reset_comparison_stats
+from sparclur._renderer import _timed_batch_compare, _timed_compare
+from sparclur.utils import image_highlight
+from sparclur._parser import _compare_render_hash, _pack_render_hash, _popcount, _POPCOUNT_TABLE, SparclurHash, \
+    RENDER, TRACER, TEXT, META, FONT, RENDER_HASH_VERSION
+
+
+def _reference_entropy(a):
+    if isinstance(a, Image.Image):
+        a = pil_to_hex_array(a)
+    n = a.size
+    if n <= 1:
+        return 0
+    _, counts = np.unique(a, return_counts=True)
+    probs = counts / n
+    if np.count_nonzero(probs) <= 1:
+        return 0
+    ent = 0.
+    for p in probs:
+        ent -= p * log(p, e)
+    return ent
+
+
+class EntropyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.rgb = Image.fromarray((rng.integers(0, 32, size=(60, 40, 3)) * 8).astype('uint8'))
+        self.gray = self.rgb.convert('L')
+
+    def test_matches_reference(self):
+        for sample in [self.rgb, self.gray, np.asarray(self.rgb), pil_to_hex_array(self.rgb),
+                       np.arange(-5, 5), np.linspace(0, 1, 7)]:
+            assert abs(entropy(sample) - _reference_entropy(sample)) < 1e-9, 'entropy differs from reference'
+
+    def test_degenerate(self):
+        assert entropy(Image.new('RGB', (10, 10), 'white')) == 0
+        assert entropy(np.array([3])) == 0
+        assert entropy_sim(Image.new('L', (5, 5), 0), Image.new('L', (5, 5), 255)) == 1.0
+
+    def test_gray_matches_rgb_of_gray(self):
+        assert abs(entropy(self.gray) - entropy(self.gray.convert('RGB'))) < 1e-9, 'gray entropy differs'
+
+
+class RenderFeaturesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.left = Image.fromarray((rng.integers(0, 4, size=(64, 48, 3)) * 80).astype('uint8'))
+        self.right = Image.fromarray((rng.integers(0, 4, size=(64, 48, 3)) * 80).astype('uint8'))
+
+    def test_same_as_images(self):
+        left_features = RenderFeatures(self.left)
+        expected = image_compare(self.left, self.right, True).all_metrics
+        assert image_compare(left_features, RenderFeatures(self.right), True).all_metrics == expected
+        assert image_compare(left_features, self.right, True).all_metrics == expected, 'reused features differ'
+
+    def test_lazy_and_cached(self):
+        features = RenderFeatures(self.left)
+        assert len(features._hashes) == 0 and features._entropy is None, 'features computed eagerly'
+        assert features.whash() is features.whash(), 'hash recomputed'
+        assert features.size == (48, 64)
+        assert features.gray.shape == (64, 48)
+
+
+class TemplateScoresTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        page = np.full((400, 300, 3), 255, dtype='uint8')
+        for _ in range(60):
+            y, x = rng.integers(0, 380), rng.integers(0, 260)
+            page[y:y + rng.integers(2, 20), x:x + rng.integers(5, 40)] = rng.integers(0, 200, size=3)
+        self.page = page
+        self.other = np.clip(page.astype(int) + rng.integers(-20, 20, size=page.shape), 0, 255).astype('uint8')
+
+    def _assert_matches_cv2(self, left, right, tolerance=1e-4):
+        expected = [sum_square_sim(left, right), ccorr_sim(left, right), ccoeff_sim(left, right)]
+        scores, top_lefts = _template_scores(left, right)
+        for (score, loc), new_score in zip(expected, scores):
+            assert abs(score - new_score) < tolerance, 'score differs from cv2.matchTemplate'
+        return top_lefts, tuple(loc for (_, loc) in expected)
+
+    def test_same_size(self):
+        self._assert_matches_cv2(self.page, self.other)
+        self._assert_matches_cv2(self.page[:, :, 0], self.other[:, :, 0])
+        self._assert_matches_cv2(np.zeros((20, 10), dtype='uint8'), np.full((20, 10), 255, dtype='uint8'))
+
+    def test_pyramid_offset(self):
+        top_lefts, expected_locs = self._assert_matches_cv2(self.page, self.other[23:-11, 17:-6])
+        assert top_lefts == expected_locs == ((17, 23),) * 3, 'offset not found'
+        self._assert_matches_cv2(self.page[:, :-30], self.other[:-30, :])
+
+    def test_dissimilar(self):
+        rng = np.random.default_rng(7)
+        noise = rng.integers(0, 256, size=self.page.shape, dtype=np.uint8)
+        self._assert_matches_cv2(self.page, noise)
+        self._assert_matches_cv2(self.page, np.flipud(self.other))
+        # Small enough to be searched exhaustively, where each score peaks at its own offset
+        top_lefts, expected_locs = self._assert_matches_cv2(self.page[:120, :100], noise[:100, :90])
+        assert top_lefts == expected_locs, 'scores not taken at their own peaks'
+        assert len(set(top_lefts)) > 1
+
+    def test_different_sizes(self):
+        self._assert_matches_cv2(self.page, self.other[:-3, :-2])
+        self._assert_matches_cv2(self.page[:-40, :], self.other[:, :-25])
+        self._assert_matches_cv2(self.page[:, :, 0], np.flipud(self.other[5:-5, 4:-4, 0]))
+        self._assert_matches_cv2(np.full((30, 30), 255, dtype='uint8'), self.page[:20, :25, 1])
+
+
+class LazyCompareTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.left = Image.fromarray((rng.integers(0, 4, size=(64, 48, 3)) * 80).astype('uint8'))
+        self.right = Image.fromarray((rng.integers(0, 4, size=(60, 50, 3)) * 80).astype('uint8'))
+
+    def test_same_as_eager(self):
+        eager = image_compare(self.left, self.right)
+        lazy = image_compare(self.left, self.right, lazy=True)
+        assert lazy.all_metrics == eager.all_metrics, 'lazy metrics differ'
+        assert lazy.result == eager.result
+
+    def test_only_requested(self):
+        left, right = RenderFeatures(self.left), RenderFeatures(self.right)
+        sim = image_compare(left, right, lazy=True)
+        assert sim.get_metrics(['size_sim']) == {'size_sim': image_compare(self.left, self.right).size_sim}
+        assert len(left._hashes) == 0 and left._entropy is None, 'unrequested metrics computed'
+        sim.phash_sim
+        assert list(left._hashes.keys()) == [('phash', 128)]
+
+    def test_pickle(self):
+        lazy = image_compare(self.left, self.right, lazy=True)
+        lazy.all_metrics
+        assert pickle.loads(pickle.dumps(lazy)).all_metrics == image_compare(self.left, self.right).all_metrics
+
+    def test_pickle_computed_only(self):
+        left, right = RenderFeatures(self.left), RenderFeatures(self.right)
+        lazy = image_compare(left, right, lazy=True)
+        lazy.get_metrics(['whash_sim'])
+        loaded = pickle.loads(pickle.dumps(lazy))
+        assert list(left._hashes.keys()) == [('whash', 128)] and left._entropy is None, 'unrequested metrics computed'
+        assert loaded.whash_sim == image_compare(self.left, self.right).whash_sim
+        assert 'phash_sim' in loaded.unavailable_metrics and 'whash_sim' not in loaded.unavailable_metrics
+        with self.assertRaises(ValueError):
+            loaded.phash_sim
+
+    def test_release(self):
+        left, right = RenderFeatures(self.left), RenderFeatures(self.right)
+        sim = _timed_compare(left, right, False, None, metrics=['size_sim'])
+        assert sim.size_sim == image_compare(self.left, self.right).size_sim
+        assert not any(callable(value) for value in sim._scores.values()), 'closures over the renders kept'
+        assert sorted(sim.unavailable_metrics) == sorted(['entropy_sim', 'whash_sim', 'phash_sim', 'sum_square_sim',
+                                                          'ccorr_sim', 'ccoeff_sim'])
+        assert sim.result == image_compare(self.left, self.right).result
+
+
+class BatchCompareTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        self.pages = [Image.fromarray((rng.integers(0, 4, size=(64, 48, 3)) * 80).astype('uint8')) for _ in range(4)]
+
+    def test_same_as_pairwise(self):
+        pairs = {0: (self.pages[0], self.pages[1]),
+                 1: (self.pages[2], self.pages[2]),
+                 2: (self.pages[3], self.pages[0].convert('L')),
+                 3: (self.pages[1], self.pages[2].crop((0, 0, 40, 60))),
+                 4: (self.pages[0], Image.new('RGB', (48, 64), 'black')),
+                 5: (self.pages[0], None)}
+        batched = batch_image_compare(pairs)
+        assert list(batched.keys()) == list(pairs.keys())
+        for (key, (left, right)) in pairs.items():
+            expected = image_compare(left, right)
+            assert batched[key].result == expected.result
+            for (metric, value) in expected.all_metrics.items():
+                assert abs(batched[key].all_metrics[metric] - value) < 1e-9, 'batched %s differs' % metric
+
+    def test_stacked_template_scores(self):
+        pairs = [(np.array(left), np.array(right)) for (left, right) in zip(self.pages, self.pages[1:])]
+        expected = [_template_scores(left, right)[0] for (left, right) in pairs]
+        with mock.patch('sparclur.utils._tools._BATCH_STACK_BYTES', pairs[0][0].size * 8 * 2):
+            stacked = _stacked_template_scores(pairs)
+        assert np.allclose(stacked, expected, rtol=0, atol=1e-9), 'stacked scores differ'
+
+    def test_timeout_keeps_finished(self):
+        rng = np.random.default_rng(6)
+        slow = [Image.fromarray(rng.integers(0, 256, size=(3000, 3000, 3), dtype=np.uint8)) for _ in range(2)]
+        results = _timed_batch_compare({0: (self.pages[0], self.pages[0].copy()), 1: tuple(slow)}, 0.01)
+        assert results[0].sim == 1.0, 'finished pair lost on timeout'
+        assert results[1].result == 'Comparison Timed Out'
+
+    def test_features_cached(self):
+        features = RenderFeatures(self.pages[0])
+        batch_image_compare({0: (features, self.pages[1]), 1: (features, self.pages[2])})
+        assert ('whash', 128) in features._hashes and features._entropy is not None, 'features not cached'
+
+
+class TiledSSIMTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.left = np.full((90, 70), 255, dtype='uint8')
+        self.left[20:40, 10:60] = rng.integers(0, 255, size=(20, 50))
+        self.right = self.left.copy()
+        self.right[25:30, 15:50] = 0
+
+    def test_matches_full_page(self):
+        expected, expected_map = structural_similarity(self.left, self.right, full=True)
+        for tile in [512, 32, 9]:
+            ssim, diff = _tiled_ssim(self.left, self.right, tile)
+            assert abs(ssim - expected) < 1e-9, 'tiled ssim differs'
+            assert diff.dtype == np.uint8 and diff.shape == self.left.shape
+            assert np.abs(diff.astype(int) - np.uint8(expected_map * 255)).max() <= 1, 'tiled diff differs'
+
+    def test_diff_threshold(self):
+        left, right = Image.fromarray(self.left), Image.fromarray(self.right)
+        full = image_compare(left, right, True)
+        assert full.diff.mode == 'L', 'diff is not a single channel image'
+        assert image_compare(left, right, True, diff_threshold=full.sim - 0.01).diff is None, 'diff not skipped'
+        gated = image_compare(left, right, True, diff_threshold=full.sim)
+        assert np.array_equal(np.asarray(gated.diff), np.asarray(full.diff)), 'diff not generated'
+
+
+class TileLocalizeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(6)
+        self.orig = (rng.integers(0, 4, size=(100, 70, 3)) * 80).astype('uint8')
+        self.mod = self.orig.copy()
+        self.mod[40:45, 50:60] = [0, 0, 255]
+
+    def test_tile_hashes(self):
+        hashes = _tile_hashes(self.orig, 16)
+        assert hashes.shape == (7, 5), 'partial tiles not hashed'
+        assert _tile_hashes(self.orig[16:48, 32:64], 16)[1, 0] == hashes[2, 2], 'equal tiles hash differently'
+        assert np.count_nonzero(hashes != _tile_hashes(self.mod, 16)) == 1, 'changed tile not detected'
+
+    def test_changed_regions(self):
+        assert _changed_regions(self.orig, self.mod, tile=16) == [(48, 32, 16, 16)]
+        assert _changed_regions(self.orig, self.mod, min_region=300, tile=16) == []
+        assert _changed_regions(self.orig, self.orig) == []
+        assert _changed_regions(self.orig, self.mod[:90]) is None, 'sizes differ'
+
+    def test_highlight(self):
+        orig = self.orig.copy()
+        pil1, pil2 = image_highlight(Image.fromarray(self.orig), Image.fromarray(self.mod), min_region=0,
+                                     display=False, localizer='tiles')
+        assert not np.array_equal(np.asarray(pil1), orig), 'region not highlighted'
+
+
+class RenderHashTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.left = {page: ImageHash(rng.random((128, 128)) > 0.5) for page in range(3)}
+        self.right = {page: ImageHash(rng.random((128, 128)) > 0.5) for page in range(2)}
+
+    def test_packed_compare(self):
+        compare = _compare_render_hash(self.left, self.right)
+        packed = _compare_render_hash({page: _pack_render_hash(h) for (page, h) in self.left.items()},
+                                      {page: _pack_render_hash(h) for (page, h) in self.right.items()})
+        self.assertEqual(compare, packed)
+        for page in range(2):
+            self.assertEqual(compare[page], 1.0 - (self.left[page] - self.right[page]) / (128 * 128))
+        self.assertEqual(compare[2], 0.0)
+
+    def test_popcount_table(self):
+        words = np.stack([_pack_render_hash(h) for h in self.left.values()])
+        by_table = _POPCOUNT_TABLE[words.view(np.uint8)].sum(axis=1)
+        self.assertTrue(np.array_equal(_popcount(words), by_table))
+        self.assertTrue(np.array_equal(by_table, [np.count_nonzero(h.hash) for h in self.left.values()]))
+
+    def test_versions(self):
+        left, right = SparclurHash(b'left'), SparclurHash(b'right')
+        left._add_hash(RENDER, self.left)
+        right._add_hash(RENDER, self.right)
+        self.assertEqual(SparclurHash.from_bytes(left.to_bytes()).render_hash_version, RENDER_HASH_VERSION)
+        right._render_version = RENDER_HASH_VERSION - 1
+        with self.assertRaises(ValueError):
+            left.compare(right)
+        with self.assertRaises(ValueError):
+            SparclurHash.compare_many([left, right])
+
+
+class CompareManyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        base = rng.random((3, 128, 128)) > 0.5
+        self.hashes = []
+        for i in range(6):
+            h = SparclurHash(b'%i' % i)
+            if i != 1:
+                flips = rng.random(base.shape) > 0.99
+                h._add_hash(RENDER, {page: ImageHash(base[page] ^ flips[page]) for page in range(3 - i % 2)})
+            if i % 3 != 0:
+                h._add_hash(TRACER, set(rng.integers(0, 8, size=i).tolist()))
+            h._add_hash(TEXT, {page: set(rng.integers(0, 20, size=10).tolist()) for page in range(1 + i % 3)})
+            h._add_hash(META, {'Root': int(rng.integers(0, 2)), 'Info': 7, 'Page %i' % i: 3})
+            if i > 2:
+                h._add_hash(FONT, {'F%i' % j: int(rng.integers(0, 2)) for j in range(i)})
+            self.hashes.append(h)
+
+    def test_matches_compare(self):
+        matrices = SparclurHash.compare_many(self.hashes)
+        for i, left in enumerate(self.hashes):
+            for j, right in enumerate(self.hashes):
+                compare = left.compare(right)
+                self.assertAlmostEqual(matrices['sim'][i, j], compare['sim'], places=12)
+                self.assertAlmostEqual(matrices['dist'][i, j], compare['dist'], places=12)
+                for key in [RENDER, TRACER, TEXT, META, FONT]:
+                    if key + ' sim' in compare:
+                        self.assertAlmostEqual(matrices[key + ' sim'][i, j], compare[key + ' sim'], places=12)
+                    else:
+                        self.assertTrue(np.isnan(matrices[key + ' sim'][i, j]))
+
+
+class IdenticalCompareTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.array = (rng.random((90, 70, 3)) * 255).astype(np.uint8)
+        self.other = self.array.copy()
+        self.other[10:20, 10:20] = 0
+        reset_comparison_stats()
+
+    def test_shortcut(self):
+        shortcut = image_compare(Image.fromarray(self.array), Image.fromarray(self.array.copy()), full=True)
+        computed = _compare_features(RenderFeatures(self.array), RenderFeatures(self.array.copy()), full=True)
+        self.assertEqual(shortcut.all_metrics, {key: float(val) for (key, val) in computed.all_metrics.items()})
+        self.assertEqual(shortcut.result, computed.result)
+        self.assertTrue(np.array_equal(np.asarray(shortcut.diff), np.asarray(computed.diff)))
+        self.assertIsNone(image_compare(self.array, self.array.copy(), full=True, diff_threshold=0.9).diff)
+        self.assertLess(image_compare(self.array, self.other).sim, 1.0)
+        self.assertEqual(comparison_stats(), {'comparisons': 3, 'identical': 2})
+
+    def test_batch_shortcut(self):
+        features = RenderFeatures(self.array)
+        results = batch_image_compare({0: (features, features), 1: (self.array, self.other), 2: (self.array, None)})
+        self.assertEqual(results[0].sim, 1.0)
+        self.assertLess(results[1].sim, 1.0)
+        self.assertEqual(comparison_stats(), {'comparisons': 2, 'identical': 1})
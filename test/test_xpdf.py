@@ -2,11 +2,11 @@ import unittest
 
 from sparclur.parsers import XPDF
 from test.parser_tests import ParserTestMixin, TracerTestMixin, RendererTestMixin, TextExtractorTestMixin, \
-    FontExtractorTestMixin, TEST_PDF
+    FontExtractorTestMixin, FastTraceTestMixin, StreamedMessagesTestMixin, TEST_PDF
 
 
 class XPDFTestCase(unittest.TestCase, ParserTestMixin, TracerTestMixin, RendererTestMixin, TextExtractorTestMixin,
-                   FontExtractorTestMixin):
+                   FontExtractorTestMixin, FastTraceTestMixin, StreamedMessagesTestMixin):
 
     def setUp(self):
         self.parser = XPDF